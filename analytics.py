@@ -0,0 +1,508 @@
+"""
+Snapshot Kolumnar untuk Analitik Dashboard & Laporan
+Agregasi berat (tren bulanan, distribusi anomali, belanja per provider per
+diagnosis per bulan) tidak lagi dijalankan pada tabel OLTP. Secara berkala
+klaim & fraud_alert ditulis ulang sebagai satu file biner per kolom (int64 /
+float64 / kode dictionary int32) yang di-mmap saat dibaca. Query group-by/
+filter berjalan tervektorisasi dengan NumPy bila terpasang, atau loop
+Python atas memoryview bila tidak; keduanya di luar jalur tulis SQLite.
+Build manual with: python analytics.py --build
+"""
+
+import array
+import json
+import mmap
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import argparse
+import operator
+from collections import Counter
+from itertools import compress, repeat
+
+try:
+    import fcntl
+except ImportError:  # Windows: build hanya diserialkan di dalam satu proses
+    fcntl = None
+
+import database
+
+# Cek ketersediaan NumPy (Opsional, fallback ke modul array stdlib)
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+REFRESH_INTERVAL_SECONDS = int(os.environ.get('SATRIA_ANALYTICS_REFRESH_SECONDS', 300))
+BUILD_CHUNK_ROWS = 50000
+NULL_INT = -1
+
+# Jenis kolom -> typecode modul array (ukuran tetap, native endian)
+INT, FLOAT, DICT = 'q', 'd', 'i'
+NP_DTYPES = {INT: 'int64', FLOAT: 'float64', DICT: 'int32'}
+COMPARE_OPS = {'=': operator.eq, '!=': operator.ne, '>': operator.gt,
+               '>=': operator.ge, '<': operator.lt, '<=': operator.le}
+
+# (nama kolom, ekspresi SQL, jenis). Kolom DICT disimpan sebagai kode + daftar nilai.
+TABLE_SPECS = {
+    'klaim': ('''
+        SELECT {columns} FROM klaim ORDER BY klaim_id
+    ''', [
+        ('klaim_id', 'klaim_id', INT),
+        ('faskes_id', 'faskes_id', INT),
+        ('diagnosis_id', 'diagnosis_id', INT),
+        ('total_biaya', 'total_biaya', FLOAT),
+        ('status', 'status', DICT),
+        ('month', "CAST(strftime('%Y%m', tgl_pengajuan) AS INTEGER)", INT),
+        ('day', "CAST(strftime('%Y%m%d', tgl_pengajuan) AS INTEGER)", INT),
+    ]),
+    # Denormalisasi faskes_id & total_biaya klaim agar tidak perlu join saat query
+    'fraud_alert': ('''
+        SELECT {columns} FROM fraud_alert f LEFT JOIN klaim k ON k.klaim_id = f.klaim_id ORDER BY f.alert_id
+    ''', [
+        ('alert_id', 'f.alert_id', INT),
+        ('klaim_id', 'f.klaim_id', INT),
+        ('faskes_id', 'k.faskes_id', INT),
+        ('total_biaya', 'k.total_biaya', FLOAT),
+        ('alert_level', 'f.alert_level', DICT),
+        ('reason_code', 'f.reason_code', DICT),
+        ('status', 'f.status', DICT),
+        ('ai_confidence', 'f.ai_confidence', FLOAT),
+        ('day', "CAST(strftime('%Y%m%d', f.created_at) AS INTEGER)", INT),
+    ]),
+}
+
+def snapshot_root():
+    """Direktori snapshot, di samping file database aktif."""
+    base, _ = os.path.splitext(database.DATABASE_NAME)
+    return os.environ.get('SATRIA_ANALYTICS_DIR', f"{base}_columnar")
+
+# ============================================
+# BUILD SNAPSHOT
+# ============================================
+
+def _write_table(conns, directory, table):
+    """Tulis kolom `table` dari satu atau beberapa koneksi shard (berurutan) ke file yang sama."""
+    sql, spec = TABLE_SPECS[table]
+    files = [open(os.path.join(directory, f"{table}.{name}.bin"), 'wb') for name, _, _ in spec]
+    dictionaries = [{} if kind == DICT else None for _, _, kind in spec]
+    rows = 0
+    try:
+        for chunk in _chunks(conns, sql.format(columns=', '.join(expr for _, expr, _ in spec))):
+            rows += len(chunk)
+            for i, (_, _, kind) in enumerate(spec):
+                values = [row[i] for row in chunk]
+                if kind == DICT:
+                    codes = dictionaries[i]
+                    values = [codes.setdefault(v, len(codes)) for v in values]
+                elif kind == INT:
+                    values = [NULL_INT if v is None else int(v) for v in values]
+                else:
+                    values = [0.0 if v is None else float(v) for v in values]
+                array.array(kind, values).tofile(files[i])
+    finally:
+        for f in files:
+            f.close()
+
+    columns = {}
+    for (name, _, kind), codes in zip(spec, dictionaries):
+        columns[name] = {'type': kind}
+        if codes is not None:
+            columns[name]['values'] = list(codes)
+    return {'rows': rows, 'columns': columns}
+
+def _chunks(conns, sql):
+    for conn in conns:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(sql)
+        while True:
+            chunk = cursor.fetchmany(BUILD_CHUNK_ROWS)
+            if not chunk:
+                break
+            yield chunk
+
+_build_lock = threading.Lock()
+
+def _snapshot_time(name):
+    """Waktu build dari id snapshot ("<epoch>-<hex>"), None untuk entri lain."""
+    head = name.split('-', 1)[0]
+    return int(head) if head.isdigit() else None
+
+def build_snapshot(wait=True):
+    """
+    Tulis snapshot baru lalu tukar pointer CURRENT secara atomik. Dibaca
+    lewat koneksi read-only dalam satu transaksi baca (WAL), jadi konsisten
+    antar tabel dan tidak menahan writer. Dengan sharding, tiap shard
+    dibaca dalam transaksi bacanya sendiri dan hasilnya disambung.
+
+    Build diserialkan lintas proses (scheduler tiap worker + CLI) dengan
+    flock pada BUILD.lock, agar pembersihan satu build tidak menghapus
+    direktori build lain. wait=False: kembalikan None bila build lain
+    sedang berjalan.
+    """
+    root = snapshot_root()
+    os.makedirs(root, exist_ok=True)
+    if not _build_lock.acquire(blocking=wait):
+        return None
+    lock_file = open(os.path.join(root, 'BUILD.lock'), 'a')
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+            except BlockingIOError:
+                return None
+        return _build_locked(root)
+    finally:
+        lock_file.close()
+        _build_lock.release()
+
+def _build_locked(root):
+    snapshot_id = f"{int(time.time())}-{uuid.uuid4().hex[:6]}"
+    directory = os.path.join(root, snapshot_id)
+    os.makedirs(directory)
+
+    conns = [database.get_readonly_connection() if shard.path is None
+             else database.get_shard_connection(shard, readonly=True) for shard in database.shard_map.shards]
+    try:
+        for conn in conns:
+            conn.execute("BEGIN")
+        tables = {table: _write_table(conns, directory, table) for table in TABLE_SPECS}
+        for conn in conns:
+            conn.rollback()
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    finally:
+        for conn in conns:
+            conn.close()
+
+    manifest = {'id': snapshot_id, 'built_at': time.time(), 'byteorder': sys.byteorder, 'tables': tables}
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+
+    pointer = os.path.join(root, 'CURRENT')
+    previous = None
+    if os.path.exists(pointer):
+        with open(pointer) as f:
+            previous = f.read().strip()
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(snapshot_id)
+    os.replace(pointer + '.tmp', pointer)
+
+    # Hanya snapshot yang lebih tua dari CURRENT sebelumnya yang dihapus; snapshot
+    # sebelumnya dibiarkan untuk pembaca yang baru saja membuka pointer lama.
+    # Yang masih me-mmap snapshot terhapus tetap aman (POSIX).
+    cutoff = _snapshot_time(previous) if previous else None
+    if cutoff is not None:
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            built = _snapshot_time(name)
+            if built is not None and built < cutoff and name != previous and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+    return manifest
+
+# ============================================
+# BACA SNAPSHOT (mmap)
+# ============================================
+
+class ColumnTable:
+    """Satu tabel snapshot: kolom di-mmap + query group-by/filter."""
+
+    def __init__(self, name, directory, meta):
+        self.name = name
+        self.rows = meta['rows']
+        self.types = {col: info['type'] for col, info in meta['columns'].items()}
+        self.dictionaries = {col: info['values'] for col, info in meta['columns'].items() if 'values' in info}
+        self._maps = []
+        self.columns = {col: self._open(os.path.join(directory, f"{name}.{col}.bin"), kind)
+                        for col, kind in self.types.items()}
+
+    def _open(self, path, kind):
+        if self.rows == 0:
+            return np.zeros(0, dtype=NP_DTYPES[kind]) if NUMPY_AVAILABLE else array.array(kind)
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mm)
+        if NUMPY_AVAILABLE:
+            return np.frombuffer(mm, dtype=NP_DTYPES[kind])
+        return memoryview(mm).cast(kind)
+
+    def _codes(self, column, values):
+        lookup = {v: i for i, v in enumerate(self.dictionaries[column])}
+        return [lookup[v] for v in values if v in lookup]
+
+    def _conditions(self, where):
+        """Normalisasi filter [(kolom, op, nilai)]; nilai DICT diubah jadi kode."""
+        conditions = []
+        for column, op, value in where:
+            if column in self.dictionaries:
+                if op == 'in':
+                    conditions.append((column, 'in', self._codes(column, value)))
+                elif op == '=':
+                    conditions.append((column, 'in', self._codes(column, [value])))
+                elif op == '!=':
+                    # Semantik SQL: NULL != x bukan true
+                    conditions.append((column, 'not in', self._codes(column, [value, None])))
+                else:
+                    raise ValueError(f"Operator {op} tidak didukung untuk kolom {column}")
+            else:
+                conditions.append((column, op, value))
+        return conditions
+
+    # -- NumPy (vektor) --
+
+    def _np_mask(self, conditions):
+        mask = np.ones(self.rows, dtype=bool)
+        for column, op, value in conditions:
+            data = self.columns[column]
+            if op == 'in':
+                mask &= np.isin(data, value)
+            elif op == 'not in':
+                mask &= ~np.isin(data, value)
+            elif op == '=':
+                mask &= data == value
+            elif op == '!=':
+                mask &= data != value
+            elif op == '>':
+                mask &= data > value
+            elif op == '>=':
+                mask &= data >= value
+            elif op == '<':
+                mask &= data < value
+            elif op == '<=':
+                mask &= data <= value
+            else:
+                raise ValueError(f"Operator tidak dikenal: {op}")
+        return mask
+
+    def _np_aggregate(self, by, conditions, sums):
+        mask = self._np_mask(conditions)
+        if not by:
+            return [((), int(mask.sum()), [float(self.columns[c][mask].sum()) for c in sums])]
+        keys = np.stack([self.columns[c][mask].astype('int64') for c in by])
+        if keys.shape[1] == 0:
+            return []
+        groups, inverse = np.unique(keys, axis=1, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.bincount(inverse, minlength=groups.shape[1])
+        totals = [np.bincount(inverse, weights=self.columns[c][mask], minlength=groups.shape[1]) for c in sums]
+        return [(tuple(int(k) for k in groups[:, g]), int(counts[g]), [float(t[g]) for t in totals])
+                for g in range(groups.shape[1])]
+
+    # -- Fallback stdlib (map/compress/Counter berjalan di C) --
+
+    def _py_mask(self, conditions):
+        mask = None
+        for column, op, value in conditions:
+            data = self.columns[column]
+            if op in ('in', 'not in'):
+                test = map(frozenset(value).__contains__, data)
+                if op == 'not in':
+                    test = map(operator.not_, test)
+            elif op in COMPARE_OPS:
+                test = map(COMPARE_OPS[op], data, repeat(value))
+            else:
+                raise ValueError(f"Operator tidak dikenal: {op}")
+            mask = test if mask is None else map(operator.and_, mask, test)
+        return None if mask is None else list(mask)
+
+    def _py_aggregate(self, by, conditions, sums):
+        mask = self._py_mask(conditions)
+
+        def pick(column):
+            data = self.columns[column]
+            return data if mask is None else compress(data, mask)
+
+        if not by:
+            count = self.rows if mask is None else sum(mask)
+            return [((), count, [float(sum(pick(c))) for c in sums])]
+        keys = list(zip(*(pick(c) for c in by)))
+        counts = Counter(keys)
+        totals = []
+        for column in sums:
+            acc = dict.fromkeys(counts, 0.0)
+            for key, value in zip(keys, pick(column)):
+                acc[key] += value
+            totals.append(acc)
+        return [(key, counts[key], [t[key] for t in totals]) for key in sorted(counts)]
+
+    def aggregate(self, by=(), where=(), sums=()):
+        """
+        Kelompokkan baris yang lolos filter `where` [(kolom, op, nilai)] per
+        kolom `by`; tiap grup berisi 'count' dan 'sum_<kolom>' untuk `sums`.
+        Nilai kolom dictionary dikembalikan dalam bentuk aslinya.
+        """
+        conditions = self._conditions(where)
+        engine = self._np_aggregate if NUMPY_AVAILABLE else self._py_aggregate
+        result = []
+        for key, count, totals in engine(list(by), conditions, list(sums)):
+            row = {}
+            for column, value in zip(by, key):
+                if column in self.dictionaries:
+                    row[column] = self.dictionaries[column][value]
+                else:
+                    row[column] = None if value == NULL_INT else value
+            row['count'] = count
+            for column, total in zip(sums, totals):
+                row[f"sum_{column}"] = total
+            result.append(row)
+        return result
+
+class Snapshot:
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        self.id = self.manifest['id']
+        self.built_at = self.manifest['built_at']
+        self.tables = {name: ColumnTable(name, directory, meta) for name, meta in self.manifest['tables'].items()}
+
+    def __getitem__(self, table):
+        return self.tables[table]
+
+    @property
+    def age(self):
+        return time.time() - self.built_at
+
+_current = {'key': None, 'snapshot': None}
+_current_lock = threading.Lock()
+
+def current_snapshot():
+    """Snapshot terbaru (di-cache per isi pointer CURRENT), atau None bila belum ada/dinonaktifkan."""
+    if REFRESH_INTERVAL_SECONDS <= 0:
+        return None
+    pointer = os.path.join(snapshot_root(), 'CURRENT')
+    try:
+        stat = os.stat(pointer)
+    except FileNotFoundError:
+        return None
+    key = (pointer, stat.st_mtime_ns, stat.st_size)
+    if _current['key'] == key:
+        return _current['snapshot']
+    with _current_lock:
+        if _current['key'] != key:
+            try:
+                with open(pointer) as f:
+                    snapshot_id = f.read().strip()
+                snapshot = Snapshot(os.path.join(snapshot_root(), snapshot_id))
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Snapshot analitik tidak bisa dibaca: {e}")
+                return _current['snapshot']
+            _current['key'], _current['snapshot'] = key, snapshot
+    return _current['snapshot']
+
+def snapshot_version():
+    """Komponen ETag: id snapshot yang melayani endpoint analitik."""
+    snapshot = current_snapshot()
+    return snapshot.id if snapshot else ''
+
+# ============================================
+# SCHEDULER
+# ============================================
+
+def _scheduler_loop(interval, stop_event):
+    while not stop_event.is_set():
+        snapshot = current_snapshot()
+        if snapshot is None or snapshot.age >= interval:
+            try:
+                # Build proses lain yang sedang berjalan sudah cukup; cek lagi tick berikutnya
+                build_snapshot(wait=False)
+            except (sqlite3.Error, OSError) as e:
+                print(f"⚠️ Build snapshot analitik gagal: {e}")
+        stop_event.wait(min(interval, 60))
+
+def start_snapshot_scheduler(interval=REFRESH_INTERVAL_SECONDS):
+    """Bangun ulang snapshot berkala di daemon thread. interval <= 0 menonaktifkan snapshot."""
+    stop_event = threading.Event()
+    if interval > 0:
+        thread = threading.Thread(target=_scheduler_loop, args=(interval, stop_event),
+                                  name='analytics-snapshot', daemon=True)
+        thread.start()
+    return stop_event
+
+# ============================================
+# QUERY DASHBOARD & LAPORAN
+# ============================================
+
+def overview_stats(snapshot):
+    klaim, alerts = snapshot['klaim'], snapshot['fraud_alert']
+    open_alerts = alerts.aggregate(where=[('status', '!=', 'Resolved')])[0]['count']
+    savings = alerts.aggregate(where=[('alert_level', '=', 'High'), ('status', '!=', 'Resolved')],
+                               sums=['total_biaya'])[0]['sum_total_biaya']
+    return {
+        "total_claims": klaim.rows,
+        "detected_anomalies": open_alerts,
+        "potential_savings": savings,
+        "pending_reviews": klaim.aggregate(where=[('status', '=', 'Pending')])[0]['count'],
+    }
+
+def sqlite_day(modifier):
+    """date('now', modifier) versi SQLite (UTC) sebagai YYYYMMDD, tanpa menyentuh database."""
+    conn = sqlite3.connect(':memory:')
+    day = conn.execute("SELECT CAST(strftime('%Y%m%d', 'now', ?) AS INTEGER)", (modifier,)).fetchone()[0]
+    conn.close()
+    return day
+
+def monthly_trends(snapshot, since_day):
+    """Klaim & anomali per bulan untuk klaim dengan day (YYYYMMDD) >= since_day."""
+    rows = snapshot['klaim'].aggregate(by=['month', 'status'], where=[('day', '>=', since_day)])
+    months = {}
+    for row in rows:
+        if row['month'] is None:
+            continue
+        month = months.setdefault(row['month'], {'total': 0, 'anomalies': 0})
+        month['total'] += row['count']
+        if row['status'] == 'Anomalous':
+            month['anomalies'] += row['count']
+    return [{'month': f"{m // 100:04d}-{m % 100:02d}", **v} for m, v in sorted(months.items())]
+
+def reason_distribution(snapshot):
+    return [{'name': row['reason_code'], 'value': row['count']}
+            for row in snapshot['fraud_alert'].aggregate(by=['reason_code'])]
+
+def alert_level_counts(snapshot):
+    return {row['alert_level']: row['count'] for row in snapshot['fraud_alert'].aggregate(by=['alert_level'])}
+
+SPEND_DIMENSIONS = {'provider': 'faskes_id', 'diagnosis': 'diagnosis_id', 'month': 'month', 'status': 'status'}
+
+def spend_breakdown(snapshot, group_by, status=None):
+    """Total biaya & jumlah klaim per kombinasi dimensi (provider/diagnosis/month/status)."""
+    columns = [SPEND_DIMENSIONS[dim] for dim in group_by]
+    where = [('status', '=', status)] if status else []
+    result = []
+    for row in snapshot['klaim'].aggregate(by=columns, where=where, sums=['total_biaya']):
+        item = {}
+        for dim, column in zip(group_by, columns):
+            value = row[column]
+            if dim == 'provider':
+                value = database.faskes_cache.name_for(value) if value is not None else None
+            elif dim == 'diagnosis':
+                value = database.diagnosis_cache.name_for(value) if value is not None else None
+            elif dim == 'month' and value is not None:
+                value = f"{value // 100:04d}-{value % 100:02d}"
+            item[dim] = value
+        item['claims'] = row['count']
+        item['total_spend'] = row['sum_total_biaya']
+        result.append(item)
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot kolumnar analitik SATRIA JKN")
+    parser.add_argument('--build', action='store_true', help='Bangun snapshot baru sekarang')
+    args = parser.parse_args()
+    if args.build:
+        started = time.perf_counter()
+        manifest = build_snapshot()
+        rows = {table: meta['rows'] for table, meta in manifest['tables'].items()}
+        print(f"✅ Snapshot {manifest['id']} dibangun dalam {time.perf_counter() - started:.2f} detik: {rows}")
+    snapshot = current_snapshot()
+    if snapshot is None:
+        print("Belum ada snapshot. Jalankan dengan --build.")
+    else:
+        print(f"Snapshot {snapshot.id} (umur {snapshot.age:.0f} detik, numpy={'yes' if NUMPY_AVAILABLE else 'no'})")
+        print(overview_stats(snapshot))
@@ -1,96 +1,157 @@
-from flask import Flask, jsonify, request, send_file
+from flask import Blueprint, Flask, current_app, g, jsonify, request, send_file, stream_with_context
 from flask_cors import CORS
 from datetime import datetime, timedelta
 import uuid
 import json
 import io
+import os
 import random
-from functools import wraps
+import sqlite3
+import threading
+import time
+from functools import lru_cache, wraps
 
 # Import konfigurasi database dari file database.py
-from database import get_db_connection, init_database, seed_sample_data
+from database import (get_db_connection, get_primary_connection, init_database, seed_sample_data, faskes_cache,
+                      start_replica_refresher, begin_read_routing, end_read_routing, replica_reads,
+                      shard_map, init_shards, get_shard_connection, scatter, gather_sorted, gather_sum)
+from fraud_engine import FraudDetectionEngine, RULES, unpack_trace, explain_alert, aggregate_rule_contributions
+from claims import save_scored_claim, ShardWriter
+from scoring_queue import enqueue_claim, get_job_status, queue_metrics
+from serialization import FastJSONProvider, RowSet, fetch_rowset, json_array_response
+from http_cache import conditional, init_http_cache
+from provider_risk import provider_risk_page, provider_risk_page_sharded, refresh_version, start_refresh_scheduler
+import analytics
+import feature_store
+import cdc
+import health
+from metrics import request_tracker
+from collusion import start_collusion_detector
+from retention import start_retention_scheduler
+from idempotency import idempotency_store, request_fingerprint, MAX_KEY_LENGTH
+from rate_limit import rate_limited, write_admission, RATE_LIMIT_ENABLED
+from auth import authenticate, generate_token, revoke_token, LoginBusy, token_required as jwt_required
+from claim_import import (import_claims, open_rows, ImportFormatError, IMPORT_FORMATS,
+                          CHUNK_ROWS, MAX_CHUNK_ROWS)
+from report_cube import build_report
+from ml_scorer import model_registry
+from triage import (peek_queue, claim_alerts, bulk_update, peek_sharded, claim_sharded, bulk_update_sharded,
+                    LEASE_SECONDS, MAX_CLAIM)
 
-# Cek ketersediaan library untuk Report PDF (Opsional tapi disarankan)
-try:
-    from reportlab.lib.pagesizes import letter
-    from reportlab.pdfgen import canvas
-    REPORT_LIB_AVAILABLE = True
-except ImportError:
-    REPORT_LIB_AVAILABLE = False
-    print("⚠️ ReportLab tidak ditemukan. Fitur download PDF mungkin terbatas.")
+# Mode ingest POST /api/klaim: 'sync' (scoring di request) atau 'async' (antrian)
+# Bisa di-override per request dengan ?mode=async / ?mode=sync
+INGEST_MODE = os.environ.get('SATRIA_INGEST_MODE', 'sync')
+# Data simulasi ditanam saat inisialisasi runtime (0 = database kosong)
+SEED_SAMPLE_DATA = os.environ.get('SATRIA_SEED_SAMPLE_DATA', '1') != '0'
 
-app = Flask(__name__)
-# Izinkan CORS agar frontend (port 5173) bisa bicara dengan backend (port 5000)
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+api = Blueprint('api', __name__)
 
 # ============================================
-# 🧠 AI AGENTIC SIMULATION ENGINE
+# APP FACTORY & INISIALISASI RUNTIME
 # ============================================
-class FraudDetectionEngine:
-    """
-    Simulasi Logika 'Agentic AI' yang menganalisis klaim secara real-time
-    berdasarkan pola historis dan aturan heuristik.
-    """
-    
-    @staticmethod
-    def analyze_claim(data):
-        risk_score = 0.0
-        reasons = []
-        amount = float(data.get('total_biaya', 0))
-        provider = data.get('provider', '')
-        diagnosis = data.get('diagnosis_code', '')
-
-        # --- 1. Analisis Biaya (Cost Anomaly) ---
-        # Jika biaya > 20 juta, risiko naik drastis
-        if amount > 20000000:
-            risk_score += 0.6
-            reasons.append(f"Biaya klaim Rp {amount:,} ekstrem melebihi ambang batas kewajaran regional.")
-        elif amount > 10000000:
-            risk_score += 0.3
-            reasons.append("Biaya klaim berada di persentil ke-90 (High outlier).")
-            
-        # --- 2. Analisis Provider (Reputasi & Pola Historis) ---
-        # Simulasi: Provider tertentu sedang dalam pengawasan Sentinel
-        if 'Cengkareng' in provider: 
-            risk_score += 0.25
-            reasons.append(f"Provider {provider} sedang dalam status pengawasan audit aktif.")
-        if 'Tebet' in provider and amount < 300000:
-             risk_score += 0.4
-             reasons.append(f"Pola frekuensi tinggi nilai rendah (indikasi Phantom Billing).")
-            
-        # --- 3. Analisis Integritas Data ---
-        if not diagnosis:
-            risk_score += 0.4
-            reasons.append("Kode diagnosis hilang atau format tidak valid.")
-
-        # Keputusan Agent
-        is_fraud = risk_score > 0.5
-        confidence = min(risk_score + 0.1, 0.99) # AI Confidence simulation
-        
-        explanation = " ".join(reasons) if reasons else "Data klaim konsisten dengan pola historis. Tidak ada anomali."
-        
-        # Tentukan tipe fraud untuk pelabelan
-        fraud_type = "None"
-        if is_fraud:
-            if amount > 15000000: fraud_type = "Upcoding"
-            elif "Tebet" in provider: fraud_type = "Phantom Billing"
-            else: fraud_type = "Data Inconsistency"
-        
-        return {
-            "is_fraud": is_fraud,
-            "risk_level": "High" if risk_score > 0.7 else "Medium" if risk_score > 0.4 else "Low",
-            "confidence": confidence,
-            "fraud_type": fraud_type,
-            "explanation": explanation
-        }
+# Import modul ini tidak menyentuh database. Cek skema, seeding dan thread
+# latar belakang dijalankan sekali per proses oleh init_runtime(), paling
+# lambat pada request pertama. Dengan preload (mis. gunicorn --preload)
+# thread tidak ikut ter-fork, jadi tiap worker memulainya sendiri di sini.
+
+_runtime_lock = threading.Lock()
+_runtime_pid = None
+
+def init_runtime(seed=None):
+    global _runtime_pid
+    if _runtime_pid == os.getpid():
+        return
+    with _runtime_lock:
+        if _runtime_pid == os.getpid():
+            return
+        # Tanpa kerja bila PRAGMA user_version sudah SCHEMA_VERSION
+        init_database()
+        # File shard regional (SATRIA_SHARD_MAP); tanpa peta shard tidak ada apa-apa
+        init_shards()
+        if seed is None:
+            seed = SEED_SAMPLE_DATA
+        if seed:
+            seed_sample_data()
+        # Refresh penuh profil risiko provider berkala (SATRIA_RISK_REFRESH_SECONDS)
+        start_refresh_scheduler()
+        # Snapshot kolumnar untuk endpoint analitik (SATRIA_ANALYTICS_REFRESH_SECONDS, 0 = langsung ke SQLite)
+        analytics.start_snapshot_scheduler()
+        # Deteksi ring kolusi peserta-faskes (SATRIA_COLLUSION_INTERVAL_SECONDS, 0 = nonaktif)
+        start_collusion_detector()
+        # Arsip & kompaksi data lama (SATRIA_RETENTION_INTERVAL_SECONDS, 0 = nonaktif)
+        start_retention_scheduler()
+        # Read replica untuk request GET (SATRIA_REPLICA_MAX_STALENESS, 0 = selalu database utama)
+        start_replica_refresher()
+        _runtime_pid = os.getpid()
+
+def create_app():
+    """Buat Flask app dengan seluruh endpoint API; database disentuh saat request pertama."""
+    app = Flask(__name__)
+    # JSON provider dengan jalur cepat orjson (fallback stdlib)
+    app.json = FastJSONProvider(app)
+    # Izinkan CORS agar frontend (port 5173) bisa bicara dengan backend (port 5000)
+    CORS(app, resources={r"/api/*": {"origins": "*", "expose_headers": ["ETag", "X-Snapshot-Age", "Idempotent-Replayed", "Retry-After"]}})
+    # Kompresi response (gzip/brotli) sesuai Accept-Encoding
+    init_http_cache(app)
+    app.register_blueprint(api)
+    return app
+
+@lru_cache(maxsize=None)
+def load_reportlab():
+    """Import reportlab saat PDF pertama dibuat; None bila tidak terpasang."""
+    try:
+        from reportlab.lib.pagesizes import letter
+        from reportlab.pdfgen import canvas
+    except ImportError:
+        print("⚠️ ReportLab tidak ditemukan. Fitur download PDF mungkin terbatas.")
+        return None
+    return letter, canvas
 
 # ============================================
 # DATABASE & AUTH MIDDLEWARE
 # ============================================
 
-# Inisialisasi DB saat server start
-init_database()
-seed_sample_data()
+HEALTH_PREFIX = '/api/health/'
+LIVENESS_PATH = HEALTH_PREFIX + 'live'
+
+@api.before_app_request
+def ensure_runtime():
+    # Liveness tidak boleh bergantung pada database
+    if request.path != LIVENESS_PATH:
+        init_runtime()
+
+@api.before_app_request
+def track_request():
+    # Probe load balancer tidak ikut dihitung agar tidak mengencerkan latency
+    if not request.path.startswith(HEALTH_PREFIX):
+        g.request_started = time.perf_counter()
+        request_tracker.start()
+
+@api.after_app_request
+def remember_status(response):
+    g.response_status = response.status_code
+    return response
+
+@api.after_app_request
+def report_snapshot_age(response):
+    age = end_read_routing()
+    if age is not None:
+        response.headers['X-Snapshot-Age'] = f"{age:.3f}"
+    return response
+
+@api.teardown_app_request
+def stop_read_routing(exc):
+    # Pastikan thread pool tidak mewarisi routing bila handler error
+    end_read_routing()
+
+@api.teardown_app_request
+def finish_request(exc):
+    # Untuk response streaming, teardown baru jalan setelah stream selesai
+    started = g.pop('request_started', None)
+    if started is not None:
+        kind = 'read' if request.method in ('GET', 'HEAD', 'OPTIONS') else 'write'
+        status = 500 if exc is not None else g.get('response_status', 500)
+        request_tracker.finish(kind, time.perf_counter() - started, status)
 
 def token_required(f):
     """Decorator sederhana untuk simulasi keamanan token"""
@@ -104,13 +165,72 @@ def token_required(f):
         return f(*args, **kwargs)
     return decorated
 
+# ============================================
+# AUTH ENDPOINTS
+# ============================================
+
+@api.route('/api/auth/login', methods=['POST'])
+@rate_limited('login', admission=False)
+def login():
+    """Login username/password; verifikasi hash berjalan di pool KDF (auth.py)"""
+    data = request.json or {}
+    if not data.get('username') or not data.get('password'):
+        return jsonify({'error': 'Username and password are required'}), 400
+    try:
+        user = authenticate(data['username'], data['password'])
+    except LoginBusy:
+        response = jsonify({'error': 'Terlalu banyak login bersamaan, coba lagi nanti'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    if not user:
+        return jsonify({'error': 'Invalid username or password'}), 401
+
+    return jsonify({
+        'message': 'Login successful',
+        'token': generate_token(user['user_id'], user['username'], user['role']),
+        'user': {key: user[key] for key in ('user_id', 'username', 'email', 'full_name', 'role')}
+    })
+
+@api.route('/api/auth/logout', methods=['POST'])
+@jwt_required
+def logout():
+    """Cabut JWT yang dipakai request ini; worker lain ikut menolaknya dalam ~1 detik"""
+    revoke_token(request.current_user)
+    return jsonify({'message': 'Logout successful'})
+
 # ============================================
 # DASHBOARD ENDPOINTS
 # ============================================
 
-@app.route('/api/dashboard/overview', methods=['GET'])
+# Empat hitungan overview dalam satu query, untuk dijalankan di tiap shard
+OVERVIEW_SHARD_SQL = """
+    SELECT (SELECT COUNT(*) FROM klaim),
+           (SELECT COUNT(*) FROM fraud_alert WHERE status != 'Resolved'),
+           (SELECT COALESCE(SUM(k.total_biaya), 0) FROM klaim k JOIN fraud_alert f ON k.klaim_id = f.klaim_id
+            WHERE f.alert_level = 'High' AND f.status != 'Resolved'),
+           (SELECT COUNT(*) FROM klaim WHERE status = 'Pending')
+"""
+
+@api.route('/api/dashboard/overview', methods=['GET'])
 @token_required
+@replica_reads
+@conditional('klaim', 'fraud_alert', version=analytics.snapshot_version)
 def dashboard_overview():
+    snapshot = analytics.current_snapshot()
+    if snapshot:
+        return jsonify(analytics.overview_stats(snapshot))
+
+    if shard_map.enabled:
+        # Hitungan per shard dijumlahkan
+        total, active_anomalies, savings, pending = gather_sum(scatter(OVERVIEW_SHARD_SQL))[0]
+        return jsonify({
+            "total_claims": total,
+            "detected_anomalies": active_anomalies,
+            "potential_savings": savings,
+            "pending_reviews": pending
+        })
+
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -138,26 +258,42 @@ def dashboard_overview():
         "pending_reviews": pending
     })
 
-@app.route('/api/dashboard/trends', methods=['GET'])
+@api.route('/api/dashboard/trends', methods=['GET'])
 @token_required
+@replica_reads
+@conditional('klaim', daily=True, version=analytics.snapshot_version)
 def dashboard_trends():
     """Data untuk grafik tren bulanan"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Mengambil data 6 bulan terakhir
-    cursor.execute("""
-        SELECT strftime('%Y-%m', tgl_pengajuan) as month,
-               COUNT(*) as total,
-               SUM(CASE WHEN status = 'Anomalous' THEN 1 ELSE 0 END) as anomalies
-        FROM klaim
-        WHERE tgl_pengajuan > date('now', '-6 months')
-        GROUP BY month
-        ORDER BY month ASC
-    """)
+    snapshot = analytics.current_snapshot()
+    if snapshot:
+        rows = analytics.monthly_trends(snapshot, analytics.sqlite_day('-6 months'))
+    elif shard_map.enabled:
+        rows = gather_sum(scatter("""
+            SELECT strftime('%Y-%m', tgl_pengajuan) as month,
+                   COUNT(*) as total,
+                   SUM(CASE WHEN status = 'Anomalous' THEN 1 ELSE 0 END) as anomalies
+            FROM klaim
+            WHERE tgl_pengajuan > date('now', '-6 months')
+            GROUP BY month
+        """), key_columns=1)
+        rows = [{'month': month, 'total': total, 'anomalies': anomalies}
+                for month, total, anomalies in sorted(rows) if month]
+    else:
+        conn = get_db_connection()
+        # Mengambil data 6 bulan terakhir
+        rows = conn.execute("""
+            SELECT strftime('%Y-%m', tgl_pengajuan) as month,
+                   COUNT(*) as total,
+                   SUM(CASE WHEN status = 'Anomalous' THEN 1 ELSE 0 END) as anomalies
+            FROM klaim
+            WHERE tgl_pengajuan > date('now', '-6 months')
+            GROUP BY month
+            ORDER BY month ASC
+        """).fetchall()
+        conn.close()
     
     result = []
-    for row in cursor.fetchall():
+    for row in rows:
         # Ubah format '2024-01' menjadi 'Jan'
         month_name = datetime.strptime(row['month'], '%Y-%m').strftime('%b')
         result.append({
@@ -165,94 +301,196 @@ def dashboard_trends():
             "claims": row['total'],
             "anomalies": row['anomalies']
         })
-    conn.close()
     return jsonify(result)
 
 # ============================================
 # KLAIM & SIMULASI AI (CORE LOGIC)
 # ============================================
 
-@app.route('/api/klaim', methods=['GET', 'POST'])
+@api.route('/api/klaim', methods=['GET', 'POST'])
 @token_required
+@rate_limited('ingest')
+@conditional('klaim')
 def handle_klaim():
     conn = get_db_connection()
     cursor = conn.cursor()
     
     if request.method == 'GET':
         # Ambil daftar klaim untuk tabel
-        query = "SELECT nomor_klaim, provider, tgl_pengajuan as tanggal, total_biaya, status FROM klaim ORDER BY tgl_pengajuan DESC LIMIT 50"
-        cursor.execute(query)
-        data = [dict(row) for row in cursor.fetchall()]
+        query = "SELECT nomor_klaim, faskes_id AS provider, tgl_pengajuan as tanggal, total_biaya, status FROM klaim ORDER BY tgl_pengajuan DESC LIMIT 50"
+        if shard_map.enabled:
+            # 50 teratas tiap shard digabung urut tanggal
+            rows = gather_sorted(scatter(query), key=lambda r: r[2] or '', reverse=True, limit=50)
+            result = RowSet(['nomor_klaim', 'provider', 'tanggal', 'total_biaya', 'status'], rows)
+        else:
+            result = fetch_rowset(conn, query)
         conn.close()
-        return jsonify(data)
+        # Nama provider diambil dari cache dimensi, bukan JOIN per request
+        result.rows = [(r[0], faskes_cache.name_for(r[1]), r[2], r[3], r[4]) for r in result.rows]
+        return jsonify(result)
         
     elif request.method == 'POST':
-        # === SIMULASI REAL-TIME PROCESSING ===
         data = request.json
-        
-        # 1. Analisis Agentic dijalankan
-        analysis = FraudDetectionEngine.analyze_claim(data)
-        
-        # 2. Simpan data dummy ke DB agar tercatat
-        klaim_id = str(uuid.uuid4())
-        tgl = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        status = 'Anomalous' if analysis['is_fraud'] else 'Pending'
-        
-        cursor.execute('''
-            INSERT INTO klaim (klaim_id, nomor_klaim, tgl_pengajuan, total_biaya, status, provider, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (klaim_id, data.get('nomor_klaim'), tgl, data.get('total_biaya'), status, data.get('provider'), tgl))
-        
-        # 3. Jika Fraud, Buat Alert & Log Audit Otomatis
-        if analysis['is_fraud']:
-            alert_id = str(uuid.uuid4())
-            cursor.execute('''
-                INSERT INTO fraud_alert (alert_id, klaim_id, alert_level, reason_code, ai_confidence, description, created_at, status, action)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (alert_id, klaim_id, analysis['risk_level'], analysis['fraud_type'], 
-                  analysis['confidence'], analysis['explanation'], tgl, 'Open', 'Auto-Flagged'))
-            
-            # Log Audit: AI mendeteksi sesuatu
-            audit_id = str(uuid.uuid4())
-            cursor.execute('''
-                INSERT INTO audit_trail (audit_id, entity, entity_id, action, user, details, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (audit_id, 'AI Sentinel', klaim_id, 'DETECTED', 'System', f"AI detected {analysis['fraud_type']} risk", tgl))
-
-        conn.commit()
+
+        # Retry dengan Idempotency-Key yang sama mendapat respons asli
+        idem_key = request.headers.get('Idempotency-Key')
+        fingerprint = None
+        if idem_key:
+            if len(idem_key) > MAX_KEY_LENGTH:
+                conn.close()
+                return jsonify({'message': f'Idempotency-Key maksimal {MAX_KEY_LENGTH} karakter'}), 400
+            fingerprint = request_fingerprint(data)
+            stored = idempotency_store.get(conn, idem_key)
+            if stored:
+                conn.close()
+                return replay_response(stored, fingerprint)
+
+        writer = ShardWriter(conn)
+        try:
+            # === MODE ASYNC: simpan ke antrian, scoring dilakukan worker ===
+            if request.args.get('mode', INGEST_MODE) == 'async':
+                queue_id = enqueue_claim(cursor, data)
+                payload, status_code = {
+                    'message': 'Klaim diterima dan masuk antrian Sentinel',
+                    'queue_id': queue_id,
+                    'status_url': f'/api/klaim/queue/{queue_id}'
+                }, 202
+            else:
+                # === SIMULASI REAL-TIME PROCESSING ===
+                # Shard tujuan dari wilayah faskes (tanpa sharding: koneksi ini sendiri)
+                ((shard, _),) = writer.route([data])
+                shard_cursor = writer.open(shard, [data]).cursor()
+
+                # 1. Analisis Agentic dijalankan
+                analysis = FraudDetectionEngine.analyze_claim(data, feature_store.lookup(shard_cursor, [data])[0])
+
+                # 2. Simpan klaim (+ alert & audit jika fraud) ke DB agar tercatat
+                save_scored_claim(shard_cursor, data, analysis, id_base=shard.id_base)
+                # Return hasil analisis ke Frontend untuk ditampilkan di Sandbox
+                payload, status_code = {
+                    'message': 'Klaim berhasil diproses oleh Sentinel',
+                    'analysis': analysis
+                }, 201
+
+            body = current_app.json.dumps_bytes(payload)
+            if idem_key:
+                stored = idempotency_store.save(cursor, idem_key, fingerprint, status_code, body)
+            # Key idempotency sudah tertulis (belum di-commit) sebelum shard di-commit:
+            # bentrok key membatalkan klaim di shard juga, bukan meninggalkan klaim yatim
+            writer.commit()
+            conn.commit()
+        except sqlite3.IntegrityError:
+            # Kalah balapan dengan request ber-key sama, atau nomor_klaim duplikat
+            conn.rollback()
+            writer.rollback()
+            stored = idempotency_store.get(conn, idem_key) if idem_key else None
+            conn.close()
+            if stored:
+                return replay_response(stored, fingerprint)
+            return jsonify({'message': f"Nomor klaim {data.get('nomor_klaim')} sudah terdaftar"}), 409
+        finally:
+            writer.close()
         conn.close()
-        
-        # Return hasil analisis ke Frontend untuk ditampilkan di Sandbox
-        return jsonify({
-            'message': 'Klaim berhasil diproses oleh Sentinel',
-            'analysis': analysis
-        }), 201
+        if idem_key:
+            idempotency_store.remember(idem_key, stored)
+        return current_app.response_class(body, status=status_code, mimetype='application/json')
+
+def replay_response(stored, fingerprint):
+    """Kirim ulang respons tersimpan; key yang dipakai untuk body lain ditolak."""
+    if stored.fingerprint != fingerprint:
+        return jsonify({'message': 'Idempotency-Key sudah dipakai untuk request dengan isi berbeda'}), 422
+    response = current_app.response_class(stored.body, status=stored.status_code, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+@api.route('/api/klaim/import', methods=['POST'])
+@token_required
+@rate_limited('ingest', admission=False)
+def import_klaim():
+    """
+    Import klaim dari file CSV/XLSX (multipart field `file`). Response
+    berupa NDJSON yang dialirkan per chunk: event error per baris, progress,
+    lalu done/aborted. Chunk berikutnya baru diproses setelah klien membaca
+    event sebelumnya, dan tiap chunk antri di admission controller tulis.
+    """
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'message': 'Upload file lewat field multipart "file"'}), 400
+    fmt = (request.args.get('format') or os.path.splitext(upload.filename or '')[1].lstrip('.')).lower()
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'message': f"Format harus salah satu dari: {', '.join(IMPORT_FORMATS)}"}), 400
+    try:
+        rows = open_rows(upload.stream, fmt)
+    except ImportFormatError as e:
+        return jsonify({'message': str(e)}), 400
+    chunk_rows = min(max(request.args.get('chunk_rows', CHUNK_ROWS, type=int), 1), MAX_CHUNK_ROWS)
+    dumps = current_app.json.dumps_bytes
+
+    def generate():
+        # Koneksi milik generator; asgi.py mengiterasi seluruh body di thread yang sama
+        conn = get_db_connection()
+        try:
+            for event in import_claims(conn, rows, chunk_rows,
+                                       write_admission if RATE_LIMIT_ENABLED else None):
+                yield dumps(event) + b"\n"
+        finally:
+            conn.close()
+
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@api.route('/api/klaim/queue/<int:queue_id>', methods=['GET'])
+@token_required
+@conditional('klaim_queue')
+def get_klaim_queue_status(queue_id):
+    """Status klaim yang dikirim lewat mode async"""
+    conn = get_db_connection()
+    job = get_job_status(conn.cursor(), queue_id)
+    conn.close()
+    if not job: return jsonify({'error': 'Queue item not found'}), 404
+    return jsonify(job)
+
+@api.route('/api/klaim/queue/metrics', methods=['GET'])
+@token_required
+def get_klaim_queue_metrics():
+    """Kedalaman antrian, lag dan throughput worker scoring (tanpa ETag: nilai bergantung waktu)"""
+    conn = get_db_connection()
+    metrics = queue_metrics(conn.cursor())
+    conn.close()
+    metrics['write_admission'] = write_admission.stats()
+    return jsonify(metrics)
 
-@app.route('/api/klaim/anomaly-chart', methods=['GET'])
+@api.route('/api/klaim/anomaly-chart', methods=['GET'])
 @token_required
+@replica_reads
+@conditional('fraud_alert', version=analytics.snapshot_version)
 def get_anomaly_chart():
     """Data untuk Pie Chart distribusi fraud"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
+    snapshot = analytics.current_snapshot()
+    if snapshot:
+        return jsonify({"distribution": analytics.reason_distribution(snapshot)})
+
+    query = """
         SELECT reason_code as name, COUNT(*) as value 
         FROM fraud_alert 
         GROUP BY reason_code
-    """)
-    data = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    """
+    if shard_map.enabled:
+        data = RowSet(['name', 'value'], gather_sum(scatter(query), key_columns=1))
+    else:
+        conn = get_db_connection()
+        data = fetch_rowset(conn, query)
+        conn.close()
     return jsonify({"distribution": data})
 
 # ============================================
 # ALERTS & ACTIONS
 # ============================================
 
-@app.route('/api/alerts', methods=['GET'])
+@api.route('/api/alerts', methods=['GET'])
 @token_required
+@conditional('fraud_alert')
 def get_alerts():
     risk = request.args.get('risk_level')
-    conn = get_db_connection()
-    cursor = conn.cursor()
     
     query = """
         SELECT alert_id as id, reason_code as type, alert_level as risk_level, 
@@ -265,95 +503,407 @@ def get_alerts():
         params.append(risk)
         
     query += " ORDER BY created_at DESC LIMIT 20"
-    cursor.execute(query, params)
-    data = [dict(row) for row in cursor.fetchall()]
+    if shard_map.enabled:
+        rows = gather_sorted(scatter(query, params), key=lambda r: r[3] or '', reverse=True, limit=20)
+        return jsonify(RowSet(['id', 'type', 'risk_level', 'date', 'alert_status'], rows))
+    # Array JSON dirangkai langsung oleh SQLite
+    conn = get_db_connection()
+    response = json_array_response(conn, query, params, order_by="date DESC")
+    conn.close()
+    return response
+
+@api.route('/api/alerts/<int:alert_id>', methods=['GET'])
+@token_required
+@conditional('fraud_alert')
+def get_alert_detail(alert_id):
+    """Detail alert; penjelasan dirender dari trace saat dibaca"""
+    # Rentang id menentukan shard pemilik alert (tanpa sharding: database utama)
+    conn = get_shard_connection(shard_map.for_id(alert_id), readonly=True)
+    alert = conn.execute("""
+        SELECT f.alert_id, f.klaim_id, k.nomor_klaim, k.faskes_id, f.alert_level, f.reason_code,
+               f.ai_confidence, f.description, f.trace, f.status, f.action, f.created_at
+        FROM fraud_alert f LEFT JOIN klaim k ON k.klaim_id = f.klaim_id
+        WHERE f.alert_id = ?
+    """, (alert_id,)).fetchone()
+    conn.close()
+    if not alert: return jsonify({'error': 'Alert not found'}), 404
+
+    provider = faskes_cache.name_for(alert['faskes_id'])
+    result = {key: alert[key] for key in alert.keys() if key not in ('description', 'trace', 'faskes_id')}
+    result['provider'] = provider
+    result['explanation'] = explain_alert(alert['description'], alert['trace'], provider)
+    if alert['trace'] is not None:
+        trace = unpack_trace(alert['trace'])
+        trace['rules'] = [{'rule_id': rule_id, 'code': RULES[rule_id].code if rule_id in RULES else None,
+                           'contribution': weight} for rule_id, weight in trace['rules']]
+        result['trace'] = trace
+    return jsonify(result)
+
+@api.route('/api/alerts/rule-contributions', methods=['GET'])
+@token_required
+@replica_reads
+@conditional('fraud_alert')
+def get_rule_contributions():
+    """Agregasi kontribusi rule di seluruh alert (untuk tuning bobot rule)"""
+    query = "SELECT reason_code, trace FROM fraud_alert WHERE trace IS NOT NULL"
+    params = []
+    for column, arg in (('status', 'status'), ('reason_code', 'reason_code'), ('alert_level', 'risk_level')):
+        if request.args.get(arg):
+            query += f" AND {column} = ?"
+            params.append(request.args[arg])
+    if request.args.get('since'):
+        query += " AND created_at >= ?"
+        params.append(request.args['since'])
+
+    if shard_map.enabled:
+        result = aggregate_rule_contributions(row for _, rows in scatter(query, params) for row in rows)
+        return jsonify(result)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    result = aggregate_rule_contributions(cursor.execute(query, params))
     conn.close()
-    return jsonify(data)
+    return jsonify(result)
 
-@app.route('/api/alerts/<alert_id>', methods=['PUT'])
+@api.route('/api/ml/model', methods=['GET'])
+@token_required
+def get_ml_model():
+    """Status model anomali yang dipakai engine (None = rule murni)"""
+    return jsonify(model_registry.status())
+
+@api.route('/api/ml/model/reload', methods=['POST'])
+@token_required
+def reload_ml_model():
+    """Muat ulang file model sekarang tanpa menunggu interval cek mtime"""
+    model_registry.reload()
+    return jsonify(model_registry.status())
+
+@api.route('/api/alerts/<int:alert_id>', methods=['PUT'])
 @token_required
 def update_alert(alert_id):
     """Endpoint untuk user menyelesaikan (Resolve) alert"""
     data = request.json
-    conn = get_db_connection()
+    conn = get_shard_connection(shard_map.for_id(alert_id))
     cursor = conn.cursor()
     
     new_status = 'Resolved' if data.get('is_resolved') else 'Flagged'
     action_note = data.get('action', 'Updated manually')
     
-    # Update status di DB
-    cursor.execute("UPDATE fraud_alert SET status = ?, is_resolved = ? WHERE alert_id = ?", 
+    # Update status di DB (lease triage ikut dilepas)
+    cursor.execute("UPDATE fraud_alert SET status = ?, is_resolved = ?, assigned_to = NULL, lease_until = NULL WHERE alert_id = ?", 
                   (new_status, 1 if new_status == 'Resolved' else 0, alert_id))
     
     # Catat di Audit Trail (Penting untuk transparansi)
     cursor.execute('''
         INSERT INTO audit_trail (audit_id, entity, entity_id, action, user, details)
         VALUES (?, ?, ?, ?, ?, ?)
-    ''', (str(uuid.uuid4()), 'Alert', alert_id, new_status.upper(), 'Admin User', action_note))
+    ''', (str(uuid.uuid4()), 'Alert', str(alert_id), new_status.upper(), 'Admin User', action_note))
     
     conn.commit()
     conn.close()
     return jsonify({'message': 'Alert updated'}), 200
 
+@api.route('/api/alerts/triage', methods=['GET'])
+@token_required
+def get_triage_queue():
+    """Antrian alert Open berdasarkan prioritas (tanpa ETag: prioritas bergantung umur alert)"""
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    if shard_map.enabled:
+        return jsonify(peek_sharded(limit, offset))
+    conn = get_db_connection()
+    result = peek_queue(conn, limit, offset)
+    conn.close()
+    return jsonify(result)
+
+@api.route('/api/alerts/triage/claim', methods=['POST'])
+@token_required
+def claim_triage_alerts():
+    """Ambil batch alert teratas dengan lease untuk satu analis"""
+    data = request.json or {}
+    analyst = data.get('analyst')
+    if not analyst:
+        return jsonify({'message': 'analyst wajib diisi'}), 400
+    limit = min(max(int(data.get('limit', 20)), 1), MAX_CLAIM)
+    lease_seconds = max(int(data.get('lease_seconds', LEASE_SECONDS)), 1)
+
+    if shard_map.enabled:
+        items = claim_sharded(analyst, limit, lease_seconds)
+    else:
+        conn = get_db_connection()
+        items = claim_alerts(conn, analyst, limit, lease_seconds)
+        conn.close()
+    return jsonify({'analyst': analyst, 'lease_seconds': lease_seconds, 'items': items})
+
+@api.route('/api/alerts/bulk', methods=['POST'])
+@token_required
+@rate_limited('ingest')
+def bulk_update_alerts():
+    """Resolve/flag/release banyak alert dalam satu transaksi (satu per shard bila sharding aktif)"""
+    data = request.json or {}
+    alert_ids = data.get('alert_ids')
+    if not isinstance(alert_ids, list) or not alert_ids:
+        return jsonify({'message': 'alert_ids wajib berupa list id alert'}), 400
+
+    if shard_map.enabled:
+        try:
+            result = bulk_update_sharded(alert_ids, data.get('action'), data.get('analyst', 'Admin User'), data.get('note'))
+        except (ValueError, TypeError) as e:
+            return jsonify({'message': str(e)}), 400
+        return jsonify(result)
+
+    conn = get_db_connection()
+    try:
+        result = bulk_update(conn, alert_ids, data.get('action'), data.get('analyst', 'Admin User'), data.get('note'))
+    except (ValueError, TypeError) as e:
+        return jsonify({'message': str(e)}), 400
+    finally:
+        conn.close()
+    return jsonify(result)
+
+# ============================================
+# PROVIDER RISK PROFILE
+# ============================================
+
+@api.route('/api/providers/risk', methods=['GET'])
+@token_required
+@conditional('klaim', 'fraud_alert', daily=True, version=refresh_version)
+def get_provider_risk():
+    """Profil risiko per faskes dari materialized view (tanpa scan tabel klaim)"""
+    sort = request.args.get('sort', 'risk_score')
+    order = request.args.get('order', 'desc')
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+
+    if shard_map.enabled:
+        try:
+            return jsonify(provider_risk_page_sharded(sort, order, page, per_page))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+    conn = get_db_connection()
+    try:
+        result = provider_risk_page(conn, sort, order, page, per_page)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    finally:
+        conn.close()
+    return jsonify(result)
+
+# ============================================
+# ANALYTICS (SNAPSHOT KOLUMNAR)
+# ============================================
+
+@api.route('/api/analytics/spend', methods=['GET'])
+@token_required
+@replica_reads
+@conditional('klaim', version=analytics.snapshot_version)
+def get_spend_breakdown():
+    """Belanja klaim per provider/diagnosis/bulan/status dari snapshot kolumnar"""
+    group_by = [dim for dim in request.args.get('group_by', 'provider,month').split(',') if dim]
+    unknown = [dim for dim in group_by if dim not in analytics.SPEND_DIMENSIONS]
+    if unknown:
+        return jsonify({'message': f"group_by tidak dikenal: {', '.join(unknown)}"}), 400
+    snapshot = analytics.current_snapshot()
+    if not snapshot:
+        return jsonify({'message': 'Snapshot analitik belum tersedia'}), 503
+    return jsonify({
+        'snapshot_id': snapshot.id,
+        'snapshot_age_seconds': round(snapshot.age, 1),
+        'items': analytics.spend_breakdown(snapshot, group_by, request.args.get('status')),
+    })
+
+# ============================================
+# HEALTH & KAPASITAS (lihat health.py)
+# ============================================
+# live/ready tanpa token agar bisa dipakai load balancer; capacity memuat
+# detail internal sehingga butuh token.
+
+@api.route('/api/health/live', methods=['GET'])
+def health_live():
+    return jsonify(health.liveness())
+
+@api.route('/api/health/ready', methods=['GET'])
+def health_ready():
+    result = health.readiness.check()
+    if result['status'] != 'ready':
+        response = jsonify(result)
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    return jsonify(result)
+
+@api.route('/api/health/capacity', methods=['GET'])
+@token_required
+def health_capacity():
+    return jsonify(health.capacity())
+
+# ============================================
+# CHANGE DATA CAPTURE (lihat cdc.py)
+# ============================================
+# Tiap file shard punya change_log dan seq sendiri; ?shard= memilihnya
+# (default shard utama).
+
+def _cdc_shard():
+    name = request.args.get('shard')
+    return shard_map.shard(name) if name else shard_map.default
+
+@api.route('/api/cdc/changes', methods=['GET'])
+@token_required
+def get_cdc_changes():
+    """
+    Perubahan klaim/fraud_alert dengan seq > after sebagai NDJSON, urut seq.
+    Dengan ?consumer= dan tanpa after, lanjut dari offset tersimpan konsumen.
+    """
+    try:
+        shard = _cdc_shard()
+    except KeyError:
+        return jsonify({'message': f"Shard tidak dikenal: {request.args.get('shard')}"}), 400
+    tables = [t for t in request.args.get('tables', '').split(',') if t]
+    try:
+        cdc.check_tables(tables)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    limit = request.args.get('limit', cdc.DEFAULT_LIMIT, type=int)
+    conn = get_shard_connection(shard, readonly=True)
+    try:
+        after = request.args.get('after', type=int)
+        if after is None:
+            consumer = request.args.get('consumer')
+            after = (cdc.consumer_offset(conn, consumer) if consumer else None) or 0
+        head = cdc.head_seq(conn)
+    finally:
+        conn.close()
+
+    def generate():
+        # Koneksi dibuka dan dibaca seluruhnya di dalam generator: satu thread per body (lihat asgi.py)
+        conn = get_shard_connection(shard, readonly=True)
+        try:
+            yield from cdc.iter_changes(conn, after, limit, tables)
+        finally:
+            conn.close()
+
+    response = current_app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['X-CDC-Head'] = str(head)
+    response.headers['X-CDC-Shard'] = shard.name
+    return response
+
+@api.route('/api/cdc/consumers', methods=['GET'])
+@token_required
+def get_cdc_consumers():
+    """Offset dan lag tiap konsumen CDC"""
+    try:
+        shard = _cdc_shard()
+    except KeyError:
+        return jsonify({'message': f"Shard tidak dikenal: {request.args.get('shard')}"}), 400
+    conn = get_shard_connection(shard, readonly=True)
+    result = cdc.list_consumers(conn)
+    conn.close()
+    return jsonify(dict(result, shard=shard.name))
+
+@api.route('/api/cdc/consumers/<name>/offset', methods=['POST'])
+@token_required
+def commit_cdc_offset(name):
+    """Simpan seq terakhir yang sudah diproses konsumen (tidak pernah mundur)"""
+    try:
+        shard = _cdc_shard()
+        seq = int((request.json or {})['seq'])
+    except KeyError:
+        return jsonify({'message': 'Shard tidak dikenal atau field "seq" tidak ada'}), 400
+    except (TypeError, ValueError):
+        return jsonify({'message': 'seq harus bilangan bulat'}), 400
+    conn = get_shard_connection(shard)
+    try:
+        stored = cdc.commit_offset(conn, name, seq)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    finally:
+        conn.close()
+    return jsonify({'consumer': name, 'shard': shard.name, 'seq': stored})
+
+@api.route('/api/cdc/consumers/<name>', methods=['DELETE'])
+@token_required
+def delete_cdc_consumer(name):
+    """Hapus konsumen yang tidak dipakai lagi agar tidak menahan kompaksi log"""
+    try:
+        shard = _cdc_shard()
+    except KeyError:
+        return jsonify({'message': f"Shard tidak dikenal: {request.args.get('shard')}"}), 400
+    conn = get_shard_connection(shard)
+    removed = cdc.drop_consumer(conn, name)
+    conn.close()
+    if not removed:
+        return jsonify({'message': 'Konsumen tidak ditemukan'}), 404
+    return jsonify({'message': 'Konsumen dihapus'})
+
 # ============================================
 # AUDIT TRAIL & REPORTS
 # ============================================
 
-@app.route('/api/audit-trail', methods=['GET'])
+@api.route('/api/audit-trail', methods=['GET'])
 @token_required
+@conditional('audit_trail')
 def get_audit_trail():
+    if shard_map.enabled:
+        # Jejak deteksi AI ditulis di shard klaimnya; gabung urut waktu
+        columns = ['audit_id', 'entity', 'entity_id', 'action', 'user', 'details', 'timestamp']
+        query = f"SELECT {', '.join(columns)} FROM audit_trail ORDER BY timestamp DESC LIMIT 30"
+        return jsonify(RowSet(columns, gather_sorted(scatter(query), key=lambda r: r[6] or '', reverse=True, limit=30)))
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM audit_trail ORDER BY timestamp DESC LIMIT 30")
-    data = [dict(row) for row in cursor.fetchall()]
+    response = json_array_response(conn, "SELECT * FROM audit_trail ORDER BY timestamp DESC LIMIT 30",
+                                   order_by="timestamp DESC")
     conn.close()
-    return jsonify(data)
+    return response
 
-@app.route('/api/reports', methods=['GET'])
+@api.route('/api/reports', methods=['GET'])
 @token_required
+@conditional('reports')
 def get_reports_list():
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT report_id as id, type as name, created_at as date, status FROM reports ORDER BY created_at DESC")
-    data = [dict(row) for row in cursor.fetchall()]
+    response = json_array_response(conn, "SELECT report_id as id, type as name, created_at as date, status FROM reports ORDER BY created_at DESC",
+                                   order_by="date DESC")
     conn.close()
-    return jsonify(data)
+    return response
 
-@app.route('/api/reports/generate', methods=['POST'])
+@api.route('/api/reports/generate', methods=['POST'])
 @token_required
+@rate_limited('report')
 def generate_report():
-    """Simulasi pembuatan laporan baru"""
-    rpt_type = request.json.get('type', 'Fraud Summary')
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Ambil data ringkasan nyata dari DB
-    cursor.execute("SELECT COUNT(*) FROM klaim")
-    total_c = cursor.fetchone()[0]
-    cursor.execute("SELECT alert_level, COUNT(*) FROM fraud_alert GROUP BY alert_level")
-    alerts_data = {r[0]: r[1] for r in cursor.fetchall()}
-    
-    report_payload = {
-        "total_claims": total_c,
-        "fraud_by_level": alerts_data,
-        "generated_by": "SATRIA JKN Agent"
-    }
+    """Buat laporan dari cube pra-agregasi (lihat report_cube.REPORT_TYPES)"""
+    params = request.json or {}
+    rpt_type = params.get('type', 'Fraud Summary')
+    # Agregat laporan boleh dibaca dari replika; laporan sendiri ditulis ke database utama
+    begin_read_routing()
+    read_conn = get_db_connection()
+    try:
+        report_payload = build_report(read_conn, rpt_type, params)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    finally:
+        read_conn.close()
+    report_payload["generated_by"] = "SATRIA JKN Agent"
     
     rep_id = f"RP-{uuid.uuid4().hex[:6].upper()}"
     tgl = datetime.now().strftime('%Y-%m-%d')
     
+    conn = get_primary_connection()
+    cursor = conn.cursor()
     cursor.execute("INSERT INTO reports (report_id, type, created_at, status, data) VALUES (?, ?, ?, ?, ?)",
                   (rep_id, rpt_type, tgl, 'Ready', json.dumps(report_payload)))
     
     conn.commit()
     conn.close()
-    return jsonify({'message': 'Report generated', 'report_id': rep_id})
+    return jsonify({'message': 'Report generated', 'report_id': rep_id, 'data': report_payload})
 
-@app.route('/api/reports/<report_id>/download', methods=['GET'])
+@api.route('/api/reports/<report_id>/download', methods=['GET'])
+@conditional('reports')
 def download_report(report_id):
     """Generate PDF fisik secara on-the-fly"""
-    if not REPORT_LIB_AVAILABLE:
+    reportlab = load_reportlab()
+    if reportlab is None:
         return jsonify({'error': 'Library PDF (reportlab) belum diinstall di server.'}), 500
+    letter, canvas = reportlab
 
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -397,8 +947,9 @@ def download_report(report_id):
     
     return send_file(buffer, as_attachment=True, download_name=f"SATRIA-{report_id}.pdf", mimetype='application/pdf')
 
-@app.route('/api/settings', methods=['GET'])
+@api.route('/api/settings', methods=['GET'])
 @token_required
+@conditional()
 def get_settings():
     return jsonify({
         "system_name": "SATRIA JKN Sentinel",
@@ -406,7 +957,10 @@ def get_settings():
         "mode": "Agentic Simulation"
     })
 
+app = create_app()
+
 if __name__ == "__main__":
+    init_runtime()
     print("🚀 SATRIA JKN Sentinel Engine Starting...")
     print("🧠 AI Agentic Logic: ACTIVE")
     print("📡 Server running at http://127.0.0.1:5000")
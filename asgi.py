@@ -0,0 +1,186 @@
+"""
+ASGI Entry Point (Production Serving Mode)
+Menjalankan Flask app yang sama di atas server ASGI (uvicorn). Event loop
+hanya menangani I/O jaringan; setiap handler Flask (termasuk seluruh
+panggilan sqlite3 yang blocking) dieksekusi di thread pool berukuran tetap,
+dan body response (mis. PDF atau export besar) dialirkan chunk per chunk
+tanpa memblokir loop. Pemanggilan app dan iterasi body-nya berjalan di satu
+thread yang sama (request context Flask dan koneksi SQLite milik generator
+terikat ke thread itu); chunk diserahkan ke loop lewat antrian terbatas.
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000 --workers 4
+
+Worker/thread model:
+    proses uvicorn (--workers N)
+      └─ 1 event loop: accept koneksi, baca body, kirim chunk response
+      └─ ThreadPoolExecutor (SATRIA_ASGI_THREADS, default 16)
+           └─ handler Flask + koneksi SQLite per request
+    Request yang datang saat semua thread sibuk menunggu di antrian
+    executor (tidak memakan thread), sehingga concurrency ke SQLite
+    dibatasi N x SATRIA_ASGI_THREADS. Response streaming memegang
+    thread-nya sampai chunk terakhir terkirim ke klien.
+"""
+
+import asyncio
+import contextvars
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as flask_app
+from metrics import request_tracker
+
+ASGI_THREADS = int(os.environ.get('SATRIA_ASGI_THREADS', 16))
+# Body request di atas batas ini di-spool ke disk, bukan ditahan di memori
+SPOOL_MAX_BYTES = 1024 * 1024
+# Chunk response yang boleh menunggu di antara thread handler dan event loop
+STREAM_BUFFER_CHUNKS = 4
+
+_END = object()
+
+def _legacy_write(data):
+    # write() legacy dari WSGI (PEP 3333) tidak dipakai Flask; body harus dikembalikan sebagai iterable
+    raise RuntimeError("Adapter ASGI SATRIA tidak mendukung write() dari start_response; "
+                       "kembalikan body response sebagai iterable")
+
+def _build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            key = name
+        else:
+            key = f'HTTP_{name}'
+        # Header berulang digabung dengan koma, kecuali Cookie yang memakai "; " (RFC 6265)
+        separator = '; ' if key == 'HTTP_COOKIE' else ','
+        environ[key] = f"{environ[key]}{separator}{value}" if key in environ else value
+    return environ
+
+class WSGIToASGI:
+    """Adapter ASGI -> WSGI dengan thread pool terbatas dan streaming response."""
+
+    def __init__(self, wsgi_app, max_threads=ASGI_THREADS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='satria-asgi')
+        # Utilisasi & kejenuhan di /api/health/* dihitung terhadap pool ini
+        request_tracker.threads = max_threads
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, receive):
+        """Body lengkap request, atau None bila klien memutus koneksi sebelum body selesai."""
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            body.write(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        body.seek(0)
+        return body
+
+    async def _http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        body = await self._read_body(receive)
+        if body is None:
+            # Jangan jalankan handler dengan body parsial (mis. klaim terpotong); tidak ada yang menerima response
+            return
+        environ = _build_environ(scope, body)
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+            return _legacy_write
+
+        # Handler Flask dan iterasi body-nya berjalan di satu thread dari pool,
+        # dalam salinan context milik request ini
+        chunks = asyncio.Queue(maxsize=STREAM_BUFFER_CHUNKS)
+        cancelled = threading.Event()
+        request_tracker.enqueue()
+        worker = loop.run_in_executor(self.executor, contextvars.copy_context().run, self._run_app,
+                                      loop, environ, start_response, chunks, cancelled)
+        try:
+            # Chunk pertama ditunggu dulu: generator boleh memanggil start_response saat iterasi
+            chunk = await chunks.get()
+            if chunk is _END:
+                await worker  # Exception dari app sebelum body: biarkan server mengirim 500
+            await send({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+            while chunk is not _END:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await chunks.get()
+            await worker
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            # Klien putus / error: hentikan iterasi, lepaskan thread yang menunggu slot antrian,
+            # dan tunggu close() body selesai di thread-nya sebelum input ditutup
+            cancelled.set()
+            while not chunks.empty():
+                chunks.get_nowait()
+            await asyncio.wait([worker])
+            body.close()
+
+    def _run_app(self, loop, environ, start_response, chunks, cancelled):
+        """Panggil app dan iterasi body-nya di thread ini; chunk diserahkan ke event loop lewat antrian."""
+        def put(item):
+            if cancelled.is_set():
+                return False
+            # Blok saat antrian penuh: klien lambat menahan generator, bukan menumpuk body di memori
+            asyncio.run_coroutine_threadsafe(chunks.put(item), loop).result()
+            return not cancelled.is_set()
+
+        # Keluar dari hitungan antrian begitu mendapat thread
+        request_tracker.dequeue()
+        try:
+            iterable = self.wsgi_app(environ, start_response)
+            try:
+                for chunk in iterable:
+                    if not put(chunk):
+                        break
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+        finally:
+            put(_END)
+
+application = WSGIToASGI(flask_app)
@@ -3,18 +3,38 @@ Authentication and Authorization Module
 Provides JWT-based authentication for SATRIA JKN API
 """
 
+import os
+import time
+import math
+import uuid
+import atexit
+import hashlib
+import threading
 import jwt
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from datetime import datetime, timedelta
-from functools import wraps
+from functools import wraps, lru_cache
 from flask import request, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
-from database import get_db_connection
+from database import get_db_connection, get_primary_connection
 
 # Secret key for JWT - In production, use environment variable
 SECRET_KEY = "satria-jkn-secret-key-2025-change-in-production"
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# Rate limits per role, per endpoint class: (tokens per second, burst size).
+# Enforced by rate_limit.py; 'ingest' = POST /api/klaim and other bulk writes,
+# 'report' = report generation, 'login' = POST /api/auth/login (per client IP).
+ROLE_RATE_LIMITS = {
+    'admin': {'ingest': (50.0, 100), 'report': (1.0, 5), 'login': (1.0, 10)},
+    'auditor': {'ingest': (10.0, 20), 'report': (0.5, 5), 'login': (1.0, 10)},
+    'user': {'ingest': (20.0, 40), 'report': (0.1, 2), 'login': (1.0, 10)},
+}
+# Dev tokens ('dev-token-*') carry no role claim
+DEV_TOKEN_ROLE = 'admin'
+DEFAULT_ROLE = 'user'
+
 def generate_token(user_id, username, role):
     """Generate JWT token for authenticated user"""
     payload = {
@@ -22,7 +42,8 @@ def generate_token(user_id, username, role):
         'username': username,
         'role': role,
         'exp': datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS),
-        'iat': datetime.utcnow()
+        'iat': datetime.utcnow(),
+        'jti': uuid.uuid4().hex
     }
     token = jwt.encode(payload, SECRET_KEY, algorithm=JWT_ALGORITHM)
     return token
@@ -37,6 +58,10 @@ def decode_token(token):
     except jwt.InvalidTokenError:
         return None  # Invalid token
 
+def role_limits(role):
+    """Rate limit table for a role; unknown roles get the 'user' limits"""
+    return ROLE_RATE_LIMITS.get(role, ROLE_RATE_LIMITS[DEFAULT_ROLE])
+
 def get_user_by_username(username):
     """Get user from database by username"""
     conn = get_db_connection()
@@ -55,87 +80,342 @@ def get_user_by_id(user_id):
     conn.close()
     return dict(user) if user else None
 
+# ============================================
+# CREDENTIAL VERIFICATION & LAST LOGIN
+# ============================================
+# check_password_hash runs a deliberately slow KDF. It runs on a small
+# dedicated pool so a login storm can only use KDF_WORKERS threads' worth of
+# CPU; the rest of the worker pool keeps serving dashboards. Once
+# KDF_QUEUE_LIMIT logins are waiting, new ones fail fast with LoginBusy; a
+# login still queued after KDF_TIMEOUT_SECONDS gives up with LoginBusy too.
+
+KDF_WORKERS = int(os.environ.get('SATRIA_KDF_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+KDF_QUEUE_LIMIT = int(os.environ.get('SATRIA_KDF_QUEUE', 64))
+KDF_TIMEOUT_SECONDS = 10
+LAST_LOGIN_FLUSH_SECONDS = float(os.environ.get('SATRIA_LAST_LOGIN_FLUSH_SECONDS', 2))
+
+class LoginBusy(Exception):
+    """Too many logins already waiting for password verification"""
+
+_kdf_lock = threading.Lock()
+_kdf_state = {'pid': None, 'executor': None, 'slots': None}
+
+def _kdf_pool():
+    # Created per process on first use: executor threads do not survive fork
+    if _kdf_state['pid'] != os.getpid():
+        with _kdf_lock:
+            if _kdf_state['pid'] != os.getpid():
+                _kdf_state['executor'] = ThreadPoolExecutor(max_workers=KDF_WORKERS, thread_name_prefix='satria-kdf')
+                _kdf_state['slots'] = threading.BoundedSemaphore(KDF_WORKERS + KDF_QUEUE_LIMIT)
+                _kdf_state['pid'] = os.getpid()
+    return _kdf_state['executor'], _kdf_state['slots']
+
+@lru_cache(maxsize=None)
+def _dummy_hash():
+    # Unknown usernames are checked against this so they take as long as a wrong password
+    return generate_password_hash('satria-jkn-unknown-user')
+
+def verify_password(password_hash, password, timeout=KDF_TIMEOUT_SECONDS):
+    """Run check_password_hash on the KDF pool. Raises LoginBusy when the queue is full or the wait times out."""
+    executor, slots = _kdf_pool()
+    if not slots.acquire(blocking=False):
+        raise LoginBusy()
+    try:
+        future = executor.submit(check_password_hash, password_hash, password)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout)
+    except FutureTimeout:
+        # Still queued: drop it so it stops holding a slot (a running hash just finishes)
+        future.cancel()
+        raise LoginBusy() from None
+
+def authenticate(username, password):
+    """Return the active user matching the credentials, or None"""
+    user = get_user_by_username(username)
+    valid = verify_password(user['password_hash'] if user else _dummy_hash(), password)
+    if not valid or not user or not user['is_active']:
+        return None
+    update_last_login(user['user_id'])
+    return user
+
+class LastLoginBuffer:
+    """
+    Write-behind buffer for users.last_login. Logins only record a timestamp
+    in memory; a daemon thread writes all pending users in one transaction
+    every LAST_LOGIN_FLUSH_SECONDS (and once more at interpreter exit).
+    """
+
+    def __init__(self, interval=LAST_LOGIN_FLUSH_SECONDS):
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def record(self, user_id):
+        with self._lock:
+            self._pending[user_id] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._flush_loop, name='last-login-flush', daemon=True).start()
+
+    def flush(self):
+        """Write pending timestamps now; returns the number of users updated"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        conn = get_primary_connection()
+        try:
+            conn.executemany("UPDATE users SET last_login = ? WHERE user_id = ?",
+                             [(ts, user_id) for user_id, ts in pending.items()])
+            conn.commit()
+        except Exception:
+            # Keep the timestamps for the next attempt unless newer ones arrived
+            with self._lock:
+                for user_id, ts in pending.items():
+                    self._pending.setdefault(user_id, ts)
+            raise
+        finally:
+            conn.close()
+        return len(pending)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Flush last_login failed: {e}")
+
+last_login_buffer = LastLoginBuffer()
+
+@atexit.register
+def _flush_last_login_on_exit():
+    try:
+        last_login_buffer.flush()
+    except Exception as e:
+        print(f"⚠️ Flush last_login failed: {e}")
+
 def update_last_login(user_id):
-    """Update user's last login timestamp"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE user_id = ?",
-        (user_id,)
-    )
+    """Record user's last login timestamp (written in batches by last_login_buffer)"""
+    last_login_buffer.record(user_id)
+
+# ============================================
+# TOKEN REVOCATION
+# ============================================
+# Revoked tokens live in the revoked_token table: one row per revoked jti,
+# or a row without jti that revokes every token of a user issued before
+# revoked_at (logout everywhere / deactivation). Each process mirrors the
+# table in memory and pulls new rows at most every REVOCATION_REFRESH_SECONDS,
+# so checking a token on the hot path never touches the database.
+
+REVOCATION_REFRESH_SECONDS = float(os.environ.get('SATRIA_REVOCATION_REFRESH_SECONDS', 1))
+BLOOM_FALSE_POSITIVE_RATE = 0.01
+BLOOM_MIN_CAPACITY = 1024
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (k bit positions from one blake2b digest)"""
+
+    def __init__(self, capacity, error_rate=BLOOM_FALSE_POSITIVE_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+class RevocationList:
+    """
+    In-memory mirror of revoked_token. The Bloom filter answers "not revoked"
+    for almost every token without hashing into a large set; its rare
+    positives are confirmed against the exact set of jtis.
+    """
+
+    def __init__(self, refresh_seconds=REVOCATION_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._exact = {}            # jti -> expires_at
+        self._user_cutoff = {}      # user_id -> revoked_at
+        self._bloom = BloomFilter(BLOOM_MIN_CAPACITY)
+        self._watermark = 0
+        self._checked_at = 0.0
+        self._pid = os.getpid()
+
+    def _rebuild_bloom(self):
+        now = time.time()
+        self._exact = {jti: exp for jti, exp in self._exact.items() if exp > now}
+        bloom = BloomFilter(max(BLOOM_MIN_CAPACITY, 2 * len(self._exact)))
+        for jti in self._exact:
+            bloom.add(jti)
+        self._bloom = bloom
+
+    def refresh(self):
+        """Pull revocations added since the last refresh"""
+        conn = get_primary_connection()
+        try:
+            rows = conn.execute(
+                "SELECT revoke_id, jti, user_id, revoked_at, expires_at FROM revoked_token WHERE revoke_id > ? ORDER BY revoke_id",
+                (self._watermark,)).fetchall()
+        finally:
+            conn.close()
+        with self._lock:
+            for revoke_id, jti, user_id, revoked_at, expires_at in rows:
+                if jti:
+                    self._exact[jti] = expires_at
+                    self._bloom.add(jti)
+                else:
+                    self._user_cutoff[user_id] = max(self._user_cutoff.get(user_id, 0), revoked_at)
+                self._watermark = revoke_id
+            # Filter over capacity: rebuild without expired jtis at twice the size
+            if self._bloom.count > self._bloom.capacity:
+                self._rebuild_bloom()
+            self._checked_at = time.monotonic()
+        return len(rows)
+
+    def _maybe_refresh(self):
+        if self._pid != os.getpid():
+            # Forked worker: start from a clean copy
+            with self._lock:
+                self._reset()
+        if time.monotonic() - self._checked_at >= self.refresh_seconds:
+            # Only one thread refreshes; the others keep using the current view
+            if self._refresh_lock.acquire(blocking=False):
+                try:
+                    if time.monotonic() - self._checked_at >= self.refresh_seconds:
+                        self.refresh()
+                finally:
+                    self._refresh_lock.release()
+
+    def is_revoked(self, payload):
+        self._maybe_refresh()
+        jti = payload.get('jti')
+        if jti and jti in self._bloom and jti in self._exact:
+            return True
+        cutoff = self._user_cutoff.get(payload.get('user_id'))
+        return cutoff is not None and payload.get('iat', 0) <= cutoff
+
+    def __len__(self):
+        return len(self._exact)
+
+revocation_list = RevocationList()
+
+def _insert_revocation(jti, user_id, expires_at):
+    now = time.time()
+    conn = get_primary_connection()
+    # Rows for tokens that have expired anyway are no longer needed
+    conn.execute("DELETE FROM revoked_token WHERE expires_at <= ?", (now,))
+    conn.execute(
+        "INSERT INTO revoked_token (jti, user_id, revoked_at, expires_at) VALUES (?, ?, ?, ?)",
+        (jti, user_id, now, expires_at))
     conn.commit()
     conn.close()
+    revocation_list.refresh()
+
+def revoke_token(payload):
+    """Revoke a single decoded token until it would have expired anyway"""
+    if not payload.get('jti'):
+        # Tokens issued before jti existed can only be revoked per user
+        return revoke_user_tokens(payload['user_id'])
+    _insert_revocation(payload['jti'], payload.get('user_id'), payload['exp'])
+
+def revoke_user_tokens(user_id):
+    """Revoke every token issued to user_id so far"""
+    _insert_revocation(None, user_id, time.time() + JWT_EXPIRATION_HOURS * 3600)
+
+def set_user_active(user_id, active):
+    """Activate/deactivate a user; deactivation also revokes their tokens"""
+    conn = get_primary_connection()
+    conn.execute("UPDATE users SET is_active = ? WHERE user_id = ?", (1 if active else 0, user_id))
+    conn.commit()
+    conn.close()
+    if not active:
+        revoke_user_tokens(user_id)
+
+# ============================================
+# ROUTE DECORATORS
+# ============================================
+
+def _authenticate_request():
+    """Return (user claims, None) for a valid, unrevoked token, else (None, error response)"""
+    token = None
+
+    # Check for token in Authorization header
+    if 'Authorization' in request.headers:
+        auth_header = request.headers['Authorization']
+        try:
+            # Format: "Bearer <token>"
+            token = auth_header.split(" ")[1] if " " in auth_header else auth_header
+        except IndexError:
+            return None, (jsonify({'error': 'Invalid token format'}), 401)
+
+    if not token:
+        return None, (jsonify({'error': 'Token is missing'}), 401)
+
+    # Decode and validate token
+    payload = decode_token(token)
+    if not payload:
+        return None, (jsonify({'error': 'Token is invalid or expired'}), 401)
+
+    # Revoked tokens (logout, deactivated users) are rejected from memory;
+    # deactivation revokes the user's tokens, so no users SELECT is needed
+    if revocation_list.is_revoked(payload):
+        return None, (jsonify({'error': 'Token has been revoked'}), 401)
+
+    user = {key: payload.get(key) for key in ('user_id', 'username', 'role', 'jti', 'exp')}
+    return user, None
 
 def token_required(f):
     """Decorator to protect routes - requires valid JWT token"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        
-        # Check for token in Authorization header
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try:
-                # Format: "Bearer <token>"
-                token = auth_header.split(" ")[1] if " " in auth_header else auth_header
-            except IndexError:
-                return jsonify({'error': 'Invalid token format'}), 401
-        
-        if not token:
-            return jsonify({'error': 'Token is missing'}), 401
-        
-        # Decode and validate token
-        payload = decode_token(token)
-        if not payload:
-            return jsonify({'error': 'Token is invalid or expired'}), 401
-        
-        # Verify user still exists and is active
-        user = get_user_by_id(payload['user_id'])
-        if not user or not user['is_active']:
-            return jsonify({'error': 'User not found or inactive'}), 401
-        
+        user, error = _authenticate_request()
+        if error:
+            return error
+
         # Add user info to request context
         request.current_user = user
-        
+
         return f(*args, **kwargs)
-    
+
     return decorated
 
 def admin_required(f):
     """Decorator to protect routes - requires admin role"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        
-        # Check for token in Authorization header
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try:
-                token = auth_header.split(" ")[1] if " " in auth_header else auth_header
-            except IndexError:
-                return jsonify({'error': 'Invalid token format'}), 401
-        
-        if not token:
-            return jsonify({'error': 'Token is missing'}), 401
-        
-        # Decode and validate token
-        payload = decode_token(token)
-        if not payload:
-            return jsonify({'error': 'Token is invalid or expired'}), 401
-        
-        # Verify user exists, is active, and is admin
-        user = get_user_by_id(payload['user_id'])
-        if not user or not user['is_active']:
-            return jsonify({'error': 'User not found or inactive'}), 401
-        
+        user, error = _authenticate_request()
+        if error:
+            return error
+
         if user['role'] != 'admin':
             return jsonify({'error': 'Admin access required'}), 403
-        
+
         # Add user info to request context
         request.current_user = user
-        
+
         return f(*args, **kwargs)
-    
+
     return decorated
 
 def role_required(*allowed_roles):
@@ -143,37 +423,18 @@ def role_required(*allowed_roles):
     def decorator(f):
         @wraps(f)
         def decorated(*args, **kwargs):
-            token = None
-            
-            # Check for token in Authorization header
-            if 'Authorization' in request.headers:
-                auth_header = request.headers['Authorization']
-                try:
-                    token = auth_header.split(" ")[1] if " " in auth_header else auth_header
-                except IndexError:
-                    return jsonify({'error': 'Invalid token format'}), 401
-            
-            if not token:
-                return jsonify({'error': 'Token is missing'}), 401
-            
-            # Decode and validate token
-            payload = decode_token(token)
-            if not payload:
-                return jsonify({'error': 'Token is invalid or expired'}), 401
-            
-            # Verify user exists, is active
-            user = get_user_by_id(payload['user_id'])
-            if not user or not user['is_active']:
-                return jsonify({'error': 'User not found or inactive'}), 401
-            
+            user, error = _authenticate_request()
+            if error:
+                return error
+
             # Check if user has required role
             if user['role'] not in allowed_roles:
                 return jsonify({'error': f'Access denied. Required roles: {", ".join(allowed_roles)}'}), 403
-            
+
             # Add user info to request context
             request.current_user = user
-            
+
             return f(*args, **kwargs)
-        
+
         return decorated
     return decorator
@@ -0,0 +1,91 @@
+"""
+Benchmark agregasi analitik: query SQLite langsung vs snapshot kolumnar
+(NumPy bila terpasang, fallback stdlib bila tidak), plus waktu build snapshot.
+
+Usage: python benchmarks/bench_analytics.py [--rows 200000] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import analytics
+
+SPEND_SQL = """
+    SELECT faskes_id, diagnosis_id, strftime('%Y-%m', tgl_pengajuan) AS month, COUNT(*), SUM(total_biaya)
+    FROM klaim GROUP BY faskes_id, diagnosis_id, month
+"""
+REASON_SQL = "SELECT reason_code, COUNT(*) FROM fraud_alert GROUP BY reason_code"
+
+def _populate(rows):
+    conn = database.get_db_connection()
+    rng = random.Random(42)
+    conn.executemany(
+        "INSERT INTO klaim (nomor_klaim, tgl_pengajuan, total_biaya, status, faskes_id, diagnosis_id, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(f"BENCH-{i}", f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 10:00:00", rng.uniform(1e5, 3e7),
+          rng.choice(('Pending', 'Anomalous', 'Approved')), rng.randint(1, 5), rng.randint(1, 3),
+          '2025-01-01 10:00:00') for i in range(rows)])
+    conn.execute('''
+        INSERT INTO fraud_alert (klaim_id, alert_level, reason_code, ai_confidence, created_at, status)
+        SELECT klaim_id, 'High', CASE klaim_id % 3 WHEN 0 THEN 'Upcoding' ELSE 'Phantom Billing' END, 0.9, created_at, 'Open'
+        FROM klaim WHERE status = 'Anomalous'
+    ''')
+    conn.commit()
+    conn.close()
+
+def _timeit(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='satria-bench-')
+    database.DATABASE_NAME = os.path.join(workdir, 'bench.db')
+    database.init_database()
+    database.seed_sample_data()
+    _populate(args.rows)
+
+    started = time.perf_counter()
+    analytics.build_snapshot()
+    print(f"rows={args.rows} numpy={'yes' if analytics.NUMPY_AVAILABLE else 'no'} "
+          f"build={time.perf_counter() - started:.2f}s")
+    snapshot = analytics.current_snapshot()
+
+    def sql(query):
+        def run():
+            conn = database.get_db_connection()
+            conn.execute(query).fetchall()
+            conn.close()
+        return run
+
+    cases = [
+        ('spend provider x diagnosis x month', sql(SPEND_SQL),
+         lambda: snapshot['klaim'].aggregate(by=['faskes_id', 'diagnosis_id', 'month'], sums=['total_biaya'])),
+        ('anomaly reason distribution', sql(REASON_SQL), lambda: analytics.reason_distribution(snapshot)),
+        ('dashboard overview', sql("SELECT COUNT(*) FROM klaim WHERE status = 'Pending'"),
+         lambda: analytics.overview_stats(snapshot)),
+    ]
+    for name, sqlite_fn, snapshot_fn in cases:
+        sqlite_time = _timeit(sqlite_fn, args.repeat)
+        snapshot_time = _timeit(snapshot_fn, args.repeat)
+        print(f"  {name:<36} sqlite {sqlite_time * 1000:8.1f} ms   snapshot {snapshot_time * 1000:8.1f} ms"
+              f"  {sqlite_time / snapshot_time:5.2f}x")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
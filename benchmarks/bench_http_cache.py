@@ -0,0 +1,67 @@
+"""
+Benchmark bandwidth: ukuran response identity vs gzip/brotli, dan
+revalidasi ETag (304) untuk endpoint GET dashboard/alerts/audit/reports.
+
+Usage: python benchmarks/bench_http_cache.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+ENDPOINTS = [
+    '/api/dashboard/overview',
+    '/api/dashboard/trends',
+    '/api/klaim',
+    '/api/klaim/anomaly-chart',
+    '/api/alerts',
+    '/api/audit-trail',
+    '/api/reports',
+    '/api/settings',
+]
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='satria-bench-')
+    database.DATABASE_NAME = os.path.join(workdir, 'bench.db')
+    # Data isian dikirim dengan satu token; jangan sampai kena rate limit
+    os.environ.setdefault('SATRIA_RATE_LIMIT', '0')
+
+    import app as satria
+    from http_cache import SUPPORTED_ENCODINGS
+
+    client = satria.app.test_client()
+    auth = {'Authorization': 'dev-token-12345'}
+    # Isi audit trail & reports agar payload realistis
+    for i in range(20):
+        client.post('/api/klaim', headers=auth, json={
+            'nomor_klaim': f'BENCH-{i}', 'total_biaya': 25000000, 'provider': 'RSUD Cengkareng', 'diagnosis_code': 'I10'})
+        client.post('/api/reports/generate', headers=auth, json={'type': 'Fraud Summary'})
+
+    header = f"{'endpoint':<28}{'identity':>10}" + ''.join(f"{enc:>10}" for enc in SUPPORTED_ENCODINGS) + f"{'304':>8}{'saved':>8}"
+    print(header)
+    totals = {'identity': 0, 'best': 0}
+    for path in ENDPOINTS:
+        identity = client.get(path, headers=auth)
+        sizes = []
+        for enc in SUPPORTED_ENCODINGS:
+            sizes.append(len(client.get(path, headers={**auth, 'Accept-Encoding': enc}).data))
+        revalidate = client.get(path, headers={**auth, 'If-None-Match': identity.headers['ETag']})
+        best = min(sizes + [len(identity.data)])
+        totals['identity'] += len(identity.data)
+        totals['best'] += best
+        saved = 1 - best / len(identity.data) if identity.data else 0
+        print(f"{path:<28}{len(identity.data):>10}" + ''.join(f"{s:>10}" for s in sizes)
+              + f"{revalidate.status_code:>8}{saved:>7.0%}")
+
+    overall = 1 - totals['best'] / totals['identity']
+    print(f"\nTotal {totals['identity']} B -> {totals['best']} B dengan kompresi ({overall:.0%} hemat); "
+          f"revalidasi 304 mengirim 0 B body.")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark serialisasi listing besar:
+  1. baseline  : sqlite3.Row -> dict -> jsonify stdlib
+  2. rowset    : tuple rows -> FastJSONProvider (orjson bila ada)
+  3. sqlite    : json_group_array dirangkai SQLite, diteruskan sebagai bytes
+
+Usage: python benchmarks/bench_json.py [--rows 100000] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+import database
+import serialization
+from serialization import FastJSONProvider, fetch_rowset, query_json_array
+
+QUERY = "SELECT nomor_klaim, faskes_id, tgl_pengajuan AS tanggal, total_biaya, status FROM klaim ORDER BY klaim_id"
+
+def _populate(rows):
+    conn = database.get_db_connection()
+    conn.executemany(
+        "INSERT INTO klaim (nomor_klaim, tgl_pengajuan, total_biaya, status, faskes_id, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        [(f"BENCH-{i}", '2025-01-01 10:00:00', 150000.0 + i, 'Pending', i % 5 + 1, '2025-01-01 10:00:00') for i in range(rows)])
+    conn.commit()
+    conn.close()
+
+def _timeit(fn, repeat):
+    best = float('inf')
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = len(fn())
+        best = min(best, time.perf_counter() - start)
+    return best, size
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='satria-bench-')
+    database.DATABASE_NAME = os.path.join(workdir, 'bench.db')
+    database.init_database()
+    _populate(args.rows)
+
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+
+    def baseline():
+        conn = database.get_db_connection()
+        data = [dict(row) for row in conn.execute(QUERY).fetchall()]
+        conn.close()
+        return json.dumps(data, sort_keys=True).encode('utf-8')
+
+    def rowset():
+        conn = database.get_db_connection()
+        data = fetch_rowset(conn, QUERY)
+        conn.close()
+        return app.json.dumps_bytes(data)
+
+    def sqlite_side():
+        conn = database.get_db_connection()
+        payload = query_json_array(conn, QUERY)
+        conn.close()
+        return payload
+
+    print(f"rows={args.rows} orjson={'yes' if serialization.ORJSON_AVAILABLE else 'no'}")
+    with app.app_context():
+        base_time = None
+        for name, fn in (('baseline', baseline), ('rowset', rowset), ('sqlite', sqlite_side)):
+            elapsed, size = _timeit(fn, args.repeat)
+            base_time = base_time or elapsed
+            print(f"  {name:<10} {elapsed * 1000:8.1f} ms  {size / 1024:8.0f} KiB  {base_time / elapsed:5.2f}x")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
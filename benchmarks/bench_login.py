@@ -0,0 +1,113 @@
+"""
+Benchmark login storm: login/detik dan latency dashboard yang berjalan
+bersamaan, tanpa login vs badai login dengan pool KDF selebar jumlah thread
+login (setara verifikasi langsung di thread request) vs pool KDF default.
+
+Usage: python benchmarks/bench_login.py [--users 20] [--login-threads 16] [--dashboard-threads 4] [--seconds 5]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('SATRIA_RATE_LIMIT', '0')
+for name in ('SATRIA_RISK_REFRESH_SECONDS', 'SATRIA_ANALYTICS_REFRESH_SECONDS',
+             'SATRIA_COLLUSION_INTERVAL_SECONDS', 'SATRIA_REPLICA_MAX_STALENESS'):
+    os.environ.setdefault(name, '0')
+
+from werkzeug.security import generate_password_hash
+
+import database
+import auth
+
+AUTH = {'Authorization': 'dev-token-12345'}
+
+def _create_users(count):
+    conn = database.get_primary_connection()
+    password_hash = generate_password_hash('bench-password')
+    conn.executemany(
+        "INSERT INTO users (user_id, username, email, password_hash, full_name, role) VALUES (?, ?, ?, ?, ?, 'user')",
+        [(str(uuid.uuid4()), f'verifier{i}', f'verifier{i}@bpjs.go.id', password_hash, f'Verifikator {i}')
+         for i in range(count)])
+    conn.commit()
+    conn.close()
+
+def _run(app, users, login_threads, dashboard_threads, seconds):
+    stop = threading.Event()
+    logins = []
+    latencies = []
+
+    def login_loop():
+        client = app.test_client()
+        while not stop.is_set():
+            r = client.post('/api/auth/login', json={'username': f'verifier{random.randrange(users)}',
+                                                     'password': 'bench-password'})
+            if r.status_code == 200:
+                logins.append(1)
+
+    def dashboard_loop():
+        client = app.test_client()
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.get('/api/dashboard/overview', headers=AUTH)
+            latencies.append(time.perf_counter() - started)
+
+    threads = ([threading.Thread(target=login_loop) for _ in range(login_threads)] +
+               [threading.Thread(target=dashboard_loop) for _ in range(dashboard_threads)])
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    latencies.sort()
+    return (len(logins) / seconds, statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.95)] * 1000)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--login-threads', type=int, default=16)
+    parser.add_argument('--dashboard-threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='satria-bench-')
+    database.DATABASE_NAME = os.path.join(workdir, 'bench.db')
+    database.init_database()
+    database.seed_sample_data()
+    _create_users(args.users)
+
+    import app as satria
+    app = satria.app
+    app.test_client().get('/api/dashboard/overview', headers=AUTH)
+
+    default_workers = auth.KDF_WORKERS
+    scenarios = [
+        ('tanpa login', 0, default_workers),
+        (f'pool KDF {args.login_threads} (inline)', args.login_threads, args.login_threads),
+        (f'pool KDF {default_workers} (default)', args.login_threads, default_workers),
+    ]
+    print(f"{'skenario':<26}{'login/s':>10}{'dash p50':>12}{'dash p95':>12}")
+    for name, login_threads, kdf_workers in scenarios:
+        auth.KDF_WORKERS = kdf_workers
+        auth._kdf_state['pid'] = None
+        rate, p50, p95 = _run(app, args.users, login_threads, args.dashboard_threads, args.seconds)
+        print(f"{name:<26}{rate:>10.1f}{p50:>10.1f}ms{p95:>10.1f}ms")
+
+    flushed = auth.last_login_buffer.flush()
+    print(f"\nlast_login: {flushed} user tertunda ditulis dalam satu transaksi "
+          f"(flush tiap {auth.LAST_LOGIN_FLUSH_SECONDS:g} detik, bukan satu UPDATE per login)")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark scorer model: waktu training, latency analyze_claim per klaim
+(rule murni vs rule + model) dan throughput inference per ukuran batch
+(NumPy vs loop Python, plus analyze_batch end-to-end).
+
+Usage: python benchmarks/bench_ml.py [--rows 100000] [--trees 60] [--depth 3]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import ml_scorer
+from fraud_engine import FraudDetectionEngine
+
+BATCH_SIZES = (1, 64, 512, 4096)
+
+def _populate(rows):
+    """Klaim sintetis; peluang alert naik dengan biaya, faskes tertentu, dan diagnosis kosong."""
+    conn = database.get_db_connection()
+    rng = random.Random(42)
+    claims = []
+    for i in range(rows):
+        faskes_id = rng.randint(1, 5)
+        diagnosis_id = rng.choice((1, 2, 3, None))
+        amount = rng.lognormvariate(15, 1.0)
+        claims.append((f"BENCH-{i}", f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 10:00:00",
+                       amount, faskes_id, diagnosis_id, '2025-01-01 10:00:00'))
+    conn.executemany(
+        "INSERT INTO klaim (nomor_klaim, tgl_pengajuan, total_biaya, status, faskes_id, diagnosis_id, created_at) VALUES (?, ?, ?, 'Pending', ?, ?, ?)",
+        claims)
+    conn.execute('''
+        INSERT INTO fraud_alert (klaim_id, alert_level, reason_code, ai_confidence, created_at, status)
+        SELECT klaim_id, 'High', 'Upcoding', 0.9, created_at, 'Open' FROM klaim
+        WHERE nomor_klaim LIKE 'BENCH-%'
+          AND (abs(random()) % 1000) < 20 + (total_biaya > 1.5e7) * 500 + (faskes_id = 2) * 150 + (diagnosis_id IS NULL) * 200
+    ''')
+    conn.commit()
+    conn.close()
+
+def _claims(n):
+    rng = random.Random(7)
+    conn = database.get_db_connection()
+    providers = [row['nama'] for row in conn.execute("SELECT nama FROM faskes")]
+    codes = [row['code'] for row in conn.execute("SELECT code FROM diagnosis")] + ['']
+    conn.close()
+    return [{'nomor_klaim': f"Q-{i}", 'total_biaya': rng.lognormvariate(15, 1.0),
+             'provider': rng.choice(providers), 'diagnosis_code': rng.choice(codes)} for i in range(n)]
+
+def _latency(fn, items):
+    samples = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2] * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+def _throughput(fn, rows, batch, min_seconds=0.5):
+    done, start = 0, time.perf_counter()
+    while time.perf_counter() - start < min_seconds:
+        for i in range(0, len(rows), batch):
+            fn(rows[i:i + batch])
+            done += len(rows[i:i + batch])
+    return done / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--trees', type=int, default=60)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--samples', type=int, default=5000, help='Klaim untuk pengukuran latency/throughput')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='satria-bench-')
+    database.DATABASE_NAME = os.path.join(workdir, 'bench.db')
+    database.init_database()
+    database.seed_sample_data()
+    _populate(args.rows)
+
+    conn = database.get_readonly_connection()
+    spec = ml_scorer.train(conn, args.trees, args.depth, sample=args.rows)
+    conn.close()
+    model_path = os.path.join(workdir, 'model.json')
+    ml_scorer.save_model(spec, model_path)
+    print(f"rows={args.rows} trees={args.trees} depth={args.depth} numpy={'yes' if ml_scorer.NUMPY_AVAILABLE else 'no'} "
+          f"blend={ml_scorer.BLEND_WEIGHT} train={spec['metrics']['fit_seconds']:.2f}s "
+          f"auc={spec['metrics']['holdout_auc']}")
+
+    claims = _claims(args.samples)
+    registry = ml_scorer.model_registry
+
+    # Latency per klaim (jalur POST /api/klaim)
+    registry.path = os.path.join(workdir, 'missing.json')
+    registry.reload()
+    rules_only = _latency(FraudDetectionEngine.analyze_claim, claims)
+    registry.path = model_path
+    model = registry.reload()
+    blended = _latency(FraudDetectionEngine.analyze_claim, claims)
+    print(f"\n{'analyze_claim':<24}{'p50 us':>10}{'p99 us':>10}")
+    print(f"{'rules only':<24}{rules_only[0]:>10.1f}{rules_only[1]:>10.1f}")
+    print(f"{'rules + model':<24}{blended[0]:>10.1f}{blended[1]:>10.1f}")
+
+    # Throughput inference per ukuran batch
+    rows = [model.feature_row(*FraudDetectionEngine._fire_rules(c)[:5]) for c in claims]
+    python_model = ml_scorer.GradientBoostedModel(spec, use_numpy=False)
+    print(f"\n{'batch':>6}{'python rows/s':>16}{'numpy rows/s':>16}{'analyze_batch/s':>18}")
+    for batch in BATCH_SIZES:
+        py_rate = _throughput(python_model.predict_proba, rows, batch)
+        np_rate = (_throughput(ml_scorer.GradientBoostedModel(spec, use_numpy=True).predict_proba, rows, batch)
+                   if ml_scorer.NUMPY_AVAILABLE else None)
+        engine_rate = _throughput(FraudDetectionEngine.analyze_batch, claims, batch)
+        np_text = f"{np_rate:>16,.0f}" if np_rate else f"{'-':>16}"
+        print(f"{batch:>6}{py_rate:>16,.0f}{np_text}{engine_rate:>18,.0f}")
+
+    shutil.rmtree(workdir)
+
+if __name__ == '__main__':
+    main()
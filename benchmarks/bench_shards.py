@@ -0,0 +1,101 @@
+"""
+Benchmark sharding regional: throughput tulis klaim (rows/s) dengan 1, 2
+dan 4 file shard. Beberapa proses writer menulis klaim dari faskes di
+seluruh wilayah, satu transaksi per klaim seperti POST /api/klaim mode
+sync; klaim di-route ke shard lewat claims.ShardWriter. Dengan satu file,
+semua writer antri di satu lock tulis SQLite; dengan N shard ada N lock.
+
+Usage: python benchmarks/bench_shards.py [--claims 4000] [--writers 4] [--shards 1,2,4]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from claims import save_scored_claim, ShardWriter
+
+REGIONS = ('Aceh', 'Sumatera Utara', 'DKI Jakarta', 'Jawa Barat', 'Jawa Timur', 'Bali', 'Sulawesi Selatan', 'Papua')
+ANALYSIS = {'is_fraud': False, 'risk_level': 'Low', 'fraud_type': 'Normal', 'confidence': 0.1, 'trace': None}
+
+def _spec(workdir, shards):
+    names = [f"s{i}" for i in range(shards)]
+    return {
+        'default': names[0],
+        'shards': {name: {'path': None if i == 0 else os.path.join(workdir, f"{name}.db"), 'id_base': i * 10 ** 12}
+                   for i, name in enumerate(names)},
+        'regions': {region: names[i % shards] for i, region in enumerate(REGIONS)},
+    }
+
+def _writer(args):
+    db_path, spec, worker, claims = args
+    database.DATABASE_NAME = db_path
+    database.shard_map.configure(spec)
+    rng = random.Random(worker)
+    catalog = database.get_primary_connection()
+    writer = ShardWriter(catalog)
+    try:
+        for i in range(claims):
+            data = {'nomor_klaim': f"B-{worker}-{i}", 'total_biaya': rng.lognormvariate(15, 1.0),
+                    'provider': f"RS {rng.choice(REGIONS)}", 'diagnosis_code': 'A09'}
+            ((shard, _),) = writer.route([data])
+            conn = writer.open(shard, [data])
+            save_scored_claim(conn.cursor(), data, ANALYSIS, id_base=shard.id_base)
+            conn.commit()
+    finally:
+        writer.close()
+        catalog.close()
+    return claims
+
+def run(shards, total_claims, writers):
+    workdir = tempfile.mkdtemp(prefix='satria-shards-')
+    try:
+        db_path = os.path.join(workdir, 'catalog.db')
+        spec = _spec(workdir, shards)
+        database.DATABASE_NAME = db_path
+        database.shard_map.configure(spec)
+        database.init_database()
+        database.init_shards()
+        conn = database.get_primary_connection()
+        conn.executemany("INSERT INTO faskes (nama, tipe, wilayah) VALUES (?, 'RS', ?)",
+                         [(f"RS {region}", region) for region in REGIONS])
+        conn.commit()
+        conn.close()
+
+        per_writer = total_claims // writers
+        started = time.perf_counter()
+        with multiprocessing.Pool(writers) as pool:
+            written = sum(pool.map(_writer, [(db_path, spec, w, per_writer) for w in range(writers)]))
+        elapsed = time.perf_counter() - started
+
+        counts = [database.get_shard_connection(shard).execute("SELECT COUNT(*) FROM klaim").fetchone()[0]
+                  for shard in database.shard_map.shards]
+        assert sum(counts) == written
+        return written / elapsed, counts
+    finally:
+        shutil.rmtree(workdir)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--claims', type=int, default=4000)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--shards', default='1,2,4')
+    args = parser.parse_args()
+
+    print(f"claims={args.claims} writers={args.writers} cpus={os.cpu_count()}")
+    print(f"{'shards':>6}{'rows/s':>12}{'speedup':>10}  klaim per shard")
+    baseline = None
+    for shards in (int(n) for n in args.shards.split(',')):
+        rate, counts = run(shards, args.claims, args.writers)
+        baseline = baseline or rate
+        print(f"{shards:>6}{rate:>12,.0f}{rate / baseline:>9.2f}x  {counts}")
+
+if __name__ == '__main__':
+    main()
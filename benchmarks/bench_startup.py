@@ -0,0 +1,99 @@
+"""
+Benchmark startup: waktu import app.py, request pertama (inisialisasi lazy),
+dan boot worker ala gunicorn --preload (app di-import master lalu fork)
+dibanding tanpa preload (tiap worker meng-import app sendiri setelah fork).
+
+Usage: python benchmarks/bench_startup.py [--workers 4] [--repeat 3]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Yang diukur boot app, bukan job latar belakang
+for name in ('SATRIA_RISK_REFRESH_SECONDS', 'SATRIA_ANALYTICS_REFRESH_SECONDS',
+             'SATRIA_COLLUSION_INTERVAL_SECONDS', 'SATRIA_REPLICA_MAX_STALENESS'):
+    os.environ.setdefault(name, '0')
+
+import database
+
+AUTH = {'Authorization': 'dev-token-12345'}
+PROBE = '/api/dashboard/overview'
+
+IMPORT_SNIPPET = """
+import sys, time, json
+sys.path.insert(0, {root!r})
+import database
+database.DATABASE_NAME = {db!r}
+started = time.perf_counter()
+import app as satria
+imported = time.perf_counter()
+satria.app.test_client().get({probe!r}, headers={auth!r})
+print(json.dumps([imported - started, time.perf_counter() - imported]))
+"""
+
+def _subprocess_import(db):
+    """(detik import, detik request pertama) di interpreter baru."""
+    code = IMPORT_SNIPPET.format(root=ROOT, db=db, probe=PROBE, auth=AUTH)
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def _boot_workers(count, preload):
+    """Fork `count` worker; tiap worker melaporkan detik sejak fork sampai request pertama selesai."""
+    if preload:
+        import app as satria
+    pipes = []
+    forked_at = time.perf_counter()
+    for _ in range(count):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            if not preload:
+                import app as satria
+            satria.app.test_client().get(PROBE, headers=AUTH)
+            os.write(write_fd, str(time.perf_counter() - forked_at).encode())
+            os._exit(0)
+        os.close(write_fd)
+        pipes.append((pid, read_fd))
+
+    times = []
+    for pid, read_fd in pipes:
+        with os.fdopen(read_fd) as f:
+            times.append(float(f.read()))
+        os.waitpid(pid, 0)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='satria-bench-')
+    database.DATABASE_NAME = os.path.join(workdir, 'bench.db')
+    database.init_database()
+    database.seed_sample_data()
+
+    runs = [_subprocess_import(database.DATABASE_NAME) for _ in range(args.repeat)]
+    print(f"import app.py          {statistics.median(r[0] for r in runs) * 1000:8.1f} ms  (tanpa akses database)")
+    print(f"request pertama        {statistics.median(r[1] for r in runs) * 1000:8.1f} ms  (cek skema + seed + start thread)")
+
+    # Tanpa preload dulu: proses ini belum meng-import app
+    for label, preload in (('fork tanpa preload', False), ('gunicorn --preload', True)):
+        times = _boot_workers(args.workers, preload)
+        print(f"{label:<22} {statistics.median(times) * 1000:8.1f} ms median, "
+              f"{max(times) * 1000:8.1f} ms sampai {args.workers} worker siap")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
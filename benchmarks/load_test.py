@@ -0,0 +1,154 @@
+"""
+Load Test: bandingkan batas concurrency antar mode serving.
+
+Jalankan server yang ingin dibandingkan, misalnya:
+    python app.py                                                  # dev server (port 5000)
+    uvicorn asgi:application --port 8000 --workers 4               # ASGI mode
+
+Lalu:
+    python benchmarks/load_test.py \
+        --target dev=http://127.0.0.1:5000 --target asgi=http://127.0.0.1:8000 \
+        --path /api/dashboard/overview --concurrency 1,8,32,128 --requests 1000
+
+Cek response streaming multi-chunk di bawah concurrency (body dialirkan
+generator yang memegang request context + koneksi SQLite): import CSV
+paralel lewat /api/klaim/import lalu baca /api/cdc/changes paralel.
+    python benchmarks/load_test.py --target asgi=http://127.0.0.1:8000 --stream-check --concurrency 6
+"""
+
+import argparse
+import http.client
+import json
+import statistics
+import time
+import uuid
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+TOKEN = 'dev-token-12345'
+
+def _one_request(url, timeout):
+    req = urllib.request.Request(url, headers={'Authorization': TOKEN})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            ok = 200 <= resp.status < 400
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def run_level(url, concurrency, total_requests, timeout):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        results = list(pool.map(lambda _: _one_request(url, timeout), range(total_requests)))
+        elapsed = time.perf_counter() - started
+    latencies = sorted(lat for lat, ok in results if ok)
+    errors = sum(1 for _, ok in results if not ok)
+    return {
+        'rps': len(latencies) / elapsed if elapsed else 0,
+        'p50': _percentile(latencies, 50) * 1000,
+        'p95': _percentile(latencies, 95) * 1000,
+        'p99': _percentile(latencies, 99) * 1000,
+        'mean': (statistics.mean(latencies) * 1000) if latencies else 0,
+        'errors': errors,
+    }
+
+def _stream_changes(base_url, limit, timeout):
+    """Satu GET /api/cdc/changes; kembalikan (jumlah baris, error). Body harus lengkap dan urut seq."""
+    req = urllib.request.Request(f"{base_url}/api/cdc/changes?after=0&limit={limit}", headers={'Authorization': TOKEN})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            lines = resp.read().splitlines()
+        seqs = [json.loads(line)['seq'] for line in lines]
+    except (urllib.error.URLError, OSError, http.client.HTTPException, ValueError) as e:
+        return 0, str(e)
+    if seqs != sorted(seqs):
+        return len(seqs), 'seq tidak urut'
+    return len(seqs), None
+
+def _stream_import(base_url, rows, chunk_rows, timeout):
+    """Satu import CSV (rows baris, chunk_rows per chunk); kembalikan (klaim terimport, error)."""
+    prefix = uuid.uuid4().hex[:8]
+    csv_body = "nomor_klaim,total_biaya,diagnosis_code\n" + "".join(
+        f"LT-{prefix}-{i},{1500000 + i},A09\n" for i in range(rows))
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"lt.csv\"\r\n"
+            f"Content-Type: text/csv\r\n\r\n{csv_body}\r\n--{boundary}--\r\n").encode('utf-8')
+    req = urllib.request.Request(f"{base_url}/api/klaim/import?chunk_rows={chunk_rows}", data=body, method='POST',
+                                 headers={'Authorization': TOKEN,
+                                          'Content-Type': f"multipart/form-data; boundary={boundary}"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            events = [json.loads(line) for line in resp.read().splitlines()]
+    except (urllib.error.URLError, OSError, http.client.HTTPException, ValueError) as e:
+        return 0, str(e)
+    last = events[-1] if events else {}
+    if last.get('event') != 'done':
+        return 0, f"event terakhir {last.get('event')}: {last}"
+    return last.get('imported', 0), None
+
+def import_check(base_url, concurrency, timeout, rows=600, chunk_rows=50):
+    """Import CSV multi-chunk paralel; semua harus selesai (event done) dengan seluruh baris terimport."""
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: _stream_import(base_url, rows, chunk_rows, timeout), range(concurrency)))
+    errors = [err for _, err in results if err]
+    errors += [f"{count}/{rows} baris terimport" for count, err in results if not err and count != rows]
+    return {'requests': len(results), 'errors': errors, 'rows': sorted({c for c, _ in results})}
+
+def stream_check(base_url, concurrency, timeout, limit=20000):
+    """GET /api/cdc/changes paralel; semua harus sukses dan mengembalikan jumlah baris yang sama."""
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: _stream_changes(base_url, limit, timeout), range(concurrency * 2)))
+    errors = [err for _, err in results if err]
+    counts = {count for count, err in results if not err}
+    return {'requests': len(results), 'errors': errors, 'rows': sorted(counts),
+            'consistent': len(counts) <= 1}
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test SATRIA JKN API")
+    parser.add_argument('--target', action='append', required=True, help='label=base_url (boleh berulang)')
+    parser.add_argument('--path', default='/api/dashboard/overview')
+    parser.add_argument('--concurrency', default='1,8,32,128')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--stream-check', action='store_true',
+                        help='Cek streaming multi-chunk paralel (import CSV + /api/cdc/changes), bukan latency; menulis klaim uji')
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(',')]
+    if args.stream_check:
+        # Satu chunk CDC = cdc.STREAM_CHUNK_ROWS (2000) baris; butuh change_log lebih besar untuk multi-chunk
+        failed = False
+        for target in args.target:
+            label, base_url = target.split('=', 1)
+            for concurrency in levels:
+                r = import_check(base_url.rstrip('/'), concurrency, args.timeout)
+                ok = not r['errors']
+                failed = failed or not ok
+                print(f"{'✅' if ok else '❌'} {label} import x{concurrency}: {r['requests']} request, "
+                      f"terimport {r['rows']}, {len(r['errors'])} error {r['errors'][:3]}")
+                r = stream_check(base_url.rstrip('/'), concurrency, args.timeout)
+                ok = not r['errors'] and r['consistent']
+                failed = failed or not ok
+                print(f"{'✅' if ok else '❌'} {label} cdc x{concurrency}: {r['requests']} request, "
+                      f"baris {r['rows']}, {len(r['errors'])} error {r['errors'][:3]}")
+        raise SystemExit(1 if failed else 0)
+
+    print(f"{'target':<10}{'conc':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for target in args.target:
+        label, base_url = target.split('=', 1)
+        url = base_url.rstrip('/') + args.path
+        for concurrency in levels:
+            r = run_level(url, concurrency, args.requests, args.timeout)
+            print(f"{label:<10}{concurrency:>6}{r['rps']:>10.1f}{r['p50']:>10.1f}{r['p95']:>10.1f}{r['p99']:>10.1f}{r['errors']:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Change Data Capture klaim & fraud_alert
+Setiap insert/update/delete klaim dan fraud_alert dicatat trigger ke
+change_log dengan seq monoton (lihat database._create_change_log); baris
+yang dipindah job retensi ke arsip tercatat dengan op 'archive', bukan
+'delete', agar konsumen bisa membedakannya dari penghapusan sungguhan. Sistem
+hilir membaca perubahan setelah seq tertentu dalam batch besar sebagai
+NDJSON, lalu menyimpan offset-nya di cdc_consumer; baca berikutnya bisa
+dilanjutkan dari offset itu tanpa polling /api/klaim dan diff.
+
+Kompaksi log: untuk entri di bawah offset terkecil semua konsumen
+terdaftar (dan lebih tua dari SATRIA_CDC_RETAIN_HOURS), hanya perubahan
+terakhir per baris yang disimpan; tombstone delete/archive dibuang setelah
+SATRIA_CDC_TOMBSTONE_DAYS. Konsumen terdaftar tidak pernah kehilangan
+perubahan, sedangkan pembaca baru dari seq 0 mendapat keadaan terkini.
+
+Run with: python cdc.py --tail --after 0 (atau --compact)
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from database import get_primary_connection, init_database, CDC_COLUMNS
+
+RETAIN_HOURS = float(os.environ.get('SATRIA_CDC_RETAIN_HOURS', 24))
+TOMBSTONE_DAYS = float(os.environ.get('SATRIA_CDC_TOMBSTONE_DAYS', 7))
+DEFAULT_LIMIT = 10000
+MAX_LIMIT = 100000
+STREAM_CHUNK_ROWS = 2000
+COMPACT_BATCH_SEQS = 5000   # Rentang seq per transaksi hapus kompaksi
+PAUSE_SECONDS = 0.01
+
+# Satu baris NDJSON dirangkai langsung oleh SQLite
+_CHANGE_JSON = ("json_object('seq', seq, 'table', tbl, 'op', op, 'id', row_id, "
+                "'changed_at', changed_at, 'data', json(data))")
+
+def head_seq(conn):
+    """seq perubahan terakhir yang pernah dibuat (0 bila belum ada), tetap walau entrinya dikompaksi."""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return row[0] if row else 0
+
+def check_tables(tables):
+    """ValueError bila ada nama tabel di luar CDC_COLUMNS."""
+    unknown = [t for t in tables or () if t not in CDC_COLUMNS]
+    if unknown:
+        raise ValueError(f"Tabel CDC tidak dikenal: {', '.join(unknown)} (pilihan: {', '.join(CDC_COLUMNS)})")
+
+def iter_changes(conn, after=0, limit=DEFAULT_LIMIT, tables=None):
+    """
+    Baris NDJSON (bytes, diakhiri newline) untuk perubahan dengan seq > after,
+    urut seq, maksimal `limit`. tables membatasi ke sebagian CDC_COLUMNS
+    (validasi dengan check_tables sebelum iterasi; generator baru memeriksa
+    saat langkah pertama).
+    """
+    check_tables(tables)
+    query = f"SELECT {_CHANGE_JSON} FROM change_log WHERE seq > ?"
+    params = [after]
+    if tables:
+        query += f" AND tbl IN ({', '.join('?' for _ in tables)})"
+        params.extend(tables)
+    query += " ORDER BY seq LIMIT ?"
+    params.append(min(max(limit, 1), MAX_LIMIT))
+
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(query, params)
+    while True:
+        chunk = cursor.fetchmany(STREAM_CHUNK_ROWS)
+        if not chunk:
+            return
+        yield "".join(row[0] + "\n" for row in chunk).encode('utf-8')
+
+# ============================================
+# OFFSET KONSUMEN
+# ============================================
+
+def consumer_offset(conn, name):
+    row = conn.execute("SELECT seq FROM cdc_consumer WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else None
+
+def commit_offset(conn, name, seq):
+    """Simpan offset konsumen; offset tidak pernah mundur. Mengembalikan offset tersimpan."""
+    if seq < 0 or seq > head_seq(conn):
+        raise ValueError("seq harus antara 0 dan seq terakhir change_log")
+    conn.execute('''
+        INSERT INTO cdc_consumer (name, seq, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET seq = MAX(seq, excluded.seq), updated_at = excluded.updated_at
+    ''', (name, seq, time.time()))
+    conn.commit()
+    return consumer_offset(conn, name)
+
+def drop_consumer(conn, name):
+    """Hapus konsumen yang ditinggalkan agar tidak menahan kompaksi."""
+    removed = conn.execute("DELETE FROM cdc_consumer WHERE name = ?", (name,)).rowcount
+    conn.commit()
+    return removed > 0
+
+def list_consumers(conn):
+    head = head_seq(conn)
+    rows = conn.execute("SELECT name, seq, updated_at FROM cdc_consumer ORDER BY name").fetchall()
+    return {'head_seq': head,
+            'consumers': [{'name': row[0], 'seq': row[1], 'lag': head - row[1], 'updated_at': row[2]}
+                          for row in rows]}
+
+# ============================================
+# KOMPAKSI
+# ============================================
+
+def compaction_bound(conn, now=None):
+    """seq tertinggi yang boleh dikompaksi: di bawah semua offset konsumen dan jendela retensi penuh."""
+    now = now or time.time()
+    # seq naik seiring waktu, jadi scan mundur dari ujung log berhenti di jendela retensi
+    row = conn.execute("SELECT seq FROM change_log WHERE changed_at < ? ORDER BY seq DESC LIMIT 1",
+                       (now - RETAIN_HOURS * 3600,)).fetchone()
+    bound = row[0] if row else 0
+    consumers = conn.execute("SELECT MIN(seq) FROM cdc_consumer").fetchone()[0]
+    return bound if consumers is None else min(bound, consumers)
+
+def compact_log(conn, now=None):
+    """
+    Buang entri yang sudah digantikan perubahan lebih baru untuk baris yang
+    sama (keduanya <= bound), serta tombstone delete/archive yang kedaluwarsa.
+    Berjalan per rentang seq dalam transaksi pendek agar writer tidak tertahan.
+    """
+    started = time.perf_counter()
+    now = now or time.time()
+    bound = compaction_bound(conn, now)
+    first = conn.execute("SELECT MIN(seq) FROM change_log").fetchone()[0]
+    removed = 0
+    lo = (first or 1) - 1
+    while first is not None and lo < bound:
+        hi = min(lo + COMPACT_BATCH_SEQS, bound)
+        removed += conn.execute('''
+            DELETE FROM change_log WHERE seq IN (
+                SELECT c.seq FROM change_log c
+                WHERE c.seq > ? AND c.seq <= ?
+                  AND (EXISTS (SELECT 1 FROM change_log n
+                               WHERE n.tbl = c.tbl AND n.row_id = c.row_id AND n.seq > c.seq AND n.seq <= ?)
+                       OR (c.op IN ('delete', 'archive') AND c.changed_at < ?))
+            )
+        ''', (lo, hi, bound, now - TOMBSTONE_DAYS * 86400)).rowcount
+        conn.commit()
+        lo = hi
+        time.sleep(PAUSE_SECONDS)
+    return {'bound_seq': bound, 'removed': removed,
+            'remaining': conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0],
+            'seconds': round(time.perf_counter() - started, 3)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Change data capture SATRIA JKN")
+    parser.add_argument('--tail', action='store_true', help='Tulis perubahan sebagai NDJSON ke stdout')
+    parser.add_argument('--after', type=int, default=0, help='Mulai setelah seq ini')
+    parser.add_argument('--limit', type=int, default=MAX_LIMIT)
+    parser.add_argument('--compact', action='store_true', help='Kompaksi change_log sekarang')
+    args = parser.parse_args()
+    if not (args.tail or args.compact):
+        parser.print_help()
+    else:
+        init_database()
+        conn = get_primary_connection()
+        try:
+            if args.tail:
+                for chunk in iter_changes(conn, args.after, args.limit):
+                    sys.stdout.buffer.write(chunk)
+            if args.compact:
+                result = compact_log(conn)
+                print(f"✅ change_log dikompaksi sampai seq {result['bound_seq']}: {result['removed']} entri dibuang, "
+                      f"{result['remaining']} tersisa ({result['seconds']} detik)")
+        finally:
+            conn.close()
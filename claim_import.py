@@ -0,0 +1,323 @@
+"""
+Import Klaim dari File CSV/XLSX
+Klaim dari faskes datang sebagai spreadsheet. File dibaca baris per baris
+(csv.reader / openpyxl read-only), divalidasi dan diskor FraudDetectionEngine
+per chunk berukuran tetap, lalu tiap chunk ditulis dalam satu transaksi
+singkat. Memori konstan berapa pun jumlah barisnya: yang ditahan hanya satu
+chunk, error per baris langsung dilaporkan sebagai event, bukan dikumpulkan.
+
+Event (dict) yang dihasilkan import_claims():
+- {'event': 'error', 'row': n, 'nomor_klaim': ..., 'error': ...}
+- {'event': 'progress', 'rows': ..., 'imported': ..., 'failed': ..., ...}
+- {'event': 'done', ...} atau {'event': 'aborted', ...} bila file rusak di tengah
+
+Run with: python claim_import.py klaim.csv [--errors error.csv]
+"""
+
+import argparse
+import csv
+import io
+import os
+import sqlite3
+import sys
+import time
+import zipfile
+from datetime import date, datetime
+from functools import lru_cache
+
+from database import get_primary_connection, init_database, init_shards, begin_immediate
+from fraud_engine import FraudDetectionEngine
+from feature_store import lookup as lookup_features
+from claims import save_scored_claim, ShardWriter
+
+CHUNK_ROWS = int(os.environ.get('SATRIA_IMPORT_CHUNK_ROWS', 500))
+MAX_CHUNK_ROWS = 5000
+IMPORT_FORMATS = ('csv', 'xlsx')
+REQUIRED_COLUMNS = ('nomor_klaim', 'total_biaya')
+
+# Nama kolom di file faskes -> field payload POST /api/klaim
+COLUMN_ALIASES = {
+    'no_klaim': 'nomor_klaim',
+    'biaya': 'total_biaya',
+    'faskes': 'provider',
+    'nama_faskes': 'provider',
+    'diagnosis': 'diagnosis_code',
+    'kode_diagnosis': 'diagnosis_code',
+    'tanggal': 'tgl_pengajuan',
+}
+
+class ImportFormatError(Exception):
+    """File tidak bisa dibaca atau header tidak lengkap; tidak ada baris yang ditulis."""
+
+@lru_cache(maxsize=None)
+def load_openpyxl():
+    """Import openpyxl saat file XLSX pertama diimport; None bila tidak terpasang."""
+    try:
+        import openpyxl
+    except ImportError:
+        return None
+    return openpyxl
+
+# ============================================
+# PEMBACA FILE (streaming)
+# ============================================
+
+def _normalize_header(header):
+    columns = []
+    for name in header:
+        key = str(name or '').strip().lower().replace(' ', '_')
+        columns.append(COLUMN_ALIASES.get(key, key))
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise ImportFormatError(f"Kolom wajib tidak ada: {', '.join(missing)}")
+    return columns
+
+def _iter_csv(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        header_line = text.readline()
+    except UnicodeDecodeError as e:
+        raise ImportFormatError(f"File CSV harus UTF-8: {e}")
+    # Ekspor Excel berlocale Indonesia memakai ';' sebagai pemisah
+    delimiter = ';' if header_line.count(';') > header_line.count(',') else ','
+    columns = _normalize_header(next(csv.reader([header_line], delimiter=delimiter), []))
+    reader = csv.reader(text, delimiter=delimiter)
+
+    def rows():
+        for values in reader:
+            if any(values):
+                # line_num reader dimulai setelah baris header
+                yield reader.line_num + 1, dict(zip(columns, values))
+    return rows()
+
+def _iter_xlsx(stream):
+    openpyxl = load_openpyxl()
+    if openpyxl is None:
+        raise ImportFormatError("Library openpyxl belum diinstall di server")
+    try:
+        workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError, OSError, openpyxl.utils.exceptions.InvalidFileException) as e:
+        raise ImportFormatError(f"File XLSX tidak valid: {e}")
+    sheet_rows = workbook.active.iter_rows(values_only=True)
+    try:
+        columns = _normalize_header(next(sheet_rows, ()))
+    except ImportFormatError:
+        workbook.close()
+        raise
+
+    def rows():
+        try:
+            for line, values in enumerate(sheet_rows, start=2):
+                if any(v is not None and v != '' for v in values):
+                    yield line, dict(zip(columns, values))
+        finally:
+            # Mode read-only menahan file zip tetap terbuka sampai ditutup
+            workbook.close()
+    return rows()
+
+def open_rows(stream, fmt):
+    """Iterator (nomor baris, dict kolom) dari file. Header divalidasi di sini."""
+    if fmt == 'csv':
+        return _iter_csv(stream)
+    if fmt == 'xlsx':
+        return _iter_xlsx(stream)
+    raise ImportFormatError(f"Format harus salah satu dari: {', '.join(IMPORT_FORMATS)}")
+
+# ============================================
+# VALIDASI & SCORING
+# ============================================
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # Angka dari sel XLSX (mis. nomor kartu) tanpa ".0"
+        value = int(value)
+    return str(value).strip()
+
+def parse_row(record):
+    """Baris file -> (payload klaim, tgl_pengajuan atau None). ValueError bila tidak valid."""
+    nomor_klaim = _text(record.get('nomor_klaim'))
+    if not nomor_klaim:
+        raise ValueError("nomor_klaim kosong")
+
+    raw_biaya = record.get('total_biaya')
+    try:
+        total_biaya = float(raw_biaya if isinstance(raw_biaya, (int, float)) else _text(raw_biaya))
+    except ValueError:
+        raise ValueError(f"total_biaya bukan angka: {raw_biaya!r}")
+    if total_biaya < 0 or total_biaya != total_biaya:
+        raise ValueError(f"total_biaya tidak valid: {raw_biaya!r}")
+
+    tgl = record.get('tgl_pengajuan')
+    if isinstance(tgl, datetime):
+        tgl = tgl.strftime('%Y-%m-%d %H:%M:%S')
+    elif isinstance(tgl, date):
+        tgl = tgl.strftime('%Y-%m-%d 00:00:00')
+    elif _text(tgl):
+        try:
+            tgl = datetime.fromisoformat(_text(tgl)).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            raise ValueError(f"tgl_pengajuan bukan tanggal ISO: {tgl!r}")
+    else:
+        tgl = None
+
+    data = {
+        'nomor_klaim': nomor_klaim,
+        'total_biaya': total_biaya,
+        'provider': _text(record.get('provider')) or None,
+        'diagnosis_code': _text(record.get('diagnosis_code')),
+        'no_kartu': _text(record.get('no_kartu')) or None,
+    }
+    return data, tgl
+
+def _write_chunk(conn, scored, admission, id_base=0):
+    """
+    Tulis satu chunk dalam satu transaksi; tiap baris di SAVEPOINT agar
+    nomor_klaim duplikat hanya menggagalkan baris itu. Mengembalikan
+    (jumlah tertulis, jumlah anomali, daftar (baris, nomor_klaim, error)).
+    """
+    if admission is not None:
+        # Backpressure: chunk import antri di admission controller yang sama
+        # dengan request tulis biasa, jadi melambat saat latency tulis naik
+        while not admission.acquire():
+            time.sleep(admission.retry_after())
+    started = time.perf_counter()
+    written, anomalous, errors = 0, 0, []
+    cursor = conn.cursor()
+    try:
+        begin_immediate(cursor)
+        for line, data, analysis, tgl in scored:
+            cursor.execute("SAVEPOINT import_row")
+            try:
+                save_scored_claim(cursor, data, analysis, tgl, id_base)
+                cursor.execute("RELEASE SAVEPOINT import_row")
+            except sqlite3.IntegrityError:
+                cursor.execute("ROLLBACK TO SAVEPOINT import_row")
+                cursor.execute("RELEASE SAVEPOINT import_row")
+                errors.append((line, data['nomor_klaim'], 'nomor_klaim sudah terdaftar'))
+                continue
+            written += 1
+            anomalous += analysis['is_fraud']
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if admission is not None:
+            admission.release(time.perf_counter() - started)
+    return written, anomalous, errors
+
+def import_claims(conn, rows, chunk_rows=CHUNK_ROWS, admission=None):
+    """
+    Generator event import. Baris dibaca dari iterator `rows` (lihat
+    open_rows) sebanyak chunk_rows, diskor sebagai satu batch di luar
+    transaksi, lalu ditulis.
+    Chunk yang sudah di-commit tetap tersimpan bila import berhenti di tengah.
+    """
+    stats = {'rows': 0, 'imported': 0, 'anomalous': 0, 'failed': 0}
+    started = time.perf_counter()
+
+    def summary(event):
+        elapsed = time.perf_counter() - started
+        return dict(stats, event=event, seconds=round(elapsed, 3),
+                    rows_per_second=round(stats['rows'] / elapsed, 1) if elapsed else 0)
+
+    rows = iter(rows)
+    writer = ShardWriter(conn)
+    try:
+        yield from _import_chunks(rows, writer, stats, summary, chunk_rows, admission)
+    finally:
+        writer.close()
+
+def _import_chunks(rows, writer, stats, summary, chunk_rows, admission):
+    while True:
+        parsed, exhausted, broken = [], True, None
+        try:
+            for line, record in rows:
+                stats['rows'] += 1
+                try:
+                    data, tgl = parse_row(record)
+                except ValueError as e:
+                    stats['failed'] += 1
+                    yield {'event': 'error', 'row': line, 'nomor_klaim': _text(record.get('nomor_klaim')),
+                           'error': str(e)}
+                    continue
+                parsed.append((line, data, tgl))
+                if len(parsed) >= chunk_rows:
+                    exhausted = False
+                    break
+        except (csv.Error, UnicodeDecodeError, zipfile.BadZipFile) as e:
+            broken = f"File rusak setelah baris ke-{stats['rows']}: {e}"
+
+        if parsed:
+            errors = []
+            # Dengan sharding, chunk dipecah per shard tujuan (wilayah faskes)
+            for shard, indices in writer.route([data for _, data, _ in parsed]):
+                group = [parsed[i] for i in indices]
+                items = [data for _, data, _ in group]
+                shard_conn = writer.open(shard, items)
+                # Satu panggilan engine per chunk: model (bila aktif) diskor sebagai batch
+                features = lookup_features(shard_conn.cursor(), items, as_of=[tgl for _, _, tgl in group])
+                analyses = FraudDetectionEngine.analyze_batch(items, features)
+                scored = [(line, data, analysis, tgl) for (line, data, tgl), analysis in zip(group, analyses)]
+                written, anomalous, shard_errors = _write_chunk(shard_conn, scored, admission, shard.id_base)
+                stats['imported'] += written
+                stats['anomalous'] += anomalous
+                errors.extend(shard_errors)
+            stats['failed'] += len(errors)
+            for line, nomor_klaim, error in sorted(errors):
+                yield {'event': 'error', 'row': line, 'nomor_klaim': nomor_klaim, 'error': error}
+        if broken:
+            yield dict(summary('aborted'), error=broken)
+            return
+        if exhausted:
+            yield summary('done')
+            return
+        yield summary('progress')
+
+# ============================================
+# CLI
+# ============================================
+
+def import_file(path, fmt=None, chunk_rows=CHUNK_ROWS, errors_path=None):
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    conn = get_primary_connection()
+    error_file = open(errors_path, 'w', newline='', encoding='utf-8') if errors_path else None
+    error_writer = csv.writer(error_file) if error_file else None
+    if error_writer:
+        error_writer.writerow(['row', 'nomor_klaim', 'error'])
+    try:
+        with open(path, 'rb') as stream:
+            for event in import_claims(conn, open_rows(stream, fmt), chunk_rows):
+                if event['event'] == 'error':
+                    if error_writer:
+                        error_writer.writerow([event['row'], event['nomor_klaim'], event['error']])
+                    continue
+                print(f"\r📥 {event['rows']} baris | {event['imported']} masuk | {event['anomalous']} anomali | "
+                      f"{event['failed']} gagal | {event['rows_per_second']:.0f} baris/detik", end='', flush=True)
+                if event['event'] != 'progress':
+                    print()
+                    if event['event'] == 'aborted':
+                        print(f"❌ {event['error']}")
+                    return event
+    finally:
+        conn.close()
+        if error_file:
+            error_file.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import klaim dari file CSV/XLSX ke SATRIA JKN")
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=IMPORT_FORMATS, help='Default: dari ekstensi file')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--errors', help='Tulis error per baris ke file CSV ini')
+    args = parser.parse_args()
+    init_database()
+    init_shards()
+    try:
+        result = import_file(args.path, args.format, min(max(args.chunk_rows, 1), MAX_CHUNK_ROWS), args.errors)
+    except ImportFormatError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    sys.exit(0 if result['event'] == 'done' else 1)
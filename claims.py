@@ -0,0 +1,115 @@
+import uuid
+from datetime import datetime
+
+from database import (faskes_cache, diagnosis_cache, peserta_cache, shard_map, region_cache,
+                      get_shard_connection)
+from fraud_engine import pack_trace
+
+# ============================================
+# PENYIMPANAN KLAIM TERANALISIS
+# ============================================
+# Dipakai bersama oleh POST /api/klaim (mode sync) dan worker antrian
+# scoring, supaya klaim yang masuk lewat jalur mana pun tercatat sama.
+
+def save_scored_claim(cursor, data, analysis, tgl=None, id_base=0):
+    """
+    Simpan klaim + fraud_alert + audit_trail hasil analisis engine.
+    Tidak melakukan commit; pemanggil yang mengatur transaksi.
+    id_base: awal rentang id shard tujuan (lihat database.ShardMap).
+    Mengembalikan klaim_id (INTEGER).
+    """
+    tgl = tgl or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    status = 'Anomalous' if analysis['is_fraud'] else 'Pending'
+    faskes_id = faskes_cache.id_for(cursor, data.get('provider'))
+    diagnosis_id = diagnosis_cache.id_for(cursor, data.get('diagnosis_code'))
+    peserta_id = peserta_cache.id_for(cursor, data.get('no_kartu'))
+
+    cursor.execute('''
+        INSERT INTO klaim (klaim_id, nomor_klaim, tgl_pengajuan, total_biaya, status, faskes_id, diagnosis_id, created_at, peserta_id)
+        VALUES ((SELECT MAX(COALESCE(MAX(klaim_id), 0), ?) + 1 FROM klaim), ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (id_base, data.get('nomor_klaim'), tgl, data.get('total_biaya'), status, faskes_id, diagnosis_id, tgl, peserta_id))
+    klaim_id = cursor.lastrowid
+
+    # Jika Fraud, Buat Alert & Log Audit Otomatis
+    if analysis['is_fraud']:
+        cursor.execute('''
+            INSERT INTO fraud_alert (alert_id, klaim_id, alert_level, reason_code, ai_confidence, trace, created_at, status, action)
+            VALUES ((SELECT MAX(COALESCE(MAX(alert_id), 0), ?) + 1 FROM fraud_alert), ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (id_base, klaim_id, analysis['risk_level'], analysis['fraud_type'],
+              analysis['confidence'], pack_trace(analysis['trace']), tgl, 'Open', 'Auto-Flagged'))
+
+        # Log Audit: AI mendeteksi sesuatu
+        cursor.execute('''
+            INSERT INTO audit_trail (audit_id, entity, entity_id, action, user, details, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (str(uuid.uuid4()), 'AI Sentinel', str(klaim_id), 'DETECTED', 'System', f"AI detected {analysis['fraud_type']} risk", tgl))
+
+    return klaim_id
+
+# ============================================
+# ROUTING SHARD REGIONAL
+# ============================================
+
+# (cache dimensi, field payload) yang disalin ke shard sebelum klaim ditulis
+REPLICATED_DIMENSIONS = ((faskes_cache, 'provider'), (diagnosis_cache, 'diagnosis_code'), (peserta_cache, 'no_kartu'))
+
+class ShardWriter:
+    """
+    Koneksi tulis per shard untuk satu request/chunk import/batch antrian.
+    Tanpa SATRIA_SHARD_MAP semua klaim masuk satu grup dengan koneksi
+    katalog itu sendiri, jadi jalur non-shard tidak berubah.
+
+    Baris dimensi selalu dibuat di katalog (sumber id), di-commit, lalu
+    disalin dengan id yang sama ke shard. Dengan begitu DimensionCache yang
+    dipakai bersama semua shard tetap konsisten.
+    """
+
+    def __init__(self, catalog_conn):
+        self.catalog = catalog_conn
+        self._conns = {}
+
+    def route(self, items):
+        """[(shard, [index item])] berdasarkan wilayah faskes; faskes baru masuk shard default."""
+        if not shard_map.enabled:
+            return [(shard_map.default, list(range(len(items))))]
+        cursor = self.catalog.cursor()
+        faskes = faskes_cache.ids_for(cursor, [data.get('provider') for data in items])
+        groups = {}
+        for i, data in enumerate(items):
+            provider = data.get('provider')
+            faskes_id = faskes.get(provider) if isinstance(provider, (str, int)) else None
+            shard = shard_map.for_region(region_cache.region_for(cursor, faskes_id))
+            groups.setdefault(shard, []).append(i)
+        return list(groups.items())
+
+    def open(self, shard, items):
+        """Koneksi tulis shard dengan dimensi `items` sudah tersedia di dalamnya."""
+        if shard.path is None:
+            return self.catalog
+        conn = self._conns.get(shard.name)
+        if conn is None:
+            conn = self._conns[shard.name] = get_shard_connection(shard)
+        catalog_cursor, shard_cursor = self.catalog.cursor(), conn.cursor()
+        for cache, field in REPLICATED_DIMENSIONS:
+            names = {data.get(field) for data in items
+                     if isinstance(data.get(field), (str, int)) and data.get(field) != ''}
+            rows = [(cache.id_for(catalog_cursor, name), name) for name in names]
+            shard_cursor.executemany(
+                f"INSERT OR IGNORE INTO {cache.table} ({cache.id_column}, {cache.name_column}) VALUES (?, ?)", rows)
+        # Dimensi baru harus permanen di katalog sebelum shard merujuk id-nya
+        self.catalog.commit()
+        conn.commit()
+        return conn
+
+    def commit(self):
+        for conn in self._conns.values():
+            conn.commit()
+
+    def rollback(self):
+        for conn in self._conns.values():
+            conn.rollback()
+
+    def close(self):
+        for conn in self._conns.values():
+            conn.close()
+        self._conns = {}
@@ -0,0 +1,362 @@
+"""
+Deteksi Kolusi Berbasis Graf (peserta <-> faskes <-> klaim)
+FraudDetectionEngine menilai tiap klaim sendiri-sendiri. Modul ini menjaga
+indeks adjacency in-memory berbentuk CSR (array offset + tetangga + bobot)
+dari edge peserta->faskes, di mana bobot = jumlah klaim. Indeks dibangun
+incremental dari klaim baru (watermark klaim_id); job berkala mencari
+connected component dan "ring": sekelompok faskes yang berbagi peserta jauh
+melebihi kebetulan. Klaim peserta ring di faskes ring diberi fraud_alert
+dengan reason_code 'Collusion'.
+Indeks hanya melihat satu file database; bila SATRIA_SHARD_MAP aktif, ring
+lintas shard tidak terlihat sehingga detektor menolak berjalan.
+Run once with: python collusion.py --once
+"""
+
+import array
+import math
+import os
+import threading
+import time
+import sys
+import uuid
+import sqlite3
+import argparse
+from datetime import datetime
+from itertools import combinations
+
+from database import get_primary_connection, faskes_cache, begin_immediate, shard_map
+
+COLLUSION_REASON = 'Collusion'
+# Opt-in (0 = nonaktif): tiap proses server yang menjalankannya membangun indeksnya sendiri
+DETECT_INTERVAL_SECONDS = int(os.environ.get('SATRIA_COLLUSION_INTERVAL_SECONDS', 0))
+
+SYNC_BATCH_ROWS = 100000    # Klaim baru yang dibaca per query saat sync
+MERGE_DELTA_EDGES = 200000  # Delta edge di-merge ke CSR setelah sebanyak ini
+MAX_PATIENT_DEGREE = 50     # Peserta "hub" (>50 faskes) dilewati saat menghitung pasangan
+MIN_SHARED_PATIENTS = 3     # Pasangan faskes minimal berbagi sekian peserta
+MIN_LIFT = 3.0              # ... dan sekian kali lipat dari ekspektasi acak
+FAMILY_ALPHA = 0.01         # Batas p-value Poisson, dibagi jumlah pasangan (Bonferroni)
+MIN_RING_PROVIDERS = 2
+MAX_ALERTS_PER_RING = 500
+
+# ============================================
+# INDEKS ADJACENCY (CSR)
+# ============================================
+
+class PatientProviderIndex:
+    """
+    Graf bipartit peserta -> faskes dalam format CSR. peserta_id/faskes_id
+    adalah surrogate key INTEGER yang rapat, jadi dipakai langsung sebagai
+    indeks baris/kolom. Memori ~16 byte per edge unik (offset q, tetangga i,
+    bobot i) ditambah delta yang di-merge berkala.
+    """
+
+    def __init__(self):
+        self.offsets = array.array('q', [0])
+        self.neighbors = array.array('i')
+        self.weights = array.array('i')
+        self.n_providers = 0
+        self.watermark = 0       # klaim_id terakhir yang sudah masuk indeks
+        self._delta = {}         # peserta_id -> {faskes_id: jumlah klaim}
+        self._delta_edges = 0
+
+    @property
+    def n_patients(self):
+        return len(self.offsets) - 1
+
+    @property
+    def n_edges(self):
+        return len(self.neighbors)
+
+    def add_claim(self, peserta_id, faskes_id):
+        row = self._delta.setdefault(peserta_id, {})
+        if faskes_id not in row:
+            self._delta_edges += 1
+        row[faskes_id] = row.get(faskes_id, 0) + 1
+        self.n_providers = max(self.n_providers, faskes_id + 1)
+        if self._delta_edges >= MERGE_DELTA_EDGES:
+            self.merge()
+
+    def merge(self):
+        """Gabungkan delta ke CSR baru dalam satu lintasan O(edge + delta)."""
+        if not self._delta:
+            return
+        n_rows = max(self.n_patients, max(self._delta) + 1)
+        offsets = array.array('q', [0])
+        neighbors = array.array('i')
+        weights = array.array('i')
+        for p in range(n_rows):
+            delta = self._delta.get(p)
+            if p < self.n_patients:
+                start, end = self.offsets[p], self.offsets[p + 1]
+                if delta is None:
+                    neighbors.extend(self.neighbors[start:end])
+                    weights.extend(self.weights[start:end])
+                    offsets.append(len(neighbors))
+                    continue
+                row = dict(zip(self.neighbors[start:end], self.weights[start:end]))
+            else:
+                row = {}
+            for faskes_id, count in (delta or {}).items():
+                row[faskes_id] = row.get(faskes_id, 0) + count
+            for faskes_id in sorted(row):
+                neighbors.append(faskes_id)
+                weights.append(row[faskes_id])
+            offsets.append(len(neighbors))
+        self.offsets, self.neighbors, self.weights = offsets, neighbors, weights
+        self._delta = {}
+        self._delta_edges = 0
+
+    def row(self, peserta_id):
+        start, end = self.offsets[peserta_id], self.offsets[peserta_id + 1]
+        return self.neighbors[start:end]
+
+    def sync(self, conn):
+        """Tambahkan klaim dengan klaim_id > watermark; kembalikan jumlah klaim baru."""
+        added = 0
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        while True:
+            rows = cursor.execute('''
+                SELECT klaim_id, peserta_id, faskes_id FROM klaim
+                WHERE klaim_id > ? ORDER BY klaim_id LIMIT ?
+            ''', (self.watermark, SYNC_BATCH_ROWS)).fetchall()
+            if not rows:
+                break
+            for klaim_id, peserta_id, faskes_id in rows:
+                if peserta_id is not None and faskes_id is not None:
+                    self.add_claim(peserta_id, faskes_id)
+                    added += 1
+            self.watermark = rows[-1][0]
+        self.merge()
+        return added
+
+# ============================================
+# ANALISIS GRAF
+# ============================================
+
+def _find(parent, x):
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+def _union(parent, a, b):
+    ra, rb = _find(parent, a), _find(parent, b)
+    if ra != rb:
+        parent[max(ra, rb)] = min(ra, rb)
+
+def connected_components(index):
+    """
+    Union-find atas node peserta (0..P-1) dan faskes (P..P+F-1). Mengembalikan
+    (jumlah komponen non-trivial, ukuran komponen terbesar) dalam memori O(node).
+    """
+    offset = index.n_patients
+    parent = array.array('i', range(offset + index.n_providers))
+    for p in range(index.n_patients):
+        for faskes_id in index.row(p):
+            _union(parent, p, offset + faskes_id)
+    sizes = {}
+    for node in range(len(parent)):
+        root = _find(parent, node)
+        sizes[root] = sizes.get(root, 0) + 1
+    components = [size for size in sizes.values() if size > 1]
+    return len(components), max(components, default=0)
+
+def _poisson_sf(k, lam):
+    """P(X >= k) untuk X ~ Poisson(lam)."""
+    term, cdf = math.exp(-lam), 0.0
+    for i in range(k):
+        cdf += term
+        term *= lam / (i + 1)
+    return max(1.0 - cdf, 0.0)
+
+def detect_rings(index):
+    """
+    Cari ring faskes: pasangan yang berbagi >= MIN_SHARED_PATIENTS peserta
+    dengan lift >= MIN_LIFT, lalu gabungkan pasangan kuat menjadi komponen.
+    Ekspektasi acak memakai model konfigurasi: peserta berderajat d memuat
+    pasangan (a, b) dengan peluang ~ d(d-1) * s_a * s_b, s = porsi edge faskes.
+    Pasangan juga harus signifikan (Poisson, dikoreksi jumlah pasangan) agar
+    kebetulan kecil di jutaan pasangan tidak merangkai satu ring raksasa.
+    Peserta hub dilewati agar jumlah pasangan per peserta tetap terbatas.
+    """
+    provider_degree = array.array('i', [0]) * index.n_providers
+    pair_slots = 0
+    shared = {}
+    for p in range(index.n_patients):
+        providers = index.row(p)
+        for faskes_id in providers:
+            provider_degree[faskes_id] += 1
+        if 2 <= len(providers) <= MAX_PATIENT_DEGREE:
+            pair_slots += len(providers) * (len(providers) - 1)
+            for pair in combinations(providers, 2):
+                shared[pair] = shared.get(pair, 0) + 1
+
+    edges = max(index.n_edges, 1)
+    alpha = FAMILY_ALPHA / max(len(shared), 1)
+    parent = array.array('i', range(index.n_providers))
+    strong = {}
+    for (a, b), count in shared.items():
+        if count < MIN_SHARED_PATIENTS:
+            continue
+        expected = pair_slots * provider_degree[a] * provider_degree[b] / (edges * edges)
+        lift = count / max(expected, 1e-9)
+        if lift >= MIN_LIFT and _poisson_sf(count, expected) <= alpha:
+            strong[(a, b)] = (count, lift)
+            _union(parent, a, b)
+
+    groups = {}
+    for a, b in strong:
+        groups.setdefault(_find(parent, a), set()).update((a, b))
+
+    groups = [providers for providers in groups.values() if len(providers) >= MIN_RING_PROVIDERS]
+    ring_of = {f: i for i, providers in enumerate(groups) for f in providers}
+    # Peserta ring: mengunjungi >= 2 faskes dalam ring yang sama (satu lintasan)
+    members = [[] for _ in groups]
+    for p in range(index.n_patients):
+        hits = {}
+        for faskes_id in index.row(p):
+            ring = ring_of.get(faskes_id)
+            if ring is not None:
+                hits[ring] = hits.get(ring, 0) + 1
+        for ring, count in hits.items():
+            if count >= 2:
+                members[ring].append(p)
+
+    rings = []
+    for providers, patients in zip(groups, members):
+        pairs = [v for k, v in strong.items() if k[0] in providers]
+        rings.append({
+            'providers': sorted(providers),
+            'patients': patients,
+            'shared_patients': max(count for count, _ in pairs),
+            'lift': max(lift for _, lift in pairs),
+        })
+    return rings
+
+# ============================================
+# EMIT ALERT
+# ============================================
+
+def _ring_claims(cursor, ring):
+    claims = []
+    providers = ring['providers']
+    marks = ', '.join('?' for _ in providers)
+    # IN-list dipotong per 500 peserta agar tetap di bawah batas variabel SQLite
+    for i in range(0, len(ring['patients']), 500):
+        chunk = ring['patients'][i:i + 500]
+        cursor.execute(f'''
+            SELECT k.klaim_id FROM klaim k
+            WHERE k.peserta_id IN ({', '.join('?' for _ in chunk)}) AND k.faskes_id IN ({marks})
+              AND NOT EXISTS (SELECT 1 FROM fraud_alert f WHERE f.klaim_id = k.klaim_id AND f.reason_code = ?)
+            ORDER BY k.klaim_id LIMIT ?
+        ''', chunk + providers + [COLLUSION_REASON, MAX_ALERTS_PER_RING - len(claims)])
+        claims.extend(row[0] for row in cursor.fetchall())
+        if len(claims) >= MAX_ALERTS_PER_RING:
+            break
+    return claims
+
+def emit_alerts(conn, rings):
+    """
+    Tulis fraud_alert 'Collusion' untuk klaim ring yang belum ditandai
+    (idempoten). Cek "belum ditandai" dan insert berada dalam satu write
+    lock, jadi beberapa proses detektor tidak membuat alert ganda.
+    """
+    if not rings:
+        return 0
+    tgl = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    cursor = conn.cursor()
+    created = 0
+    begin_immediate(cursor)
+    for ring in rings:
+        claims = _ring_claims(cursor, ring)
+        if not claims:
+            continue
+        names = ', '.join(faskes_cache.name_for(f) or str(f) for f in ring['providers'])
+        level = 'High' if ring['lift'] >= 2 * MIN_LIFT else 'Medium'
+        confidence = round(min(0.99, 0.5 + ring['lift'] / 20), 2)
+        description = (f"{len(ring['patients'])} peserta berputar di {len(ring['providers'])} faskes ({names}); "
+                       f"hingga {ring['shared_patients']} peserta bersama per pasangan, {ring['lift']:.1f}x dari pola acak.")
+        cursor.executemany('''
+            INSERT INTO fraud_alert (klaim_id, alert_level, reason_code, ai_confidence, description, created_at, status, action)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(klaim_id, level, COLLUSION_REASON, confidence, description, tgl, 'Open', 'Graph-Flagged')
+              for klaim_id in claims])
+        cursor.execute('''
+            INSERT INTO audit_trail (audit_id, entity, entity_id, action, user, details, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (str(uuid.uuid4()), 'Collusion Detector', ','.join(str(f) for f in ring['providers']), 'DETECTED',
+              'System', f"Ring kolusi {names}: {len(claims)} klaim ditandai", tgl))
+        created += len(claims)
+    conn.commit()
+    return created
+
+# ============================================
+# JOB BERKALA
+# ============================================
+
+_index = PatientProviderIndex()
+_index_lock = threading.Lock()
+
+def run_detection(conn, index=None):
+    index = index or _index
+    with _index_lock:
+        started = time.perf_counter()
+        added = index.sync(conn)
+        components, largest = connected_components(index)
+        rings = detect_rings(index)
+    created = emit_alerts(conn, rings)
+    return {
+        'new_claims': added,
+        'patients': index.n_patients,
+        'edges': index.n_edges,
+        'components': components,
+        'largest_component': largest,
+        'rings': len(rings),
+        'alerts_created': created,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+def _detector_loop(interval, stop_event):
+    while not stop_event.is_set():
+        conn = get_primary_connection()
+        try:
+            run_detection(conn)
+        except sqlite3.OperationalError as e:
+            conn.rollback()
+            print(f"⚠️ Deteksi kolusi gagal: {e}")
+        except Exception as e:
+            # Error lain juga tidak boleh mematikan thread detektor
+            conn.rollback()
+            print(f"⚠️ Deteksi kolusi error: {type(e).__name__}: {e}")
+        finally:
+            conn.close()
+        stop_event.wait(interval)
+
+def start_collusion_detector(interval=DETECT_INTERVAL_SECONDS):
+    """Jalankan deteksi kolusi berkala di daemon thread. interval <= 0 menonaktifkan."""
+    stop_event = threading.Event()
+    if interval > 0 and shard_map.enabled:
+        print("⚠️ Detektor kolusi tidak dijalankan: belum mendukung SATRIA_SHARD_MAP")
+    elif interval > 0:
+        thread = threading.Thread(target=_detector_loop, args=(interval, stop_event),
+                                  name='collusion-detector', daemon=True)
+        thread.start()
+    return stop_event
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deteksi kolusi peserta-faskes SATRIA JKN")
+    parser.add_argument('--once', action='store_true', help='Jalankan satu kali lalu keluar')
+    parser.add_argument('--interval', type=int, default=DETECT_INTERVAL_SECONDS or 900)
+    args = parser.parse_args()
+    if shard_map.enabled:
+        print("❌ Deteksi kolusi belum mendukung SATRIA_SHARD_MAP (ring lintas shard tidak terlihat)")
+        sys.exit(1)
+    conn = get_primary_connection()
+    while True:
+        print(f"🕸️  {run_detection(conn)}")
+        if args.once:
+            break
+        time.sleep(args.interval)
+    conn.close()
@@ -1,64 +1,1068 @@
+import os
 import sqlite3
+import threading
+import time
+import heapq
+import json
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import wraps
+from itertools import islice
 import uuid
 import random
 from werkzeug.security import generate_password_hash
 
-DATABASE_NAME = 'satriajkn.db'
+from metrics import lock_wait
+
+# Job batch/CLI bisa diarahkan ke file shard: SATRIA_DATABASE=satriajkn_jawa.db python rescore.py
+DATABASE_NAME = os.environ.get('SATRIA_DATABASE', 'satriajkn.db')
+
+# Versi skema disimpan di PRAGMA user_version.
+# v1: klaim/fraud_alert dengan UUID TEXT dan provider free-text
+# v2: dimensi faskes & diagnosis dengan surrogate key INTEGER
+# v3: dimensi peserta (no_kartu) dan klaim.peserta_id
+# v4: fraud_alert.trace (trace scoring biner, lihat fraud_engine.pack_trace)
+# v5: kolom antrian triage alert (triage_key, assigned_to, lease_until)
+# v6: tabel idempotency_key; sejak v6 init_database() dilewati bila user_version
+#     sudah terbaru, jadi setiap perubahan skema wajib menaikkan versi ini
+# v7: users.last_login (ditulis batch oleh auth.LastLoginBuffer)
+# v8: tabel revoked_token (daftar pencabutan JWT, lihat auth.RevocationList)
+# v9: index audit_trail(timestamp) untuk job retensi (lihat retention.py)
+# v10: cube laporan report_cube (lihat report_cube.py)
+# v11: feature store feature_peserta_day/feature_provider_day (lihat feature_store.py)
+# v12: change data capture change_log + cdc_consumer (lihat cdc.py)
+# v13: triage_key dengan level berbobot TRIAGE_LEVEL_WEIGHT (trigger & key dihitung ulang)
+# v14: hapus arsip retensi dicatat change_log sebagai op 'archive' (tabel cdc_archive_mark)
+SCHEMA_VERSION = 14
+
+# Prioritas triage alert = level x TRIAGE_LEVEL_WEIGHT + ai_confidence + porsi
+# nominal klaim + umur. Suku umur linear, jadi prioritas(t) = triage_key +
+# TRIAGE_AGE_WEIGHT * hari(t); triage_key tidak bergantung waktu sekarang dan
+# bisa di-index. confidence + nominal paling banyak 2, jadi level selalu
+# menang, kecuali alert yang terbuka lebih dari (10 - 2) / 0.01 = 800 hari;
+# di dalam satu level, umur 100 hari setara +1 confidence (pemecah seri).
+TRIAGE_LEVEL_WEIGHT = 10
+TRIAGE_AGE_WEIGHT = 0.01            # per hari
+TRIAGE_AMOUNT_CAP = 50000000.0      # nominal klaim yang memberi bobot penuh (1.0)
+
+# Tabel yang perubahannya dihitung di data_version (untuk ETag)
+DATA_VERSION_TABLES = ('klaim', 'fraud_alert', 'audit_trail', 'reports', 'faskes', 'klaim_queue')
+
+# Grain cube laporan: hari x faskes x diagnosis x alert_level x status klaim.
+# Baris fakta klaim punya alert_level '' (hanya claim_count/total_spend);
+# baris fakta alert membawa status & dimensi klaimnya (alert_count/alert_spend).
+# Dimensi NULL disimpan sebagai 0 / '' karena menjadi bagian PRIMARY KEY.
+CUBE_COLUMNS = ('day', 'faskes_id', 'diagnosis_id', 'alert_level', 'status',
+                'claim_count', 'total_spend', 'alert_count', 'alert_spend')
+CUBE_KEY = 'day, faskes_id, diagnosis_id, alert_level, status'
+
+def cube_day_sql(row):
+    """Ekspresi hari YYYYMMDD (INTEGER) dari tgl_pengajuan baris klaim."""
+    return f"CAST(COALESCE(strftime('%Y%m%d', {row}.tgl_pengajuan), 0) AS INTEGER)"
+
+# Fakta agregat langsung dari tabel OLTP; {where} menyaring klaim k / alert f
+CUBE_KLAIM_FACTS_SQL = f'''
+    SELECT {cube_day_sql('k')}, COALESCE(k.faskes_id, 0), COALESCE(k.diagnosis_id, 0), '',
+           COALESCE(k.status, ''), COUNT(*), COALESCE(SUM(k.total_biaya), 0), 0, 0
+    FROM klaim k WHERE {{where}}
+    GROUP BY 1, 2, 3, 5
+'''
+CUBE_ALERT_FACTS_SQL = f'''
+    SELECT {cube_day_sql('k')}, COALESCE(k.faskes_id, 0), COALESCE(k.diagnosis_id, 0),
+           COALESCE(NULLIF(f.alert_level, ''), 'Unknown'), COALESCE(k.status, ''), 0, 0, COUNT(*), COALESCE(SUM(k.total_biaya), 0)
+    FROM fraud_alert f JOIN klaim k ON k.klaim_id = f.klaim_id WHERE {{where}}
+    GROUP BY 1, 2, 3, 4, 5
+'''
+# Feature store: bucket harian per peserta dan per faskes x diagnosis.
+# Fitur rolling (mis. 30 hari) = jumlah bucket dalam jendela saat lookup.
+FEATURE_PESERTA_FACTS_SQL = f'''
+    INSERT INTO feature_peserta_day (peserta_id, day, claim_count, total_spend)
+    SELECT k.peserta_id, {cube_day_sql('k')}, COUNT(*), COALESCE(SUM(k.total_biaya), 0)
+    FROM klaim k WHERE k.peserta_id IS NOT NULL
+    GROUP BY 1, 2
+'''
+FEATURE_PROVIDER_FACTS_SQL = f'''
+    INSERT INTO feature_provider_day (faskes_id, diagnosis_id, day, claim_count, total_spend)
+    SELECT k.faskes_id, COALESCE(k.diagnosis_id, 0), {cube_day_sql('k')}, COUNT(*), COALESCE(SUM(k.total_biaya), 0)
+    FROM klaim k WHERE k.faskes_id IS NOT NULL
+    GROUP BY 1, 2, 3
+'''
+CUBE_UPSERT_SQL = f'''
+    INSERT INTO report_cube ({', '.join(CUBE_COLUMNS)}) {{select}}
+    ON CONFLICT({CUBE_KEY}) DO UPDATE SET
+        claim_count = claim_count + excluded.claim_count,
+        total_spend = total_spend + excluded.total_spend,
+        alert_count = alert_count + excluded.alert_count,
+        alert_spend = alert_spend + excluded.alert_spend
+'''
+
+def get_primary_connection(path=None):
+    """Koneksi read-write ke database utama (atau file `path`), tanpa read-routing."""
+    conn = sqlite3.connect(path or DATABASE_NAME)
+    conn.row_factory = sqlite3.Row
+    return conn
 
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE_NAME)
+    # Endpoint agregat yang di-route (lihat replica_reads) membaca dari replika
+    if getattr(_read_routing, 'enabled', False):
+        conn = get_replica_connection()
+        if conn is not None:
+            return conn
+    return get_primary_connection()
+
+def begin_immediate(conn):
+    """BEGIN IMMEDIATE (conn atau cursor); lama menunggu write lock dicatat ke metrics.lock_wait."""
+    started = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    lock_wait.record(time.perf_counter() - started)
+
+def get_readonly_connection():
+    """Koneksi read-only (mode=ro) untuk proses analitik/batch."""
+    conn = sqlite3.connect(f"file:{DATABASE_NAME}?mode=ro", uri=True)
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_database():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # 1. Tabel Pengguna
+# ============================================
+# READ REPLICA (snapshot via SQLite backup API)
+# ============================================
+
+# Umur maksimum replika yang boleh melayani pembacaan; 0 (default) menonaktifkan replika.
+# Hanya endpoint agregat (dashboard, analitik, laporan) yang di-route ke replika;
+# point lookup, listing, antrian, triage dan CDC selalu membaca database utama
+# agar data yang baru ditulis langsung terlihat (read-after-write).
+REPLICA_MAX_STALENESS_SECONDS = float(os.environ.get('SATRIA_REPLICA_MAX_STALENESS', 0))
+REPLICA_MMAP_BYTES = int(os.environ.get('SATRIA_REPLICA_MMAP_BYTES', 256 * 1024 * 1024))
+
+_read_routing = threading.local()
+
+def replica_path():
+    base, ext = os.path.splitext(DATABASE_NAME)
+    return f"{base}_replica{ext or '.db'}"
+
+def replica_age():
+    """Detik sejak snapshot replika diambil, atau None bila belum ada."""
+    try:
+        return max(time.time() - os.stat(replica_path()).st_mtime, 0.0)
+    except FileNotFoundError:
+        return None
+
+def refresh_read_replica():
+    """
+    Salin database utama ke file baru lewat backup API lalu tukar secara
+    atomik. Koneksi replika lama tetap membaca inode lamanya, jadi file yang
+    dibuka dengan immutable=1 tidak pernah berubah di bawah pembaca.
+    """
+    target = replica_path()
+    tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    started = time.time()
+    source = get_primary_connection()
+    dest = sqlite3.connect(tmp)
+    try:
+        source.backup(dest)
+        # Replika dibaca tanpa -wal/-shm
+        dest.execute("PRAGMA journal_mode = DELETE")
+        dest.close()
+        # mtime = saat snapshot diambil, dipakai untuk menghitung umur
+        os.utime(tmp, (started, started))
+        os.replace(tmp, target)
+    except Exception:
+        dest.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        source.close()
+    return started
+
+def get_replica_connection(max_staleness=None):
+    """Koneksi ke replika bila umurnya dalam batas staleness, selain itu None."""
+    bound = REPLICA_MAX_STALENESS_SECONDS if max_staleness is None else max_staleness
+    if bound <= 0:
+        return None
+    age = replica_age()
+    if age is None or age > bound:
+        return None
+    conn = sqlite3.connect(f"file:{replica_path()}?mode=ro&immutable=1", uri=True)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA mmap_size = {REPLICA_MMAP_BYTES}")
+    # Laporkan umur replika tertua yang dipakai request ini
+    served = getattr(_read_routing, 'age', None)
+    _read_routing.age = age if served is None else max(served, age)
+    return conn
+
+def begin_read_routing():
+    """Arahkan get_db_connection() di thread ini ke replika (endpoint agregat)."""
+    _read_routing.enabled = True
+    _read_routing.age = None
+
+def end_read_routing():
+    """Matikan routing; kembalikan umur replika yang dipakai (None = database utama)."""
+    age = getattr(_read_routing, 'age', None)
+    _read_routing.enabled = False
+    _read_routing.age = None
+    return age
+
+def replica_reads(f):
+    """
+    Decorator endpoint agregat: get_db_connection() selama handler boleh
+    membaca replika. Routing diakhiri hook after_request/teardown app.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        begin_read_routing()
+        return f(*args, **kwargs)
+    return decorated
+
+def _replica_refresh_loop(interval, stop_event):
+    while not stop_event.is_set():
+        age = replica_age()
+        # Beberapa proses server berbagi file replika yang sama
+        if age is None or age >= interval:
+            try:
+                refresh_read_replica()
+            except (sqlite3.Error, OSError) as e:
+                print(f"⚠️ Refresh read replica gagal: {e}")
+        stop_event.wait(interval)
+
+def start_replica_refresher(max_staleness=None):
+    """Refresh replika tiap setengah batas staleness di daemon thread."""
+    bound = REPLICA_MAX_STALENESS_SECONDS if max_staleness is None else max_staleness
+    stop_event = threading.Event()
+    if bound > 0:
+        thread = threading.Thread(target=_replica_refresh_loop, args=(bound / 2, stop_event),
+                                  name='read-replica-refresh', daemon=True)
+        thread.start()
+    return stop_event
+
+# ============================================
+# DIMENSION CACHE (faskes & diagnosis)
+# ============================================
+
+class DimensionCache:
+    """
+    Cache in-memory untuk tabel dimensi (nama <-> id INTEGER).
+    Baris dimensi tidak pernah diubah namanya, jadi cache cukup diisi
+    saat miss dan tidak perlu di-invalidate.
+    """
+
+    def __init__(self, table, id_column, name_column):
+        self.table = table
+        self.id_column = id_column
+        self.name_column = name_column
+        self._by_name = {}
+        self._by_id = {}
+        self._lock = threading.Lock()
+
+    def _remember(self, dim_id, name):
+        self._by_name[name] = dim_id
+        self._by_id[dim_id] = name
+
+    def id_for(self, cursor, name, **attrs):
+        """Ambil id untuk nama, buat baris dimensi baru jika belum ada."""
+        if not name:
+            return None
+        dim_id = self._by_name.get(name)
+        if dim_id is not None:
+            return dim_id
+
+        cursor.execute(
+            f"SELECT {self.id_column} FROM {self.table} WHERE {self.name_column} = ?", (name,))
+        row = cursor.fetchone()
+        if row:
+            with self._lock:
+                self._remember(row[0], name)
+            return row[0]
+
+        # Baris baru belum di-cache: jika transaksi pemanggil di-rollback,
+        # id ini tidak boleh tertinggal di cache
+        columns = [self.name_column] + list(attrs)
+        cursor.execute(
+            f"INSERT OR IGNORE INTO {self.table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})",
+            [name] + list(attrs.values()))
+        if cursor.rowcount:
+            return cursor.lastrowid
+        cursor.execute(
+            f"SELECT {self.id_column} FROM {self.table} WHERE {self.name_column} = ?", (name,))
+        return cursor.fetchone()[0]
+
+    def ids_for(self, cursor, names):
+        """{nama: id} untuk nama yang sudah ada (tanpa membuat baris baru); satu query untuk semua miss."""
+        found, missing = {}, set()
+        for name in names:
+            if not isinstance(name, (str, int)) or name == '':
+                continue
+            dim_id = self._by_name.get(name)
+            if dim_id is not None:
+                found[name] = dim_id
+            else:
+                missing.add(name)
+        if missing:
+            cursor.execute(
+                f"SELECT {self.id_column}, {self.name_column} FROM {self.table} "
+                f"WHERE {self.name_column} IN ({', '.join('?' for _ in missing)})", list(missing))
+            rows = cursor.fetchall()
+            with self._lock:
+                for dim_id, name in rows:
+                    self._remember(dim_id, name)
+                    found[name] = dim_id
+        return found
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def name_for(self, dim_id):
+        """Terjemahkan id ke nama; reload seluruh dimensi saat miss."""
+        if dim_id is None:
+            return None
+        name = self._by_id.get(dim_id)
+        if name is None:
+            self.reload()
+            name = self._by_id.get(dim_id)
+        return name
+
+    def reload(self):
+        # Selalu dari database utama: replika bisa belum memuat baris baru
+        conn = get_primary_connection()
+        rows = conn.execute(f"SELECT {self.id_column}, {self.name_column} FROM {self.table}").fetchall()
+        conn.close()
+        with self._lock:
+            for row in rows:
+                self._remember(row[0], row[1])
+
+    def clear(self):
+        with self._lock:
+            self._by_name.clear()
+            self._by_id.clear()
+
+faskes_cache = DimensionCache('faskes', 'faskes_id', 'nama')
+diagnosis_cache = DimensionCache('diagnosis', 'diagnosis_id', 'code')
+peserta_cache = DimensionCache('peserta', 'peserta_id', 'no_kartu')
+
+# ============================================
+# SHARDING REGIONAL (opsional)
+# ============================================
+# Dengan SATRIA_SHARD_MAP=<file JSON>, klaim + fraud_alert (beserta agregat
+# trigger-nya: provider_risk, report_cube, feature store) ditulis ke file
+# shard sesuai wilayah faskes, sehingga tiap wilayah punya lock tulis
+# sendiri. File utama tetap menjadi katalog: users, dimensi, antrian,
+# laporan, idempotency. Tiap shard berskema lengkap; baris dimensi yang
+# dirujuk klaimnya disalin dengan id yang sama (lihat claims.route_claims).
+#
+#   {"default": "pusat",
+#    "shards": {"pusat": {"path": null, "id_base": 0},
+#               "jawa": {"path": "satriajkn_jawa.db", "id_base": 1000000000000}},
+#    "regions": {"DKI Jakarta": "jawa", "Jawa Barat": "jawa"}}
+#
+# path null = file utama. id_base memisahkan rentang klaim_id/alert_id antar
+# shard agar id tetap unik secara global dan bisa di-route balik (for_id).
+
+SHARD_MAP_PATH = os.environ.get('SATRIA_SHARD_MAP')
+SHARD_FANOUT_THREADS = int(os.environ.get('SATRIA_SHARD_THREADS', 8))
+REGION_CACHE_SECONDS = 60
+
+Shard = namedtuple('Shard', 'name path id_base')
+
+class ShardMap:
+    def __init__(self, spec=None):
+        self.configure(spec)
+
+    def configure(self, spec=None):
+        """Ganti isi peta di tempat (modul lain mengimpor instance shard_map)."""
+        spec = spec or {'default': 'main', 'shards': {'main': {'path': None, 'id_base': 0}}}
+        self.shards = [Shard(name, conf.get('path'), int(conf.get('id_base', 0)))
+                       for name, conf in spec['shards'].items()]
+        self._by_name = {shard.name: shard for shard in self.shards}
+        self.default = self._by_name[spec.get('default') or self.shards[0].name]
+        self.regions = {region: self._by_name[name] for region, name in spec.get('regions', {}).items()}
+        bases = sorted(shard.id_base for shard in self.shards)
+        if len(set(bases)) != len(bases):
+            raise ValueError("id_base tiap shard harus berbeda")
+        self._by_base = sorted(self.shards, key=lambda shard: shard.id_base)
+
+    @classmethod
+    def load(cls, path):
+        if not path:
+            return cls()
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    @property
+    def enabled(self):
+        return len(self.shards) > 1 or self.default.path is not None
+
+    def shard(self, name):
+        return self._by_name[name]
+
+    def for_region(self, region):
+        return self.regions.get(region, self.default)
+
+    def for_id(self, row_id):
+        """Shard pemilik klaim_id/alert_id: id_base terbesar yang <= row_id."""
+        owner = self._by_base[0]
+        for shard in self._by_base:
+            if shard.id_base <= row_id:
+                owner = shard
+        return owner
+
+shard_map = ShardMap.load(SHARD_MAP_PATH)
+
+def shard_path(shard):
+    return shard.path or DATABASE_NAME
+
+def get_shard_connection(shard, readonly=False):
+    """Koneksi ke file shard; shard katalog (path null) memakai koneksi biasa."""
+    if shard.path is None:
+        return get_db_connection() if readonly else get_primary_connection()
+    if readonly:
+        conn = sqlite3.connect(f"file:{shard.path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        return conn
+    return get_primary_connection(shard.path)
+
+def init_shards():
+    """Buat/migrasi skema di setiap file shard selain file utama."""
+    for shard in shard_map.shards:
+        if shard.path is not None:
+            init_database(shard.path)
+
+class RegionCache:
+    """faskes_id -> wilayah dari katalog; di-reload penuh tiap REGION_CACHE_SECONDS atau saat miss."""
+
+    def __init__(self):
+        self._regions = {}
+        self._loaded = 0.0
+        self._lock = threading.Lock()
+
+    def region_for(self, cursor, faskes_id):
+        if faskes_id is None:
+            return None
+        if time.monotonic() - self._loaded > REGION_CACHE_SECONDS or faskes_id not in self._regions:
+            rows = cursor.execute("SELECT faskes_id, wilayah FROM faskes").fetchall()
+            with self._lock:
+                self._regions = {row[0]: row[1] for row in rows}
+                self._loaded = time.monotonic()
+        return self._regions.get(faskes_id)
+
+    def __len__(self):
+        return len(self._regions)
+
+region_cache = RegionCache()
+
+_fanout_pool = None
+_fanout_lock = threading.Lock()
+
+def _fanout():
+    global _fanout_pool
+    with _fanout_lock:
+        if _fanout_pool is None:
+            _fanout_pool = ThreadPoolExecutor(max_workers=SHARD_FANOUT_THREADS, thread_name_prefix='shard')
+        return _fanout_pool
+
+def scatter(sql, params=(), shards=None):
+    """
+    Jalankan query baca di setiap shard secara paralel (sqlite3 melepas GIL
+    selama query berjalan). Mengembalikan [(shard, rows tuple)] urut shard_map.
+    """
+    targets = shards or shard_map.shards
+
+    def run(shard):
+        conn = get_shard_connection(shard, readonly=True)
+        try:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            return cursor.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    if len(targets) == 1:
+        return [(targets[0], run(targets[0]))]
+    return list(zip(targets, _fanout().map(run, targets)))
+
+def gather_sorted(results, key, reverse=False, limit=None):
+    """Gabung hasil per shard yang sudah ORDER BY sama; ambil `limit` teratas."""
+    merged = heapq.merge(*(rows for _, rows in results), key=key, reverse=reverse)
+    return list(islice(merged, limit))
+
+def gather_sum(results, key_columns=0):
+    """GROUP BY lintas shard: jumlahkan kolom setelah `key_columns` kolom key pertama."""
+    totals = {}
+    for _, rows in results:
+        for row in rows:
+            key = tuple(row[:key_columns])
+            values = totals.get(key)
+            if values is None:
+                totals[key] = list(row[key_columns:])
+            else:
+                for i, value in enumerate(row[key_columns:]):
+                    values[i] = (values[i] or 0) + (value or 0)
+    return [key + tuple(values) for key, values in totals.items()]
+
+# ============================================
+# SCHEMA & MIGRATION
+# ============================================
+
+def _table_columns(cursor, table):
+    return [row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()]
+
+def _create_dimension_tables(cursor):
+    # Dimensi Fasilitas Kesehatan (lihat FasilitasKesehatan di prisma.schema)
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id TEXT PRIMARY KEY,
-            username TEXT UNIQUE,
-            email TEXT,
-            password_hash TEXT,
-            full_name TEXT,
-            role TEXT,
-            is_active INTEGER DEFAULT 1
+        CREATE TABLE IF NOT EXISTS faskes (
+            faskes_id INTEGER PRIMARY KEY,
+            nama TEXT UNIQUE NOT NULL,
+            tipe TEXT, -- RS, Klinik, Puskesmas
+            wilayah TEXT
         )
     ''')
 
-    # 2. Tabel Klaim (Data Transaksi Utama)
+    # Dimensi Diagnosis (ICD code)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS diagnosis (
+            diagnosis_id INTEGER PRIMARY KEY,
+            code TEXT UNIQUE NOT NULL,
+            nama TEXT
+        )
+    ''')
+
+    # Dimensi Peserta (hanya nomor kartu, tanpa data pribadi)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS peserta (
+            peserta_id INTEGER PRIMARY KEY,
+            no_kartu TEXT UNIQUE NOT NULL
+        )
+    ''')
+
+def _create_fact_tables(cursor):
+    # Tabel Klaim (Data Transaksi Utama)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS klaim (
-            klaim_id TEXT PRIMARY KEY,
+            klaim_id INTEGER PRIMARY KEY,
             nomor_klaim TEXT UNIQUE,
             tgl_pengajuan TIMESTAMP,
             total_biaya REAL,
             status TEXT, -- Pending, Verified, Anomalous
-            provider TEXT,
-            diagnosis_code TEXT,
+            faskes_id INTEGER,
+            diagnosis_id INTEGER,
             tindakan_code TEXT,
-            created_at TIMESTAMP
+            created_at TIMESTAMP,
+            peserta_id INTEGER,
+            FOREIGN KEY (faskes_id) REFERENCES faskes(faskes_id),
+            FOREIGN KEY (diagnosis_id) REFERENCES diagnosis(diagnosis_id),
+            FOREIGN KEY (peserta_id) REFERENCES peserta(peserta_id)
         )
     ''')
-    
-    # 3. Tabel Fraud Alert (Otak dari Sentinel - Hasil Analisis AI)
+
+    # Tabel Fraud Alert (Otak dari Sentinel - Hasil Analisis AI)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS fraud_alert (
-            alert_id TEXT PRIMARY KEY,
-            klaim_id TEXT,
+            alert_id INTEGER PRIMARY KEY,
+            klaim_id INTEGER,
             alert_level TEXT, -- High, Medium, Low
             reason_code TEXT, -- Upcoding, Phantom Billing, dll
             ai_confidence REAL, -- Skor keyakinan AI (0.0 - 1.0)
-            description TEXT, -- Penjelasan agentic ("Biaya melebih ambang batas...")
+            description TEXT, -- Penjelasan teks (alert lama/manual); alert engine memakai trace
             is_resolved INTEGER DEFAULT 0,
             created_at TIMESTAMP,
             action TEXT,
             status TEXT,
+            trace BLOB, -- rule terpicu + kontribusi + fitur (fraud_engine.pack_trace)
+            triage_key REAL, -- prioritas triage tanpa suku waktu sekarang (trigger)
+            assigned_to TEXT, -- analis pemegang lease triage
+            lease_until REAL, -- epoch detik
             FOREIGN KEY (klaim_id) REFERENCES klaim(klaim_id)
         )
     ''')
+
+def _migrate_v1_to_v2(conn):
+    """
+    Pindahkan klaim/fraud_alert lama (UUID TEXT + provider free-text)
+    ke skema dimensi. klaim_id/alert_id baru = rowid lama, sehingga
+    referensi di audit_trail bisa dipetakan ulang dalam satu transaksi.
+    """
+    cursor = conn.cursor()
+    print("🔄 Migrasi skema v1 -> v2 (dimensi faskes & diagnosis)...")
+    cursor.execute("BEGIN")
+    _create_dimension_tables(cursor)
+    cursor.execute("INSERT OR IGNORE INTO faskes (nama) SELECT DISTINCT provider FROM klaim WHERE provider IS NOT NULL AND provider != ''")
+    cursor.execute("INSERT OR IGNORE INTO diagnosis (code) SELECT DISTINCT diagnosis_code FROM klaim WHERE diagnosis_code IS NOT NULL AND diagnosis_code != ''")
+
+    cursor.execute("ALTER TABLE fraud_alert RENAME TO fraud_alert_v1")
+    cursor.execute("ALTER TABLE klaim RENAME TO klaim_v1")
+    _create_fact_tables(cursor)
+
+    cursor.execute('''
+        INSERT INTO klaim (klaim_id, nomor_klaim, tgl_pengajuan, total_biaya, status, faskes_id, diagnosis_id, tindakan_code, created_at)
+        SELECT k.rowid, k.nomor_klaim, k.tgl_pengajuan, k.total_biaya, k.status, f.faskes_id, d.diagnosis_id, k.tindakan_code, k.created_at
+        FROM klaim_v1 k
+        LEFT JOIN faskes f ON f.nama = k.provider
+        LEFT JOIN diagnosis d ON d.code = k.diagnosis_code
+    ''')
+    cursor.execute('''
+        INSERT INTO fraud_alert (alert_id, klaim_id, alert_level, reason_code, ai_confidence, description, is_resolved, created_at, action, status)
+        SELECT a.rowid, k.rowid, a.alert_level, a.reason_code, a.ai_confidence, a.description, a.is_resolved, a.created_at, a.action, a.status
+        FROM fraud_alert_v1 a
+        LEFT JOIN klaim_v1 k ON k.klaim_id = a.klaim_id
+    ''')
+
+    # Audit trail menyimpan entity_id sebagai TEXT; petakan UUID lama ke id baru
+    cursor.execute('''
+        UPDATE audit_trail
+        SET entity_id = (SELECT CAST(k.rowid AS TEXT) FROM klaim_v1 k WHERE k.klaim_id = audit_trail.entity_id)
+        WHERE entity = 'AI Sentinel' AND entity_id IN (SELECT klaim_id FROM klaim_v1)
+    ''')
+    cursor.execute('''
+        UPDATE audit_trail
+        SET entity_id = (SELECT CAST(a.rowid AS TEXT) FROM fraud_alert_v1 a WHERE a.alert_id = audit_trail.entity_id)
+        WHERE entity = 'Alert' AND entity_id IN (SELECT alert_id FROM fraud_alert_v1)
+    ''')
+
+    cursor.execute("DROP TABLE fraud_alert_v1")
+    cursor.execute("DROP TABLE klaim_v1")
+    # user_version tidak di-stamp di sini: init_database melakukannya sekali di akhir,
+    # jadi kegagalan langkah berikutnya membuat init diulang penuh saat restart
+    conn.commit()
+    faskes_cache.clear()
+    diagnosis_cache.clear()
+
+def _create_provider_risk_store(cursor):
+    """
+    Agregat per faskes yang dijaga trigger pada klaim/fraud_alert, sehingga
+    /api/providers/risk tidak pernah memindai klaim. Trigger hanya menambah/
+    mengurangi counter; drift (mis. klaim dihapus sebelum alert-nya)
+    dikoreksi oleh refresh penuh terjadwal di provider_risk.py.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS provider_risk (
+            faskes_id INTEGER PRIMARY KEY,
+            claim_count INTEGER NOT NULL DEFAULT 0,
+            total_spend REAL NOT NULL DEFAULT 0,
+            anomaly_count INTEGER NOT NULL DEFAULT 0,
+            alert_count INTEGER NOT NULL DEFAULT 0,
+            high_alert_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS provider_risk_reason (
+            faskes_id INTEGER,
+            reason_code TEXT,
+            alert_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (faskes_id, reason_code)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS provider_risk_month (
+            faskes_id INTEGER,
+            month TEXT, -- YYYY-MM dari tgl_pengajuan
+            claim_count INTEGER NOT NULL DEFAULT 0,
+            anomaly_count INTEGER NOT NULL DEFAULT 0,
+            total_spend REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (faskes_id, month)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS provider_risk_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_refresh REAL
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO provider_risk_meta (id, last_refresh) VALUES (1, NULL)")
+
+    # Fragment SQL: tambah / kurangi kontribusi satu baris klaim (NEW/OLD)
+    def klaim_add(row):
+        return f'''
+            INSERT INTO provider_risk (faskes_id, claim_count, total_spend, anomaly_count)
+            SELECT {row}.faskes_id, 1, COALESCE({row}.total_biaya, 0), COALESCE({row}.status, '') = 'Anomalous'
+            WHERE {row}.faskes_id IS NOT NULL
+            ON CONFLICT(faskes_id) DO UPDATE SET
+                claim_count = claim_count + 1,
+                total_spend = total_spend + excluded.total_spend,
+                anomaly_count = anomaly_count + excluded.anomaly_count;
+            INSERT INTO provider_risk_month (faskes_id, month, claim_count, anomaly_count, total_spend)
+            SELECT {row}.faskes_id, strftime('%Y-%m', {row}.tgl_pengajuan), 1,
+                   COALESCE({row}.status, '') = 'Anomalous', COALESCE({row}.total_biaya, 0)
+            WHERE {row}.faskes_id IS NOT NULL
+            ON CONFLICT(faskes_id, month) DO UPDATE SET
+                claim_count = claim_count + 1,
+                anomaly_count = anomaly_count + excluded.anomaly_count,
+                total_spend = total_spend + excluded.total_spend;
+        '''
+
+    def klaim_remove(row):
+        return f'''
+            UPDATE provider_risk SET
+                claim_count = claim_count - 1,
+                total_spend = total_spend - COALESCE({row}.total_biaya, 0),
+                anomaly_count = anomaly_count - (COALESCE({row}.status, '') = 'Anomalous')
+            WHERE faskes_id = {row}.faskes_id;
+            UPDATE provider_risk_month SET
+                claim_count = claim_count - 1,
+                anomaly_count = anomaly_count - (COALESCE({row}.status, '') = 'Anomalous'),
+                total_spend = total_spend - COALESCE({row}.total_biaya, 0)
+            WHERE faskes_id = {row}.faskes_id AND month = strftime('%Y-%m', {row}.tgl_pengajuan);
+        '''
+
+    def alert_add(row):
+        return f'''
+            INSERT INTO provider_risk (faskes_id, alert_count, high_alert_count)
+            SELECT k.faskes_id, 1, COALESCE({row}.alert_level, '') = 'High'
+            FROM klaim k WHERE k.klaim_id = {row}.klaim_id AND k.faskes_id IS NOT NULL
+            ON CONFLICT(faskes_id) DO UPDATE SET
+                alert_count = alert_count + 1,
+                high_alert_count = high_alert_count + excluded.high_alert_count;
+            INSERT INTO provider_risk_reason (faskes_id, reason_code, alert_count)
+            SELECT k.faskes_id, COALESCE({row}.reason_code, 'Unknown'), 1
+            FROM klaim k WHERE k.klaim_id = {row}.klaim_id AND k.faskes_id IS NOT NULL
+            ON CONFLICT(faskes_id, reason_code) DO UPDATE SET alert_count = alert_count + 1;
+        '''
+
+    def alert_remove(row):
+        return f'''
+            UPDATE provider_risk SET
+                alert_count = alert_count - 1,
+                high_alert_count = high_alert_count - (COALESCE({row}.alert_level, '') = 'High')
+            WHERE faskes_id = (SELECT faskes_id FROM klaim WHERE klaim_id = {row}.klaim_id);
+            UPDATE provider_risk_reason SET alert_count = alert_count - 1
+            WHERE faskes_id = (SELECT faskes_id FROM klaim WHERE klaim_id = {row}.klaim_id)
+              AND reason_code = COALESCE({row}.reason_code, 'Unknown');
+        '''
+
+    triggers = {
+        'trg_klaim_insert_risk': ('AFTER INSERT ON klaim', klaim_add('NEW')),
+        'trg_klaim_delete_risk': ('AFTER DELETE ON klaim', klaim_remove('OLD')),
+        'trg_klaim_update_risk': ('AFTER UPDATE OF status, total_biaya, faskes_id, tgl_pengajuan ON klaim',
+                                  klaim_remove('OLD') + klaim_add('NEW')),
+        'trg_fraud_alert_insert_risk': ('AFTER INSERT ON fraud_alert', alert_add('NEW')),
+        'trg_fraud_alert_delete_risk': ('AFTER DELETE ON fraud_alert', alert_remove('OLD')),
+        'trg_fraud_alert_update_risk': ('AFTER UPDATE OF alert_level, reason_code, klaim_id ON fraud_alert',
+                                        alert_remove('OLD') + alert_add('NEW')),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+
+
+def _create_report_cube_store(cursor):
+    """
+    Cube laporan yang dijaga trigger pada klaim/fraud_alert, sehingga laporan
+    rentang tanggal mana pun cukup menjumlahkan baris cube. Perubahan dimensi
+    klaim (status, tanggal, faskes, ...) ikut memindahkan kontribusi alert-nya.
+    Rebuild penuh (paralel) ada di report_cube.py.
+    """
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS report_cube (
+            day INTEGER NOT NULL, -- YYYYMMDD dari tgl_pengajuan
+            faskes_id INTEGER NOT NULL,
+            diagnosis_id INTEGER NOT NULL,
+            alert_level TEXT NOT NULL, -- '' untuk baris fakta klaim
+            status TEXT NOT NULL, -- status klaim
+            claim_count INTEGER NOT NULL DEFAULT 0,
+            total_spend REAL NOT NULL DEFAULT 0,
+            alert_count INTEGER NOT NULL DEFAULT 0,
+            alert_spend REAL NOT NULL DEFAULT 0, -- total_biaya klaim yang ber-alert
+            PRIMARY KEY ({CUBE_KEY})
+        ) WITHOUT ROWID
+    ''')
+
+    def dims(row):
+        return (f"{cube_day_sql(row)}, COALESCE({row}.faskes_id, 0), "
+                f"COALESCE({row}.diagnosis_id, 0)")
+
+    def klaim_add(row):
+        return CUBE_UPSERT_SQL.format(select=f'''
+            SELECT {dims(row)}, '', COALESCE({row}.status, ''), 1, COALESCE({row}.total_biaya, 0), 0, 0
+        ''') + ';' + CUBE_UPSERT_SQL.format(select=f'''
+            SELECT {dims(row)}, COALESCE(NULLIF(f.alert_level, ''), 'Unknown'), COALESCE({row}.status, ''),
+                   0, 0, COUNT(*), COUNT(*) * COALESCE({row}.total_biaya, 0)
+            FROM fraud_alert f WHERE f.klaim_id = {row}.klaim_id
+            GROUP BY COALESCE(NULLIF(f.alert_level, ''), 'Unknown')
+        ''') + ';'
+
+    def klaim_remove(row):
+        alerts = (f"(SELECT COUNT(*) FROM fraud_alert f WHERE f.klaim_id = {row}.klaim_id "
+                  f"AND COALESCE(NULLIF(f.alert_level, ''), 'Unknown') = report_cube.alert_level)")
+        return f'''
+            UPDATE report_cube SET
+                claim_count = claim_count - (alert_level = ''),
+                total_spend = total_spend - (alert_level = '') * COALESCE({row}.total_biaya, 0),
+                alert_count = alert_count - {alerts},
+                alert_spend = alert_spend - {alerts} * COALESCE({row}.total_biaya, 0)
+            WHERE (day, faskes_id, diagnosis_id) = ({dims(row)}) AND status = COALESCE({row}.status, '');
+        '''
+
+    def alert_add(row):
+        return CUBE_UPSERT_SQL.format(select=f'''
+            SELECT {dims('k')}, COALESCE(NULLIF({row}.alert_level, ''), 'Unknown'), COALESCE(k.status, ''),
+                   0, 0, 1, COALESCE(k.total_biaya, 0)
+            FROM klaim k WHERE k.klaim_id = {row}.klaim_id
+        ''') + ';'
+
+    def alert_remove(row):
+        return f'''
+            UPDATE report_cube SET
+                alert_count = alert_count - 1,
+                alert_spend = alert_spend - (SELECT COALESCE(total_biaya, 0) FROM klaim WHERE klaim_id = {row}.klaim_id)
+            WHERE (day, faskes_id, diagnosis_id, status) = (
+                SELECT {dims('k')}, COALESCE(k.status, '') FROM klaim k WHERE k.klaim_id = {row}.klaim_id)
+              AND alert_level = COALESCE(NULLIF({row}.alert_level, ''), 'Unknown');
+        '''
+
+    triggers = {
+        'trg_klaim_insert_cube': ('AFTER INSERT ON klaim', klaim_add('NEW')),
+        'trg_klaim_delete_cube': ('AFTER DELETE ON klaim', klaim_remove('OLD')),
+        'trg_klaim_update_cube': ('AFTER UPDATE OF status, total_biaya, faskes_id, diagnosis_id, tgl_pengajuan ON klaim',
+                                  klaim_remove('OLD') + klaim_add('NEW')),
+        'trg_fraud_alert_insert_cube': ('AFTER INSERT ON fraud_alert', alert_add('NEW')),
+        'trg_fraud_alert_delete_cube': ('AFTER DELETE ON fraud_alert', alert_remove('OLD')),
+        'trg_fraud_alert_update_cube': ('AFTER UPDATE OF alert_level, klaim_id ON fraud_alert',
+                                        alert_remove('OLD') + alert_add('NEW')),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+
+    # Database lama: isi cube sekali dari data yang sudah ada
+    if cursor.execute("SELECT 1 FROM report_cube LIMIT 1").fetchone() is None:
+        for facts in (CUBE_KLAIM_FACTS_SQL, CUBE_ALERT_FACTS_SQL):
+            cursor.execute(CUBE_UPSERT_SQL.format(select=facts.format(where='1')))
+
+
+def _create_feature_store(cursor):
+    """
+    Bucket harian yang dijaga trigger pada klaim, sehingga scoring bisa
+    membaca riwayat peserta dan faskes dengan satu range scan per key
+    (lihat feature_store.lookup). Bucket yang kosong karena klaim dihapus/
+    dipindah langsung dibuang. Backfill penuh ada di feature_store.py.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS feature_peserta_day (
+            peserta_id INTEGER NOT NULL,
+            day INTEGER NOT NULL, -- YYYYMMDD dari tgl_pengajuan
+            claim_count INTEGER NOT NULL DEFAULT 0,
+            total_spend REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (peserta_id, day)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS feature_provider_day (
+            faskes_id INTEGER NOT NULL,
+            diagnosis_id INTEGER NOT NULL, -- 0 untuk klaim tanpa diagnosis
+            day INTEGER NOT NULL,
+            claim_count INTEGER NOT NULL DEFAULT 0,
+            total_spend REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (faskes_id, diagnosis_id, day)
+        ) WITHOUT ROWID
+    ''')
+
+    def klaim_add(row):
+        return f'''
+            INSERT INTO feature_peserta_day (peserta_id, day, claim_count, total_spend)
+            SELECT {row}.peserta_id, {cube_day_sql(row)}, 1, COALESCE({row}.total_biaya, 0)
+            WHERE {row}.peserta_id IS NOT NULL
+            ON CONFLICT(peserta_id, day) DO UPDATE SET
+                claim_count = claim_count + 1,
+                total_spend = total_spend + excluded.total_spend;
+            INSERT INTO feature_provider_day (faskes_id, diagnosis_id, day, claim_count, total_spend)
+            SELECT {row}.faskes_id, COALESCE({row}.diagnosis_id, 0), {cube_day_sql(row)}, 1, COALESCE({row}.total_biaya, 0)
+            WHERE {row}.faskes_id IS NOT NULL
+            ON CONFLICT(faskes_id, diagnosis_id, day) DO UPDATE SET
+                claim_count = claim_count + 1,
+                total_spend = total_spend + excluded.total_spend;
+        '''
+
+    def klaim_remove(row):
+        peserta_key = f"peserta_id = {row}.peserta_id AND day = {cube_day_sql(row)}"
+        provider_key = (f"faskes_id = {row}.faskes_id AND diagnosis_id = COALESCE({row}.diagnosis_id, 0) "
+                        f"AND day = {cube_day_sql(row)}")
+        return f'''
+            UPDATE feature_peserta_day SET
+                claim_count = claim_count - 1,
+                total_spend = total_spend - COALESCE({row}.total_biaya, 0)
+            WHERE {peserta_key};
+            DELETE FROM feature_peserta_day WHERE {peserta_key} AND claim_count <= 0;
+            UPDATE feature_provider_day SET
+                claim_count = claim_count - 1,
+                total_spend = total_spend - COALESCE({row}.total_biaya, 0)
+            WHERE {provider_key};
+            DELETE FROM feature_provider_day WHERE {provider_key} AND claim_count <= 0;
+        '''
+
+    # Status klaim bukan fitur, jadi update status (triage/rescore) tidak memicu trigger ini
+    triggers = {
+        'trg_klaim_insert_features': ('AFTER INSERT ON klaim', klaim_add('NEW')),
+        'trg_klaim_delete_features': ('AFTER DELETE ON klaim', klaim_remove('OLD')),
+        'trg_klaim_update_features': ('AFTER UPDATE OF total_biaya, faskes_id, diagnosis_id, peserta_id, tgl_pengajuan ON klaim',
+                                      klaim_remove('OLD') + klaim_add('NEW')),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+
+    # Database lama: isi bucket sekali dari klaim yang sudah ada
+    if (cursor.execute("SELECT 1 FROM feature_peserta_day LIMIT 1").fetchone() is None
+            and cursor.execute("SELECT 1 FROM feature_provider_day LIMIT 1").fetchone() is None):
+        cursor.execute(FEATURE_PESERTA_FACTS_SQL)
+        cursor.execute(FEATURE_PROVIDER_FACTS_SQL)
+
+
+# Kolom yang dikirim ke konsumen CDC per tabel; update di luar kolom ini
+# (mis. lease triage, triage_key) tidak menghasilkan event
+CDC_COLUMNS = {
+    'klaim': ('klaim_id', ('klaim_id', 'nomor_klaim', 'tgl_pengajuan', 'total_biaya', 'status',
+                           'faskes_id', 'diagnosis_id', 'peserta_id')),
+    'fraud_alert': ('alert_id', ('alert_id', 'klaim_id', 'alert_level', 'reason_code', 'ai_confidence',
+                                 'status', 'is_resolved', 'action', 'created_at')),
+}
+
+def _create_change_log(cursor):
+    """
+    Log perubahan append-only untuk konsumen hilir (lihat cdc.py). seq
+    AUTOINCREMENT naik monoton dan tidak pernah dipakai ulang walau baris
+    lama dikompaksi; karena SQLite hanya punya satu writer, urutan seq sama
+    dengan urutan commit.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tbl TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL, -- insert, update, delete, archive (dihapus job retensi)
+            changed_at REAL NOT NULL, -- epoch detik
+            data TEXT -- JSON kolom CDC_COLUMNS (baris lama untuk delete)
+        )
+    ''')
+    # Kompaksi mencari perubahan berikutnya untuk baris yang sama
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log(tbl, row_id, seq)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cdc_consumer (
+            name TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL DEFAULT 0, -- seq terakhir yang sudah diproses konsumen
+            updated_at REAL
+        )
+    ''')
+    # Hanya berisi baris di dalam transaksi hapus job retensi (dihapus lagi sebelum
+    # commit, lihat retention._delete_batch): delete selama itu dicatat sebagai 'archive'
+    cursor.execute("CREATE TABLE IF NOT EXISTS cdc_archive_mark (active INTEGER)")
+    delete_op = "CASE WHEN EXISTS (SELECT 1 FROM cdc_archive_mark) THEN 'archive' ELSE 'delete' END"
+
+    now = "(julianday('now') - 2440587.5) * 86400.0"
+    for table, (key, columns) in CDC_COLUMNS.items():
+        def log(op, row):
+            fields = ', '.join(f"'{c}', {row}.{c}" for c in columns)
+            return (f"INSERT INTO change_log (tbl, row_id, op, changed_at, data) "
+                    f"VALUES ('{table}', {row}.{key}, {op}, {now}, json_object({fields}));")
+        changed = ' OR '.join(f"OLD.{c} IS NOT NEW.{c}" for c in columns)
+        triggers = {
+            f'trg_{table}_insert_cdc': (f'AFTER INSERT ON {table}', log("'insert'", 'NEW')),
+            f'trg_{table}_delete_cdc': (f'AFTER DELETE ON {table}', log(delete_op, 'OLD')),
+            f'trg_{table}_update_cdc': (f"AFTER UPDATE OF {', '.join(columns)} ON {table} WHEN {changed}",
+                                        log("'update'", 'NEW')),
+        }
+        existing = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                                  (f'trg_{table}_delete_cdc',)).fetchone()
+        if existing and 'cdc_archive_mark' not in existing[0]:
+            # v13 -> v14: trigger delete lama selalu mencatat 'delete'
+            cursor.execute(f"DROP TRIGGER trg_{table}_delete_cdc")
+        for name, (event, body) in triggers.items():
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+
+    # Database lama: baris yang sudah ada masuk log sekali sebagai insert,
+    # agar konsumen yang mulai dari seq 0 mendapat keadaan lengkap
+    if cursor.execute("SELECT 1 FROM change_log LIMIT 1").fetchone() is None:
+        for table, (key, columns) in CDC_COLUMNS.items():
+            fields = ', '.join(f"'{c}', {c}" for c in columns)
+            cursor.execute(f'''
+                INSERT INTO change_log (tbl, row_id, op, changed_at, data)
+                SELECT '{table}', {key}, 'insert', {now}, json_object({fields}) FROM {table} ORDER BY {key}
+            ''')
+
+def _triage_key_sql(row):
+    return f'''
+        (CASE {row}.alert_level WHEN 'High' THEN 3 WHEN 'Medium' THEN 2 ELSE 1 END) * {TRIAGE_LEVEL_WEIGHT}
+        + COALESCE({row}.ai_confidence, 0)
+        + MIN(COALESCE((SELECT total_biaya FROM klaim WHERE klaim_id = {row}.klaim_id), 0) / {TRIAGE_AMOUNT_CAP}, 1.0)
+        - {TRIAGE_AGE_WEIGHT} * COALESCE(julianday({row}.created_at), julianday('now', 'localtime'))
+    '''
+
+def _create_triage_store(cursor):
+    """triage_key dijaga trigger agar semua jalur insert alert (API, worker, rescore, kolusi) ikut terurut."""
+    existing = cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_fraud_alert_insert_triage'").fetchone()
+    if existing and _triage_key_sql('NEW') not in existing[0]:
+        # v12 -> v13: rumus berubah; trigger dibuat ulang dan semua key dihitung ulang di bawah
+        cursor.execute("DROP TRIGGER trg_fraud_alert_insert_triage")
+        cursor.execute("DROP TRIGGER IF EXISTS trg_fraud_alert_update_triage")
+        cursor.execute("UPDATE fraud_alert SET triage_key = NULL")
+    for name, event in (('trg_fraud_alert_insert_triage', 'AFTER INSERT ON fraud_alert'),
+                        ('trg_fraud_alert_update_triage',
+                         'AFTER UPDATE OF alert_level, ai_confidence, created_at, klaim_id ON fraud_alert')):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name} {event}
+            BEGIN
+                UPDATE fraud_alert SET triage_key = {_triage_key_sql('NEW')} WHERE alert_id = NEW.alert_id;
+            END
+        ''')
+    cursor.execute(f"UPDATE fraud_alert SET triage_key = {_triage_key_sql('fraud_alert')} WHERE triage_key IS NULL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fraud_alert_triage ON fraud_alert(status, triage_key DESC)")
+
+def init_database(path=None):
+    conn = get_primary_connection(path)
+    # Marker migrasi: skema sudah versi terbaru, tidak ada yang perlu dicek
+    if conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+        conn.close()
+        return
+    cursor = conn.cursor()
+
+    # Database baru: ruang bekas baris yang diarsip bisa dikembalikan
+    # bertahap (PRAGMA incremental_vacuum) tanpa VACUUM penuh
+    if not cursor.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone():
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+    # Skema lama (v1) dimigrasi dulu sebelum CREATE/INDEX di bawah
+    if 'provider' in _table_columns(cursor, 'klaim'):
+        _migrate_v1_to_v2(conn)
+    
+    # 1. Tabel Pengguna
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            username TEXT UNIQUE,
+            email TEXT,
+            password_hash TEXT,
+            full_name TEXT,
+            role TEXT,
+            is_active INTEGER DEFAULT 1,
+            last_login TIMESTAMP
+        )
+    ''')
+    if 'last_login' not in _table_columns(cursor, 'users'):
+        # v6 -> v7
+        cursor.execute("ALTER TABLE users ADD COLUMN last_login TIMESTAMP")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS revoked_token (
+            revoke_id INTEGER PRIMARY KEY, -- urutan untuk refresh incremental
+            jti TEXT, -- NULL = semua token user_id yang terbit sebelum revoked_at
+            user_id TEXT,
+            revoked_at REAL, -- epoch detik
+            expires_at REAL -- setelah ini baris boleh dihapus
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_revoked_token_expires ON revoked_token(expires_at)")
+
+    # 2. Dimensi Faskes & Diagnosis (surrogate key INTEGER)
+    _create_dimension_tables(cursor)
+
+    # 3. Tabel Klaim & Fraud Alert (mereferensikan dimensi dengan INTEGER)
+    _create_fact_tables(cursor)
+    if 'peserta_id' not in _table_columns(cursor, 'klaim'):
+        # v2 -> v3: kolom baru nullable, klaim lama tetap tanpa peserta
+        cursor.execute("ALTER TABLE klaim ADD COLUMN peserta_id INTEGER REFERENCES peserta(peserta_id)")
+    if 'trace' not in _table_columns(cursor, 'fraud_alert'):
+        # v3 -> v4: alert lama tetap memakai description teks
+        cursor.execute("ALTER TABLE fraud_alert ADD COLUMN trace BLOB")
+    if 'triage_key' not in _table_columns(cursor, 'fraud_alert'):
+        # v4 -> v5: kolom triage; triage_key diisi setelah trigger dibuat
+        cursor.execute("ALTER TABLE fraud_alert ADD COLUMN triage_key REAL")
+        cursor.execute("ALTER TABLE fraud_alert ADD COLUMN assigned_to TEXT")
+        cursor.execute("ALTER TABLE fraud_alert ADD COLUMN lease_until REAL")
     
     # 4. Tabel Audit Trail (Jejak Digital Nyata)
     cursor.execute('''
@@ -85,18 +1089,121 @@ def init_database():
             data TEXT
         )
     ''')
-    
+
+    # 6. Antrian Scoring (durable queue untuk ingest async, lihat scoring_queue.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS klaim_queue (
+            queue_id INTEGER PRIMARY KEY,
+            nomor_klaim TEXT,
+            payload TEXT, -- JSON body request asli
+            status TEXT, -- Queued, Processing, Done, Dead
+            attempts INTEGER DEFAULT 0,
+            enqueued_at REAL, -- epoch detik
+            available_at REAL, -- untuk backoff retry
+            leased_until REAL,
+            worker TEXT,
+            finished_at REAL,
+            klaim_id INTEGER,
+            result TEXT, -- JSON hasil analisis
+            last_error TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_klaim_queue_status ON klaim_queue(status, available_at)")
+
+    # Respons tersimpan per Idempotency-Key POST /api/klaim (lihat idempotency.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS idempotency_key (
+            idem_key TEXT PRIMARY KEY,
+            fingerprint TEXT, -- sha256 body request
+            status_code INTEGER,
+            body BLOB, -- JSON respons asli
+            created_at REAL -- epoch detik, untuk kedaluwarsa
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_key_created ON idempotency_key(created_at)")
+
+    # 7. Progres re-scoring historis (lihat rescore.py), agar bisa dilanjutkan
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rescore_run (
+            run_id INTEGER PRIMARY KEY,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            partition_size INTEGER,
+            status TEXT -- Running, Completed
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rescore_partition (
+            run_id INTEGER,
+            lo INTEGER, -- klaim_id awal (inklusif)
+            hi INTEGER, -- klaim_id akhir (eksklusif)
+            status TEXT, -- Pending, Done
+            inserted INTEGER DEFAULT 0,
+            updated INTEGER DEFAULT 0,
+            cleared INTEGER DEFAULT 0,
+            PRIMARY KEY (run_id, lo)
+        )
+    ''')
+
+    # 8. Counter versi data per tabel (dasar ETag, lihat http_cache.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_version (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for table in DATA_VERSION_TABLES:
+        cursor.execute("INSERT OR IGNORE INTO data_version (name, version) VALUES (?, 0)", (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE data_version SET version = version + 1 WHERE name = '{table}';
+                END
+            ''')
+
+    # 9. Profil risiko provider (lihat provider_risk.py)
+    _create_provider_risk_store(cursor)
+
+    # 10. Antrian triage alert (lihat triage.py)
+    _create_triage_store(cursor)
+
+    # 11. Cube laporan lintas periode (lihat report_cube.py)
+    _create_report_cube_store(cursor)
+
+    # 12. Feature store riwayat peserta & faskes untuk scoring (lihat feature_store.py)
+    _create_feature_store(cursor)
+
+    # 13. Change data capture klaim & fraud_alert untuk sistem hilir (lihat cdc.py)
+    _create_change_log(cursor)
+
+    # WAL agar worker scoring dan pembaca API tidak saling blokir
+    # (journal_mode tidak bisa diganti di dalam transaksi yang terbuka)
+    conn.commit()
+    cursor.execute("PRAGMA journal_mode = WAL")
+
+    # 14. Index pada kolom join/sort (semuanya INTEGER atau timestamp pendek)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_klaim_tgl ON klaim(tgl_pengajuan)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_klaim_faskes ON klaim(faskes_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_klaim_peserta ON klaim(peserta_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fraud_alert_klaim ON fraud_alert(klaim_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fraud_alert_created ON fraud_alert(created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_trail_timestamp ON audit_trail(timestamp)")
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
     conn.commit()
     conn.close()
     print("✅ Struktur Database Validasi (Arsitektur Sentinel).")
 
 def seed_sample_data():
-    conn = get_db_connection()
+    conn = get_primary_connection()
     cursor = conn.cursor()
     
     # Cek apakah data sudah ada agar tidak duplikat saat restart
-    cursor.execute("SELECT COUNT(*) FROM klaim")
-    if cursor.fetchone()[0] > 50:
+    # (cukup cari baris ke-51, tanpa COUNT(*) atas seluruh klaim)
+    cursor.execute("SELECT 1 FROM klaim LIMIT 1 OFFSET 50")
+    if cursor.fetchone():
         print("ℹ️  Data sudah ada. Melewati proses seeding.")
         conn.close()
         return
@@ -108,23 +1215,37 @@ def seed_sample_data():
                   (str(uuid.uuid4()), 'admin', 'admin@bpjs.go.id', generate_password_hash('admin123'), 'Super Admin', 'admin'))
 
     # Skenario Data (Pattern Generation)
-    providers = ['RSUD Cengkareng', 'RS Harapan Kita', 'Klinik Sehat Budi', 'Puskesmas Tebet', 'RS Hermina']
+    providers = [
+        ('RSUD Cengkareng', 'RS', 'Jakarta'),
+        ('RS Harapan Kita', 'RS', 'Jakarta'),
+        ('Klinik Sehat Budi', 'Klinik', 'Bandung'),
+        ('Puskesmas Tebet', 'Puskesmas', 'Jakarta'),
+        ('RS Hermina', 'RS', 'Bandung'),
+    ]
     diagnoses = ['J00', 'I10', 'E11', 'A09', 'Z00']
+
+    # Isi dimensi lebih dulu agar klaim cukup menyimpan id INTEGER
+    faskes_ids = {nama: faskes_cache.id_for(cursor, nama, tipe=tipe, wilayah=wilayah)
+                  for nama, tipe, wilayah in providers}
+    diagnosis_ids = {code: diagnosis_cache.id_for(cursor, code) for code in diagnoses}
+    # Sekelompok kecil peserta yang "dioper" antar faskes yang sama (pola kolusi)
+    ring_faskes = ('Klinik Sehat Budi', 'RS Hermina', 'Puskesmas Tebet')
+    ring_peserta = [f"000{100000000 + n}" for n in range(8)]
     
     today = datetime.now()
     
     # Loop membuat 400 data dummy
     for i in range(400): 
-        klaim_id = str(uuid.uuid4())
-        
         # Distribusi tanggal (acak dalam 1 tahun terakhir)
         days_back = int(random.triangular(0, 365, 30)) 
         tgl = (today - timedelta(days=days_back)).strftime('%Y-%m-%d %H:%M:%S')
         
-        provider = random.choice(providers)
+        provider = random.choice(providers)[0]
         biaya = random.randint(150000, 5000000)
         status = 'Verified'
         diagnosis = random.choice(diagnoses)
+        peserta = f"000{100000000 + random.randint(8, 20000)}"
+        alert = None
         
         # === INJEKSI LOGIKA FRAUD (Agar AI mendeteksi sesuatu) ===
         
@@ -132,38 +1253,42 @@ def seed_sample_data():
         if provider == 'RSUD Cengkareng' and random.random() > 0.75:
             biaya = random.randint(15000000, 45000000) # Biaya sangat tinggi tidak wajar
             status = 'Anomalous'
-            
-            # Buat Alert
-            alert_id = str(uuid.uuid4())
-            cursor.execute('''
-                INSERT INTO fraud_alert (alert_id, klaim_id, alert_level, reason_code, ai_confidence, description, created_at, status, action)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (alert_id, klaim_id, 'High', 'Upcoding', 0.98, 
-                  f"Biaya Rp {biaya:,} terdeteksi 400% di atas rata-rata diagnosis {diagnosis}.", 
-                  tgl, 'Open', 'Investigate'))
+            alert = ('High', 'Upcoding', 0.98,
+                     f"Biaya Rp {biaya:,} terdeteksi 400% di atas rata-rata diagnosis {diagnosis}.",
+                     'Investigate')
         
         # Pola 2: Phantom Billing (Klaim Fiktif) di Puskesmas Tebet
         elif provider == 'Puskesmas Tebet' and random.random() > 0.85:
             status = 'Anomalous'
             biaya = 250000 # Biaya kecil
+            alert = ('Medium', 'Phantom Billing', 0.75,
+                     f"Terdeteksi pola klaim berulang identik dalam kurun waktu 24 jam.",
+                     'Review')
             
-            alert_id = str(uuid.uuid4())
-            cursor.execute('''
-                INSERT INTO fraud_alert (alert_id, klaim_id, alert_level, reason_code, ai_confidence, description, created_at, status, action)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (alert_id, klaim_id, 'Medium', 'Phantom Billing', 0.75, 
-                  f"Terdeteksi pola klaim berulang identik dalam kurun waktu 24 jam.", 
-                  tgl, 'Open', 'Review'))
-            
+        # Pola 3: Kolusi - peserta yang sama berputar di beberapa faskes
+        elif provider in ring_faskes and random.random() > 0.7:
+            peserta = random.choice(ring_peserta)
+            if random.random() > 0.9: status = 'Pending'
+
         # Pola Normal (Sisanya random pending atau verified)
         else:
             if random.random() > 0.9: status = 'Pending'
         
         cursor.execute('''
-            INSERT INTO klaim (klaim_id, nomor_klaim, tgl_pengajuan, total_biaya, status, provider, diagnosis_code, created_at)
+            INSERT INTO klaim (nomor_klaim, tgl_pengajuan, total_biaya, status, faskes_id, diagnosis_id, created_at, peserta_id)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (klaim_id, f"CLM-{2024}-{10000+i}", tgl, biaya, status, provider, diagnosis, tgl))
+        ''', (f"CLM-{2024}-{10000+i}", tgl, biaya, status, faskes_ids[provider], diagnosis_ids[diagnosis], tgl,
+              peserta_cache.id_for(cursor, peserta)))
+        klaim_id = cursor.lastrowid
+
+        # Buat Alert
+        if alert:
+            level, reason, confidence, description, action = alert
+            cursor.execute('''
+                INSERT INTO fraud_alert (klaim_id, alert_level, reason_code, ai_confidence, description, created_at, status, action)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (klaim_id, level, reason, confidence, description, tgl, 'Open', action))
 
     conn.commit()
     conn.close()
-    print("✅ Seeding Data Cerdas Selesai.")
\ No newline at end of file
+    print("✅ Seeding Data Cerdas Selesai.")
@@ -0,0 +1,173 @@
+"""
+Feature Store Riwayat Klaim
+Fitur rolling per peserta (frekuensi & nilai klaim) dan per faskes x
+diagnosis (rata-rata biaya terkini) untuk FraudDetectionEngine. Datanya
+bucket harian feature_peserta_day / feature_provider_day yang dijaga
+trigger pada klaim (lihat database._create_feature_store), jadi setiap
+klaim yang masuk lewat jalur mana pun langsung tercermin.
+
+lookup() mengambil fitur untuk satu batch klaim dengan satu query per
+tabel, bukan beberapa query agregat per klaim.
+
+Backfill with: python feature_store.py --backfill
+"""
+
+import argparse
+import os
+import time
+from datetime import date, datetime, timedelta
+
+from database import (get_primary_connection, init_database, faskes_cache, diagnosis_cache, peserta_cache,
+                      begin_immediate, FEATURE_PESERTA_FACTS_SQL, FEATURE_PROVIDER_FACTS_SQL)
+
+WINDOW_DAYS = int(os.environ.get('SATRIA_FEATURE_WINDOW_DAYS', 30))
+
+EMPTY_FEATURES = {
+    'patient_claims': 0,
+    'patient_spend': 0.0,
+    'patient_days_since_last': None,
+    'provider_dx_claims': 0,
+    'provider_dx_avg_cost': None,
+}
+
+def _as_of_day(value):
+    """Timestamp/tanggal klaim -> date; None atau format asing = hari ini."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if value:
+        try:
+            return datetime.fromisoformat(str(value)).date()
+        except ValueError:
+            pass
+    return date.today()
+
+def _day_key(day):
+    return day.year * 10000 + day.month * 100 + day.day
+
+def _buckets(cursor, sql, keys, lo, hi):
+    """{key: [(day, claim_count, total_spend), ...]} untuk bucket lo < day <= hi."""
+    result = {}
+    if not keys:
+        return result
+    cursor.execute(sql.format(keys=', '.join('?' for _ in keys)), list(keys) + [lo, hi])
+    for row in cursor.fetchall():
+        result.setdefault(tuple(row[:-3]), []).append(tuple(row[-3:]))
+    return result
+
+def lookup(cursor, items, as_of=None, stored=False):
+    """
+    Fitur riwayat untuk tiap payload klaim di `items` (field no_kartu,
+    provider, diagnosis_code, total_biaya), berurutan sama dengan items.
+
+    as_of: list timestamp per klaim (jendela berakhir di hari itu); default
+    hari ini. stored=True bila klaim sudah tersimpan (rescore): kontribusi
+    klaim itu sendiri dikeluarkan dari bucket harinya. Klaim lain dalam
+    batch yang sama belum tersimpan tidak ikut terhitung.
+    """
+    if not items:
+        return []
+    days = [_as_of_day(t) for t in (as_of or [None] * len(items))]
+    keys = [_day_key(d) for d in days]
+    cuts = [_day_key(d - timedelta(days=WINDOW_DAYS)) for d in days]
+    lo, hi = min(cuts), max(keys)
+
+    peserta = peserta_cache.ids_for(cursor, [data.get('no_kartu') for data in items])
+    faskes = faskes_cache.ids_for(cursor, [data.get('provider') for data in items])
+    diagnosis = diagnosis_cache.ids_for(cursor, [data.get('diagnosis_code') for data in items])
+
+    def key(cache_ids, value):
+        return cache_ids.get(value) if isinstance(value, (str, int)) else None
+
+    peserta_ids = {key(peserta, data.get('no_kartu')) for data in items} - {None}
+    faskes_ids = {key(faskes, data.get('provider')) for data in items} - {None}
+    patient_rows = _buckets(cursor, '''
+        SELECT peserta_id, day, claim_count, total_spend FROM feature_peserta_day
+        WHERE peserta_id IN ({keys}) AND day > ? AND day <= ?
+    ''', peserta_ids, lo, hi)
+    # Superset (semua diagnosis faskes tsb.) tetap memakai PRIMARY KEY; disaring di bawah
+    provider_rows = _buckets(cursor, '''
+        SELECT faskes_id, diagnosis_id, day, claim_count, total_spend FROM feature_provider_day
+        WHERE faskes_id IN ({keys}) AND day > ? AND day <= ?
+    ''', faskes_ids, lo, hi)
+
+    results = []
+    for data, day, day_key, cut in zip(items, days, keys, cuts):
+        features = dict(EMPTY_FEATURES)
+        amount = float(data.get('total_biaya') or 0) if stored else 0.0
+        own = 1 if stored else 0
+
+        peserta_id = key(peserta, data.get('no_kartu'))
+        last = None
+        for bucket_day, count, spend in patient_rows.get((peserta_id,), ()):
+            if cut < bucket_day <= day_key:
+                if bucket_day == day_key:
+                    count, spend = count - own, spend - amount
+                if count <= 0:
+                    continue
+                features['patient_claims'] += count
+                features['patient_spend'] += spend
+                last = max(last or 0, bucket_day)
+        if last:
+            features['patient_days_since_last'] = (day - datetime.strptime(str(last), '%Y%m%d').date()).days
+
+        faskes_id = key(faskes, data.get('provider'))
+        diagnosis_id = key(diagnosis, data.get('diagnosis_code')) or 0
+        claims, spend_total = 0, 0.0
+        for bucket_day, count, spend in provider_rows.get((faskes_id, diagnosis_id), ()):
+            if cut < bucket_day <= day_key:
+                if bucket_day == day_key:
+                    count, spend = count - own, spend - amount
+                claims += count
+                spend_total += spend
+        if claims > 0:
+            features['provider_dx_claims'] = claims
+            features['provider_dx_avg_cost'] = round(spend_total / claims, 2)
+        features['patient_spend'] = round(features['patient_spend'], 2)
+        results.append(features)
+    return results
+
+# ============================================
+# BACKFILL
+# ============================================
+
+def backfill(conn):
+    """
+    Bangun ulang seluruh bucket dari klaim dalam satu transaksi (insert
+    klaim baru menunggu lock tulis, jadi tidak ada yang terhitung ganda).
+    Mengembalikan jumlah bucket per tabel.
+    """
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    begin_immediate(cursor)
+    try:
+        cursor.execute("DELETE FROM feature_peserta_day")
+        cursor.execute("DELETE FROM feature_provider_day")
+        cursor.execute(FEATURE_PESERTA_FACTS_SQL)
+        cursor.execute(FEATURE_PROVIDER_FACTS_SQL)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {
+        'feature_peserta_day': conn.execute("SELECT COUNT(*) FROM feature_peserta_day").fetchone()[0],
+        'feature_provider_day': conn.execute("SELECT COUNT(*) FROM feature_provider_day").fetchone()[0],
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Feature store riwayat klaim SATRIA JKN")
+    parser.add_argument('--backfill', action='store_true', help='Bangun ulang bucket fitur dari seluruh klaim')
+    args = parser.parse_args()
+    if not args.backfill:
+        parser.print_help()
+    else:
+        init_database()
+        conn = get_primary_connection()
+        try:
+            result = backfill(conn)
+        finally:
+            conn.close()
+        print(f"✅ Feature store dibangun ulang: {result['feature_peserta_day']} bucket peserta, "
+              f"{result['feature_provider_day']} bucket faskes x diagnosis ({result['seconds']} detik)")
@@ -0,0 +1,123 @@
+"""
+Health, Readiness & Kapasitas
+- liveness: proses hidup dan bisa menjawab; tidak menyentuh database
+- readiness: tiap file database (dan shard) bisa dibuka dan write lock bisa
+  diambil di bawah SATRIA_READY_MAX_WRITE_MS, serta thread pool/admission
+  controller tidak jenuh. Probe BEGIN IMMEDIATE lalu ROLLBACK tidak
+  menulis apa pun; hasilnya di-cache SATRIA_READY_CACHE_SECONDS agar
+  polling load balancer tidak menambah beban
+- kapasitas: in-flight, utilisasi worker, tunggu write lock, ukuran cache,
+  antrian scoring dan histogram latency terkini (lihat metrics.py)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from database import (shard_map, shard_path, replica_age, get_db_connection,
+                      faskes_cache, diagnosis_cache, peserta_cache, region_cache)
+from metrics import request_tracker, lock_wait
+from rate_limit import rate_limiter, write_admission, RATE_LIMIT_ENABLED
+from idempotency import idempotency_store
+from auth import revocation_list
+from fraud_engine import FraudDetectionEngine
+from scoring_queue import queue_metrics
+
+READY_MAX_WRITE_MS = float(os.environ.get('SATRIA_READY_MAX_WRITE_MS', 500))
+READY_CACHE_SECONDS = float(os.environ.get('SATRIA_READY_CACHE_SECONDS', 1))
+PROBE_TIMEOUT_SECONDS = 1.0
+
+def probe_database(path):
+    """Buka file (tanpa membuat file baru), baca satu halaman, lalu ambil dan lepas write lock."""
+    started = time.perf_counter()
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=rw", uri=True, timeout=PROBE_TIMEOUT_SECONDS)
+        try:
+            conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+            read_seconds = time.perf_counter() - started
+            lock_started = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE")
+            wait = time.perf_counter() - lock_started
+            conn.rollback()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        return {'ok': False, 'error': str(e)}
+    lock_wait.record(wait)
+    return {'ok': wait * 1000 <= READY_MAX_WRITE_MS,
+            'read_ms': round(read_seconds * 1000, 3), 'write_lock_ms': round(wait * 1000, 3)}
+
+class ReadinessCheck:
+    """Hasil probe terakhir; hanya satu thread yang mem-probe, yang lain memakai cache."""
+
+    def __init__(self, ttl=READY_CACHE_SECONDS):
+        self.ttl = ttl
+        self._result = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _probe(self):
+        databases = {shard.name: probe_database(shard_path(shard)) for shard in shard_map.shards}
+        reasons = []
+        for name, check in databases.items():
+            if 'error' in check:
+                reasons.append(f"database {name} tidak bisa dibuka: {check['error']}")
+            elif not check['ok']:
+                reasons.append(f"database {name}: menunggu write lock {check['write_lock_ms']} ms "
+                               f"(batas {READY_MAX_WRITE_MS:g} ms)")
+        if request_tracker.saturated():
+            reasons.append(f"thread pool jenuh: {request_tracker.queued} request menunggu "
+                           f"{request_tracker.threads} thread")
+        if RATE_LIMIT_ENABLED and write_admission.waiting >= write_admission.max_queue:
+            reasons.append("antrian admission controller tulis penuh")
+        return {'status': 'not_ready' if reasons else 'ready', 'reasons': reasons,
+                'databases': databases, 'checked_at': time.time()}
+
+    def check(self):
+        if time.monotonic() - self._checked_at < self.ttl and self._result is not None:
+            return self._result
+        if self._lock.acquire(blocking=self._result is None):
+            try:
+                if time.monotonic() - self._checked_at >= self.ttl or self._result is None:
+                    self._result = self._probe()
+                    self._checked_at = time.monotonic()
+            finally:
+                self._lock.release()
+        return self._result
+
+readiness = ReadinessCheck()
+
+def liveness():
+    return {'status': 'ok', 'pid': os.getpid(),
+            'uptime_seconds': round(time.time() - request_tracker.started_at, 1)}
+
+def capacity():
+    conn = get_db_connection()
+    try:
+        scoring = queue_metrics(conn.cursor())
+    finally:
+        conn.close()
+    return {
+        'pid': os.getpid(),
+        'requests': request_tracker.stats(),
+        'latency': {kind: histogram.snapshot().summary() for kind, histogram in request_tracker.latency.items()},
+        'database': {
+            'lock_wait': lock_wait.snapshot().summary(),
+            'replica_age_seconds': replica_age(),
+            'shards': len(shard_map.shards),
+        },
+        'write_admission': dict(write_admission.stats(), enabled=RATE_LIMIT_ENABLED,
+                                max_queue=write_admission.max_queue),
+        'scoring_queue': scoring,
+        'caches': {
+            'faskes': len(faskes_cache),
+            'diagnosis': len(diagnosis_cache),
+            'peserta': len(peserta_cache),
+            'faskes_region': len(region_cache),
+            'idempotency': len(idempotency_store),
+            'rate_limit_buckets': len(rate_limiter),
+            'revoked_tokens': len(revocation_list),
+            'provider_flags': FraudDetectionEngine.provider_flags.cache_info().currsize,
+        },
+    }
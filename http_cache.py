@@ -0,0 +1,158 @@
+"""
+Kompresi Response & Conditional GET
+- Kompresi gzip (atau brotli bila modul `brotli` terpasang) dinegosiasikan
+  lewat Accept-Encoding, hanya untuk body di atas COMPRESS_MIN_BYTES.
+- ETag kuat dihitung dari counter versi per tabel (tabel data_version yang
+  dinaikkan trigger SQLite), bukan dari hash body. Bila If-None-Match cocok,
+  handler tidak dijalankan sama sekali dan server langsung menjawab 304.
+"""
+
+import gzip
+import hashlib
+from datetime import date
+from functools import wraps
+
+from flask import request, make_response
+
+from database import get_db_connection, shard_map, scatter, gather_sum
+
+# Cek ketersediaan brotli (Opsional, gzip selalu tersedia)
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Urutan preferensi server bila q-value klien sama
+SUPPORTED_ENCODINGS = ('br', 'gzip') if BROTLI_AVAILABLE else ('gzip',)
+
+# ============================================
+# NEGOSIASI & KOMPRESI
+# ============================================
+
+def _parse_accept_encoding(header):
+    prefs = {}
+    for part in header.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        prefs[name.strip().lower()] = q
+    return prefs
+
+def negotiate_encoding(header):
+    """Pilih encoding terbaik yang didukung server, atau None untuk identity."""
+    if not header:
+        return None
+    prefs = _parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        q = prefs.get(encoding, prefs.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+def compress_response(response):
+    """after_request hook: kompres body bila klien mendukung dan cukup besar."""
+    response.vary.add('Accept-Encoding')
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or request.method == 'HEAD'
+            or 'Content-Encoding' in response.headers
+            or 'Range' in request.headers):
+        return response
+
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+    if not encoding:
+        return response
+
+    if response.direct_passthrough:
+        # send_file (PDF in-memory): baca isinya agar bisa dikompres
+        response.direct_passthrough = False
+    elif response.is_streamed:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    response.set_data(_compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # ETag kuat harus berbeda per representasi
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak=weak)
+    return response
+
+# ============================================
+# ETAG DARI COUNTER VERSI DATA
+# ============================================
+
+def data_versions(tables):
+    if not tables:
+        return ()
+    query = f"SELECT name, version FROM data_version WHERE name IN ({', '.join('?' for _ in tables)})"
+    if shard_map.enabled:
+        # Versi gabungan = jumlah versi di semua shard (masing-masing hanya naik)
+        versions = dict(gather_sum(scatter(query, tables), key_columns=1))
+        return tuple(versions.get(t, 0) for t in tables)
+    conn = get_db_connection()
+    rows = conn.execute(query, tables).fetchall()
+    conn.close()
+    versions = {row['name']: row['version'] for row in rows}
+    return tuple(versions.get(t, 0) for t in tables)
+
+def compute_etag(tables, daily=False, version=None):
+    key = f"{request.path}?{request.query_string.decode('latin-1')}|{data_versions(tables)}"
+    if version:
+        # Sumber data di luar tabel SQLite (mis. snapshot analitik)
+        key += f"|{version()}"
+    if daily:
+        # Endpoint yang memakai date('now') berubah walau data tetap
+        key += f"|{date.today().isoformat()}"
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=10).hexdigest()
+
+def conditional(*tables, daily=False, version=None):
+    """
+    Decorator GET: pasang ETag dari versi tabel yang dibaca endpoint, dan
+    jawab 304 tanpa menjalankan handler bila If-None-Match cocok. `version`
+    (callable) menambahkan komponen versi lain ke ETag.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+
+            etag = compute_etag(tables, daily, version)
+            candidates = [etag] + [f"{etag}-{enc}" for enc in SUPPORTED_ENCODINGS]
+            matched = next((tag for tag in candidates if request.if_none_match.contains(tag)), None)
+            if matched:
+                response = make_response('', 304)
+                response.set_etag(matched)
+                return response
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+        return decorated
+    return decorator
+
+def init_http_cache(app):
+    app.after_request(compress_response)
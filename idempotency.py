@@ -0,0 +1,92 @@
+"""
+Idempotency-Key untuk POST /api/klaim
+Rumah sakit mengulang request saat timeout. Respons pertama untuk setiap
+Idempotency-Key disimpan di tabel idempotency_key (dalam transaksi yang sama
+dengan klaim, jadi hanya satu request yang bisa menang) dan di LRU in-memory,
+sehingga retry langsung mendapat respons asli tanpa menjalankan engine lagi.
+Kunci kedaluwarsa setelah SATRIA_IDEMPOTENCY_TTL_SECONDS (default 24 jam).
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+KEY_TTL_SECONDS = int(os.environ.get('SATRIA_IDEMPOTENCY_TTL_SECONDS', 24 * 3600))
+CACHE_SIZE = int(os.environ.get('SATRIA_IDEMPOTENCY_CACHE_SIZE', 10000))
+MAX_KEY_LENGTH = 255
+
+StoredResponse = namedtuple('StoredResponse', ['fingerprint', 'status_code', 'body', 'created_at'])
+
+def request_fingerprint(data):
+    """Hash body request yang tidak peka urutan key/whitespace."""
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+class IdempotencyStore:
+    """
+    LRU in-memory di depan tabel idempotency_key. Tabel adalah sumber
+    kebenaran (dibagi antar proses server); LRU hanya mempercepat retry
+    yang datang ke proses yang sama. Respons tersimpan tidak pernah berubah,
+    jadi cache cukup menghormati TTL.
+    """
+
+    def __init__(self, capacity=CACHE_SIZE, ttl=KEY_TTL_SECONDS):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cache_get(self, key, now):
+        with self._lock:
+            stored = self._entries.get(key)
+            if stored is None:
+                return None
+            if now - stored.created_at >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return stored
+
+    def __len__(self):
+        return len(self._entries)
+
+    def remember(self, key, stored):
+        with self._lock:
+            self._entries[key] = stored
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def get(self, conn, key):
+        """Respons tersimpan untuk key, atau None bila belum ada/kedaluwarsa."""
+        now = time.time()
+        stored = self._cache_get(key, now)
+        if stored is not None:
+            return stored
+        row = conn.execute(
+            "SELECT fingerprint, status_code, body, created_at FROM idempotency_key WHERE idem_key = ? AND created_at > ?",
+            (key, now - self.ttl)).fetchone()
+        if row is None:
+            return None
+        stored = StoredResponse(row[0], row[1], bytes(row[2]), row[3])
+        self.remember(key, stored)
+        return stored
+
+    def save(self, cursor, key, fingerprint, status_code, body):
+        """
+        Catat respons di transaksi pemanggil (belum di-commit). Request paralel
+        dengan key sama gagal di sini dengan sqlite3.IntegrityError. Masukkan ke
+        LRU dengan remember() setelah commit berhasil.
+        """
+        now = time.time()
+        cursor.execute("DELETE FROM idempotency_key WHERE created_at <= ?", (now - self.ttl,))
+        cursor.execute('''
+            INSERT INTO idempotency_key (idem_key, fingerprint, status_code, body, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (key, fingerprint, status_code, body, now))
+        return StoredResponse(fingerprint, status_code, body, now)
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,200 @@
+"""
+Metrik Kapasitas In-Process
+Histogram latency ala HDR: bucket log-linear berukuran tetap (16 sub-bucket
+per pangkat dua, presisi ~6%, 1 us sampai ~2 menit) sehingga memori tidak
+bertambah berapa pun jumlah sampelnya. RollingHistogram memutar dua
+jendela agar yang dilaporkan hanya data terkini (1-2x WINDOW_SECONDS).
+
+RequestTracker menghitung request yang sedang berjalan, antrian thread
+pool ASGI, dan waktu sibuk worker; dipakai GET /api/health/ready dan
+/api/health/capacity. Modul ini tidak mengimpor database agar bisa dipakai
+dari mana saja (termasuk database.begin_immediate).
+"""
+
+import os
+import threading
+import time
+
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_VALUE_US = 1 << 27              # ~134 detik; sampel di atasnya masuk bucket terakhir
+WINDOW_SECONDS = float(os.environ.get('SATRIA_METRICS_WINDOW_SECONDS', 60))
+PERCENTILES = (50, 90, 99, 99.9)
+
+# Ukuran thread pool request; diisi asgi.WSGIToASGI, default sama dengan SATRIA_ASGI_THREADS
+WORKER_THREADS = int(os.environ.get('SATRIA_ASGI_THREADS', 16))
+
+def bucket_index(value_us):
+    if value_us < SUB_BUCKETS:
+        return value_us
+    shift = value_us.bit_length() - SUB_BUCKET_BITS - 1
+    return shift * SUB_BUCKETS + (value_us >> shift)
+
+def bucket_upper(index):
+    """Nilai tertinggi (us) yang masuk bucket `index`."""
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    return ((index - shift * SUB_BUCKETS + 1) << shift) - 1
+
+BUCKET_COUNT = bucket_index(MAX_VALUE_US) + 1
+
+class LatencyHistogram:
+    """Counter per bucket dalam list berukuran tetap BUCKET_COUNT."""
+
+    __slots__ = ('counts', 'total', 'sum_us', 'max_us')
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.total = 0
+        self.sum_us = 0
+        self.max_us = 0
+
+    def record(self, seconds):
+        value = min(max(int(seconds * 1e6), 0), MAX_VALUE_US)
+        self.counts[bucket_index(value)] += 1
+        self.total += 1
+        self.sum_us += value
+        if value > self.max_us:
+            self.max_us = value
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            if count:
+                self.counts[i] += count
+        self.total += other.total
+        self.sum_us += other.sum_us
+        self.max_us = max(self.max_us, other.max_us)
+
+    def percentile(self, pct):
+        if not self.total:
+            return 0
+        rank = max(1, int(self.total * pct / 100 + 0.5))
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_upper(i), self.max_us)
+        return self.max_us
+
+    def summary(self):
+        """Ringkasan dalam milidetik + bucket tidak kosong [(batas atas ms, jumlah)]."""
+        result = {'count': self.total,
+                  'mean_ms': round(self.sum_us / self.total / 1000, 3) if self.total else 0,
+                  'max_ms': round(self.max_us / 1000, 3)}
+        for pct in PERCENTILES:
+            result[f"p{pct:g}_ms".replace('.', '_')] = round(self.percentile(pct) / 1000, 3)
+        result['buckets'] = [(round(bucket_upper(i) / 1000, 3), count)
+                             for i, count in enumerate(self.counts) if count]
+        return result
+
+class RollingHistogram:
+    """Dua LatencyHistogram (jendela sekarang + sebelumnya) yang diputar tiap window detik."""
+
+    def __init__(self, window=WINDOW_SECONDS):
+        self.window = window
+        self._lock = threading.Lock()
+        self._current = LatencyHistogram()
+        self._previous = LatencyHistogram()
+        self._started = time.monotonic()
+
+    def _rotate(self, now):
+        elapsed = now - self._started
+        if elapsed >= self.window:
+            # Lebih dari dua jendela tanpa sampel: data lama sudah tidak relevan
+            self._previous = self._current if elapsed < 2 * self.window else LatencyHistogram()
+            self._current = LatencyHistogram()
+            self._started = now
+
+    def record(self, seconds):
+        with self._lock:
+            self._rotate(time.monotonic())
+            self._current.record(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            self._rotate(time.monotonic())
+            merged = LatencyHistogram()
+            merged.merge(self._previous)
+            merged.merge(self._current)
+        return merged
+
+# Waktu menunggu write lock SQLite (BEGIN IMMEDIATE, lihat database.begin_immediate)
+lock_wait = RollingHistogram()
+
+# ============================================
+# REQUEST & WORKER
+# ============================================
+
+class RequestTracker:
+    """In-flight, antrian thread pool, dan latency request per kelas (read/write)."""
+
+    def __init__(self, threads=WORKER_THREADS, window=WINDOW_SECONDS):
+        self.threads = threads
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.queued = 0
+        self.total = 0
+        self.errors = 0
+        self.latency = {'read': RollingHistogram(window), 'write': RollingHistogram(window)}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        # Waktu sibuk worker per jendela, untuk utilisasi
+        self._window = window
+        self._busy = [0.0, 0.0]
+        self._busy_started = time.monotonic()
+        self._busy_span = 0.0
+
+    def enqueue(self):
+        with self._lock:
+            self.queued += 1
+
+    def dequeue(self):
+        with self._lock:
+            self.queued -= 1
+
+    def start(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def finish(self, kind, seconds, status_code):
+        self.latency[kind].record(seconds)
+        with self._lock:
+            self.in_flight -= 1
+            self.total += 1
+            if status_code >= 500:
+                self.errors += 1
+            self._rotate_busy(time.monotonic())
+            self._busy[1] += seconds
+
+    def _rotate_busy(self, now):
+        elapsed = now - self._busy_started
+        if elapsed >= self._window:
+            self._busy = [self._busy[1] if elapsed < 2 * self._window else 0.0, 0.0]
+            self._busy_span = min(elapsed, self._window)
+            self._busy_started = now
+
+    def utilization(self):
+        """Porsi kapasitas thread yang terpakai di jendela terkini (0..1)."""
+        with self._lock:
+            now = time.monotonic()
+            self._rotate_busy(now)
+            span = self._busy_span + (now - self._busy_started)
+            busy = self._busy[0] + self._busy[1]
+        return round(min(busy / (span * self.threads), 1.0), 4) if span > 0 else 0.0
+
+    def saturated(self):
+        """Request menunggu thread lebih banyak dari jumlah thread-nya."""
+        return self.queued >= self.threads
+
+    def stats(self):
+        with self._lock:
+            result = {'in_flight': self.in_flight, 'peak_in_flight': self.peak_in_flight,
+                      'queued_for_thread': self.queued, 'worker_threads': self.threads,
+                      'total': self.total, 'errors_5xx': self.errors,
+                      'uptime_seconds': round(time.time() - self.started_at, 1)}
+        result['worker_utilization'] = self.utilization()
+        return result
+
+request_tracker = RequestTracker()
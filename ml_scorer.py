@@ -0,0 +1,434 @@
+"""
+Scorer Anomali Berbasis Model (opsional)
+Gradient-boosted trees (logistic) yang dilatih offline dari klaim + label
+fraud_alert, diserialisasi ke JSON lokal, lalu dicampur dengan skor rule di
+FraudDetectionEngine. Inference per batch: matriks fitur dilewatkan ke
+semua pohon sekaligus dengan NumPy bila terpasang, atau loop Python bila
+tidak. Tanpa file model, engine kembali ke rule murni.
+
+File model dipantau (mtime); model baru hasil --train langsung dipakai
+request berikutnya tanpa restart (hot-swap).
+Train with: python ml_scorer.py --train [--trees 60 --depth 3]
+"""
+
+import json
+import math
+import os
+import threading
+import time
+import argparse
+from bisect import bisect_right
+from datetime import datetime
+
+import database
+
+# Cek ketersediaan NumPy (Opsional, fallback ke loop Python)
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+MODEL_PATH = os.environ.get('SATRIA_ML_MODEL', 'satriajkn_model.json')
+# Porsi skor model dalam skor akhir: (1 - w) * skor rule + w * probabilitas model
+BLEND_WEIGHT = float(os.environ.get('SATRIA_ML_BLEND_WEIGHT', 0.3))
+RELOAD_CHECK_SECONDS = float(os.environ.get('SATRIA_ML_RELOAD_SECONDS', 5))
+
+MODEL_FORMAT = 1
+FEATURES = ('log_amount', 'has_diagnosis', 'under_audit', 'phantom_watch',
+            'provider_anomaly_rate', 'provider_log_claims', 'amount_vs_diagnosis')
+# Di bawah ukuran ini overhead alokasi array NumPy lebih mahal dari loop Python
+NUMPY_MIN_BATCH = 16
+PROVIDER_PRIOR_CLAIMS = 10          # Smoothing anomaly rate faskes kecil (sama dengan provider_risk)
+
+# Label: klaim dengan alert yang belum di-Resolve (Open/Flagged) dianggap fraud
+LABEL_SQL = "EXISTS (SELECT 1 FROM fraud_alert a WHERE a.klaim_id = k.klaim_id AND a.status IN ('Open', 'Flagged'))"
+
+# ============================================
+# MODEL (inference)
+# ============================================
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + math.exp(-x)) if x >= 0 else math.exp(x) / (1.0 + math.exp(x))
+
+class GradientBoostedModel:
+    """
+    Pohon biner lengkap berkedalaman tetap: node internal i punya anak 2i+1
+    dan 2i+2, baris ke kanan bila fitur >= threshold. Node tanpa split
+    memakai threshold tak hingga (selalu ke kiri).
+    """
+
+    def __init__(self, spec, use_numpy=NUMPY_AVAILABLE):
+        if spec.get('format') != MODEL_FORMAT or tuple(spec['features']) != FEATURES:
+            raise ValueError("Format/fitur model tidak cocok dengan versi kode ini")
+        self.spec = spec
+        self.version = spec['version']
+        self.depth = spec['depth']
+        self.base_margin = spec['base_margin']
+        self.providers = spec['providers']
+        self.default_provider = spec['default_provider']
+        self.diagnosis_log_mean = spec['diagnosis_log_mean']
+        self.default_log_mean = spec['default_log_mean']
+        trees = spec['trees']
+        self.features = [t['feature'] for t in trees]
+        self.thresholds = [[math.inf if v is None else v for v in t['threshold']] for t in trees]
+        self.leaves = [t['leaf'] for t in trees]
+        self.use_numpy = use_numpy
+        if use_numpy:
+            self._np_features = np.array(self.features, dtype=np.intp).reshape(len(trees), -1)
+            self._np_thresholds = np.array(self.thresholds, dtype=np.float64).reshape(len(trees), -1)
+            self._np_leaves = np.array(self.leaves, dtype=np.float64).reshape(len(trees), -1)
+
+    @classmethod
+    def load(cls, path, use_numpy=NUMPY_AVAILABLE):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f), use_numpy)
+
+    def feature_row(self, amount, provider, diagnosis, under_audit, phantom_watch):
+        anomaly_rate, log_claims = self.providers.get(provider or '', self.default_provider)
+        log_amount = math.log1p(max(amount, 0.0))
+        return [log_amount, 1.0 if diagnosis else 0.0, float(under_audit), float(phantom_watch),
+                anomaly_rate, log_claims,
+                log_amount - self.diagnosis_log_mean.get(diagnosis or '', self.default_log_mean)]
+
+    def predict_margin(self, rows):
+        if not rows:
+            return []
+        if self.use_numpy and len(rows) >= NUMPY_MIN_BATCH:
+            return self._np_margin(np.asarray(rows, dtype=np.float64)).tolist()
+        return [self._py_margin(row) for row in rows]
+
+    def predict_proba(self, rows):
+        """Probabilitas fraud untuk list baris fitur (lihat feature_row)."""
+        if self.use_numpy and len(rows) >= NUMPY_MIN_BATCH:
+            margin = self._np_margin(np.asarray(rows, dtype=np.float64))
+            return (1.0 / (1.0 + np.exp(-margin))).tolist()
+        return [_sigmoid(m) for m in self.predict_margin(rows)]
+
+    def _np_margin(self, X):
+        n, trees = X.shape[0], self._np_features.shape[0]
+        tree_idx = np.arange(trees)
+        row_idx = np.arange(n)[:, None]
+        node = np.zeros((n, trees), dtype=np.intp)
+        # Semua baris x semua pohon maju satu level per iterasi
+        for _ in range(self.depth):
+            values = X[row_idx, self._np_features[tree_idx, node]]
+            node = 2 * node + 1 + (values >= self._np_thresholds[tree_idx, node])
+        leaf = node - self._np_features.shape[1]
+        return self.base_margin + self._np_leaves[tree_idx, leaf].sum(axis=1)
+
+    def _py_margin(self, row):
+        margin = self.base_margin
+        internal = len(self.features[0]) if self.features else 0
+        for feature, threshold, leaves in zip(self.features, self.thresholds, self.leaves):
+            node = 0
+            for _ in range(self.depth):
+                node = 2 * node + 1 + (row[feature[node]] >= threshold[node])
+            margin += leaves[node - internal]
+        return margin
+
+    def info(self):
+        return {key: self.spec[key] for key in ('version', 'trained_at', 'rows', 'params', 'metrics')}
+
+class ModelRegistry:
+    """
+    Model aktif proses ini. File dicek paling sering tiap check_interval
+    detik; bila mtime berubah model dimuat ulang dan ditukar atomik.
+    Request yang sedang berjalan tetap memakai model lama sampai selesai.
+    """
+
+    def __init__(self, path=MODEL_PATH, check_interval=RELOAD_CHECK_SECONDS):
+        self.path = path
+        self.check_interval = check_interval
+        self.model = None
+        self.error = None
+        self._mtime = None
+        self._checked = -math.inf
+        self._lock = threading.Lock()
+
+    def current(self):
+        if time.monotonic() - self._checked >= self.check_interval:
+            self._refresh()
+        return self.model
+
+    def reload(self):
+        """Paksa cek file sekarang; mengembalikan model aktif (atau None)."""
+        self._checked = -math.inf
+        return self.current()
+
+    def _refresh(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked < self.check_interval:
+                return
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                self.model, self._mtime = None, None
+                return
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            try:
+                model = GradientBoostedModel.load(self.path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # File rusak/setengah tertulis: model lama tetap dipakai
+                self.error = f"{type(e).__name__}: {e}"
+                print(f"⚠️ Model {self.path} gagal dimuat: {self.error}")
+                return
+            self.model, self.error = model, None
+            print(f"🧠 Model anomali {model.version} aktif")
+
+    def status(self):
+        model = self.current()
+        return {
+            'active': model is not None,
+            'path': os.path.abspath(self.path),
+            'blend_weight': BLEND_WEIGHT,
+            'numpy': NUMPY_AVAILABLE,
+            'model': model.info() if model else None,
+            'error': self.error,
+        }
+
+model_registry = ModelRegistry()
+
+# ============================================
+# TRAINING (offline)
+# ============================================
+
+def _provider_stats(conn):
+    """{nama faskes: [anomaly rate ter-smoothing, log1p jumlah klaim]} dari provider_risk."""
+    rows = conn.execute('''
+        SELECT f.nama, r.claim_count, r.anomaly_count
+        FROM provider_risk r JOIN faskes f ON f.faskes_id = r.faskes_id
+        WHERE r.claim_count > 0
+    ''').fetchall()
+    claims = sum(r[1] for r in rows)
+    global_rate = sum(r[2] for r in rows) / claims if claims else 0.0
+    stats = {name: [round((anomalous + PROVIDER_PRIOR_CLAIMS * global_rate) / (count + PROVIDER_PRIOR_CLAIMS), 6),
+                    round(math.log1p(count), 6)]
+             for name, count, anomalous in rows}
+    return stats, [round(global_rate, 6), 0.0]
+
+def load_training_data(conn, limit):
+    """Sampel acak klaim: (total_biaya, nama faskes, kode diagnosis, label)."""
+    return conn.execute(f'''
+        SELECT COALESCE(k.total_biaya, 0), f.nama, d.code, {LABEL_SQL}
+        FROM klaim k
+        LEFT JOIN faskes f ON f.faskes_id = k.faskes_id
+        LEFT JOIN diagnosis d ON d.diagnosis_id = k.diagnosis_id
+        ORDER BY random() LIMIT ?
+    ''', (limit,)).fetchall()
+
+def _bin_edges(values, bins):
+    ordered = sorted(values)
+    edges = sorted({ordered[len(ordered) * i // bins] for i in range(1, bins)})
+    # Edge = nilai minimum tidak pernah memisahkan apa pun
+    return [e for e in edges if e > ordered[0]] if ordered else []
+
+def _histograms(node, binned, grad, hess, width, n_features, bins):
+    size = width * n_features * bins
+    if NUMPY_AVAILABLE:
+        idx = (node[:, None] * n_features + np.arange(n_features)[None, :]) * bins + binned
+        return (np.bincount(idx.ravel(), weights=np.repeat(grad, n_features), minlength=size).tolist(),
+                np.bincount(idx.ravel(), weights=np.repeat(hess, n_features), minlength=size).tolist())
+    G, H = [0.0] * size, [0.0] * size
+    for r, row in enumerate(binned):
+        base = node[r] * n_features * bins
+        g, h = grad[r], hess[r]
+        for f, b in enumerate(row):
+            G[base + f * bins + b] += g
+            H[base + f * bins + b] += h
+    return G, H
+
+def _best_split(G, H, j, n_features, bins, reg_lambda, min_hess):
+    """(gain, fitur, bin) terbaik untuk node j; bin = batas kiri (inklusif)."""
+    best = (0.0, 0, bins)
+    base = j * n_features * bins
+    total_g = sum(G[base:base + bins])
+    total_h = sum(H[base:base + bins])
+    parent = total_g * total_g / (total_h + reg_lambda)
+    for f in range(n_features):
+        offset = base + f * bins
+        gl = hl = 0.0
+        for b in range(bins - 1):
+            gl += G[offset + b]
+            hl += H[offset + b]
+            gr, hr = total_g - gl, total_h - hl
+            if hl < min_hess or hr < min_hess:
+                continue
+            gain = gl * gl / (hl + reg_lambda) + gr * gr / (hr + reg_lambda) - parent
+            if gain > best[0]:
+                best = (gain, f, b)
+    return best
+
+def fit_gbt(X, y, trees=60, depth=3, learning_rate=0.2, bins=32, reg_lambda=1.0, min_hess=1.0):
+    """Latih gradient-boosted trees (logloss) dengan histogram fitur ter-bin."""
+    n, n_features = len(X), len(FEATURES)
+    columns = list(zip(*X))
+    edges = [_bin_edges(col, bins) for col in columns]
+    positive = sum(y) / n
+    base_margin = math.log(max(positive, 1e-6) / max(1 - positive, 1e-6))
+    margin = [base_margin] * n
+    internal = 2 ** depth - 1
+    model_trees = []
+
+    if NUMPY_AVAILABLE:
+        binned = np.column_stack([np.searchsorted(np.asarray(e), np.asarray(c), side='right')
+                                  for e, c in zip(edges, columns)]).astype(np.intp)
+        labels = np.asarray(y, dtype=np.float64)
+        margin = np.full(n, base_margin)
+    else:
+        binned = [[bisect_right(edges[f], row[f]) for f in range(n_features)] for row in X]
+
+    for _ in range(trees):
+        if NUMPY_AVAILABLE:
+            p = 1.0 / (1.0 + np.exp(-margin))
+            grad, hess = p - labels, p * (1 - p)
+            node = np.zeros(n, dtype=np.intp)
+        else:
+            p = [_sigmoid(m) for m in margin]
+            grad = [pi - yi for pi, yi in zip(p, y)]
+            hess = [pi * (1 - pi) for pi in p]
+            node = [0] * n
+
+        feature, threshold = [0] * internal, [None] * internal
+        for level in range(depth):
+            width = 2 ** level
+            G, H = _histograms(node, binned, grad, hess, width, n_features, bins)
+            split_feature, split_bin = [0] * width, [bins] * width
+            for j in range(width):
+                gain, f, b = _best_split(G, H, j, n_features, bins, reg_lambda, min_hess)
+                if gain > 0 and b < len(edges[f]):
+                    split_feature[j], split_bin[j] = f, b
+                    feature[width - 1 + j], threshold[width - 1 + j] = f, edges[f][b]
+            # Baris dengan bin > batas kiri turun ke anak kanan
+            if NUMPY_AVAILABLE:
+                sf, sb = np.asarray(split_feature), np.asarray(split_bin)
+                node = 2 * node + (binned[np.arange(n), sf[node]] > sb[node])
+            else:
+                node = [2 * nd + (binned[r][split_feature[nd]] > split_bin[nd]) for r, nd in enumerate(node)]
+
+        leaves = 2 ** depth
+        if NUMPY_AVAILABLE:
+            G = np.bincount(node, weights=grad, minlength=leaves)
+            H = np.bincount(node, weights=hess, minlength=leaves)
+            leaf = (-G / (H + reg_lambda) * learning_rate).tolist()
+            margin = margin + np.asarray(leaf)[node]
+        else:
+            G, H = [0.0] * leaves, [0.0] * leaves
+            for r, nd in enumerate(node):
+                G[nd] += grad[r]
+                H[nd] += hess[r]
+            leaf = [-g / (h + reg_lambda) * learning_rate for g, h in zip(G, H)]
+            margin = [m + leaf[nd] for m, nd in zip(margin, node)]
+        model_trees.append({'feature': feature, 'threshold': threshold, 'leaf': [round(v, 6) for v in leaf]})
+    return base_margin, model_trees
+
+def _auc(scores, labels):
+    """AUC ROC berbasis ranking (ties dirata-rata)."""
+    order = sorted(range(len(scores)), key=scores.__getitem__)
+    ranks = [0.0] * len(scores)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and scores[order[j + 1]] == scores[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[order[k]] = (i + j) / 2 + 1
+        i = j + 1
+    positives = sum(labels)
+    negatives = len(labels) - positives
+    if not positives or not negatives:
+        return None
+    rank_sum = sum(r for r, label in zip(ranks, labels) if label)
+    return (rank_sum - positives * (positives + 1) / 2) / (positives * negatives)
+
+def train(conn, trees=60, depth=3, learning_rate=0.2, sample=200000, holdout=0.2):
+    """Latih model dari database; mengembalikan spec JSON (belum disimpan)."""
+    from fraud_engine import FraudDetectionEngine
+
+    rows = load_training_data(conn, sample)
+    if len(rows) < 50:
+        raise ValueError(f"Data latih terlalu sedikit ({len(rows)} klaim)")
+    providers, default_provider = _provider_stats(conn)
+
+    split = int(len(rows) * (1 - holdout))
+    log_sum, log_count = {}, {}
+    for amount, _, diagnosis, _ in rows[:split]:
+        key = diagnosis or ''
+        log_sum[key] = log_sum.get(key, 0.0) + math.log1p(max(amount, 0.0))
+        log_count[key] = log_count.get(key, 0) + 1
+    default_log_mean = sum(log_sum.values()) / sum(log_count.values())
+    spec = {
+        'format': MODEL_FORMAT,
+        'features': list(FEATURES),
+        'providers': providers,
+        'default_provider': default_provider,
+        'diagnosis_log_mean': {k: round(log_sum[k] / log_count[k], 6) for k in log_sum},
+        'default_log_mean': round(default_log_mean, 6),
+        'depth': depth,
+    }
+    # Spec parsial cukup untuk membangun fitur dengan kode inference yang sama
+    featurizer = GradientBoostedModel(dict(spec, version='train', base_margin=0.0, trees=[]), use_numpy=False)
+    X, y = [], []
+    for amount, provider, diagnosis, label in rows:
+        under_audit, phantom_watch = FraudDetectionEngine.provider_flags(provider or '')
+        X.append(featurizer.feature_row(amount, provider, diagnosis, under_audit, phantom_watch))
+        y.append(int(label))
+
+    started = time.perf_counter()
+    base_margin, model_trees = fit_gbt(X[:split], y[:split], trees, depth, learning_rate)
+    spec.update({
+        'version': f"gbt-{datetime.now().strftime('%Y%m%d%H%M%S')}",
+        'trained_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'rows': {'train': split, 'holdout': len(rows) - split, 'positive_rate': round(sum(y) / len(y), 4)},
+        'params': {'trees': trees, 'depth': depth, 'learning_rate': learning_rate},
+        'base_margin': base_margin,
+        'trees': model_trees,
+    })
+    fit_seconds = time.perf_counter() - started
+
+    model = GradientBoostedModel(spec)
+    probabilities = model.predict_proba(X[split:])
+    truth = y[split:]
+    predicted = [p >= 0.5 for p in probabilities]
+    tp = sum(1 for p, t in zip(predicted, truth) if p and t)
+    auc = _auc(probabilities, truth) if truth else None
+    spec['metrics'] = {
+        'holdout_auc': round(auc, 4) if auc is not None else None,
+        'holdout_logloss': round(-sum(math.log(max(p if t else 1 - p, 1e-12))
+                                      for p, t in zip(probabilities, truth)) / max(len(truth), 1), 4),
+        'precision_at_0_5': round(tp / sum(predicted), 4) if sum(predicted) else None,
+        'recall_at_0_5': round(tp / sum(truth), 4) if sum(truth) else None,
+        'fit_seconds': round(fit_seconds, 2),
+    }
+    return spec
+
+def save_model(spec, path=MODEL_PATH):
+    """Tulis ke file sementara lalu os.replace: pembaca tidak pernah melihat file setengah jadi."""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(spec, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latih model anomali SATRIA JKN")
+    parser.add_argument('--train', action='store_true')
+    parser.add_argument('--out', default=MODEL_PATH)
+    parser.add_argument('--trees', type=int, default=60)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--learning-rate', type=float, default=0.2)
+    parser.add_argument('--sample', type=int, default=200000, help='Maksimal klaim yang diambil acak')
+    args = parser.parse_args()
+    if not args.train:
+        parser.print_help()
+    else:
+        conn = database.get_readonly_connection()
+        spec = train(conn, args.trees, args.depth, args.learning_rate, args.sample)
+        conn.close()
+        save_model(spec, args.out)
+        print(f"✅ Model {spec['version']} disimpan ke {args.out} "
+              f"({spec['rows']['train']} klaim latih, {spec['metrics']['fit_seconds']} detik)")
+        print(f"📊 Holdout: {json.dumps(spec['metrics'])}")
@@ -0,0 +1,265 @@
+"""
+Profil Risiko Provider (materialized view)
+Tabel provider_risk* dijaga trigger SQLite secara incremental setiap kali
+klaim/fraud_alert berubah (lihat database._create_provider_risk_store), jadi
+/api/providers/risk hanya membaca agregat per faskes tanpa memindai klaim.
+Refresh penuh terjadwal menghitung ulang semuanya untuk mengoreksi drift.
+Dengan sharding regional tiap file shard punya profilnya sendiri (satu
+faskes selalu di satu shard); refresh berjalan per shard dan halaman
+dibaca lewat provider_risk_page_sharded.
+Refresh manual with: python provider_risk.py --refresh
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import argparse
+
+from database import faskes_cache, begin_immediate, shard_map, get_shard_connection, scatter
+
+REFRESH_INTERVAL_SECONDS = int(os.environ.get('SATRIA_RISK_REFRESH_SECONDS', 3600))
+
+# Smoothing agar faskes dengan sedikit klaim tidak langsung berisiko 100%
+RISK_PRIOR_CLAIMS = 10
+RISK_SCORE_SQL = f"(anomaly_count + high_alert_count) * 1.0 / (claim_count + {RISK_PRIOR_CLAIMS})"
+ANOMALY_RATE_SQL = "CASE WHEN claim_count > 0 THEN anomaly_count * 1.0 / claim_count ELSE 0 END"
+
+SORT_COLUMNS = {
+    'risk_score': RISK_SCORE_SQL,
+    'anomaly_rate': ANOMALY_RATE_SQL,
+    'claim_count': 'claim_count',
+    'total_spend': 'total_spend',
+    'alert_count': 'alert_count',
+}
+
+# ============================================
+# REFRESH PENUH
+# ============================================
+
+# (tabel, kolom, SELECT agregat dari klaim/fraud_alert)
+_AGGREGATES = (
+    ('provider_risk', 'faskes_id, claim_count, total_spend, anomaly_count, alert_count, high_alert_count', '''
+        SELECT k.faskes_id, COUNT(*), COALESCE(SUM(k.total_biaya), 0),
+               SUM(COALESCE(k.status, '') = 'Anomalous'),
+               COALESCE(SUM(a.alert_count), 0), COALESCE(SUM(a.high_count), 0)
+        FROM klaim k
+        LEFT JOIN (
+            SELECT klaim_id, COUNT(*) AS alert_count, SUM(COALESCE(alert_level, '') = 'High') AS high_count
+            FROM fraud_alert GROUP BY klaim_id
+        ) a ON a.klaim_id = k.klaim_id
+        WHERE k.faskes_id IS NOT NULL
+        GROUP BY k.faskes_id
+    '''),
+    ('provider_risk_reason', 'faskes_id, reason_code, alert_count', '''
+        SELECT k.faskes_id, COALESCE(f.reason_code, 'Unknown'), COUNT(*)
+        FROM fraud_alert f JOIN klaim k ON k.klaim_id = f.klaim_id
+        WHERE k.faskes_id IS NOT NULL
+        GROUP BY k.faskes_id, COALESCE(f.reason_code, 'Unknown')
+    '''),
+    ('provider_risk_month', 'faskes_id, month, claim_count, anomaly_count, total_spend', '''
+        SELECT faskes_id, strftime('%Y-%m', tgl_pengajuan), COUNT(*),
+               SUM(COALESCE(status, '') = 'Anomalous'), COALESCE(SUM(total_biaya), 0)
+        FROM klaim
+        WHERE faskes_id IS NOT NULL
+        GROUP BY faskes_id, strftime('%Y-%m', tgl_pengajuan)
+    '''),
+)
+SWAP_ATTEMPTS = 3
+
+def _source_versions(conn):
+    return conn.execute(
+        "SELECT name, version FROM data_version WHERE name IN ('klaim', 'fraud_alert') ORDER BY name").fetchall()
+
+def _compute(conn):
+    """
+    Hitung agregat ke tabel TEMP dari satu snapshot baca (tanpa write lock);
+    kembalikan versi klaim/fraud_alert snapshot tersebut.
+    """
+    conn.execute("BEGIN")
+    try:
+        versions = [tuple(row) for row in _source_versions(conn)]
+        for table, columns, select in _AGGREGATES:
+            conn.execute(f"DROP TABLE IF EXISTS temp.{table}_next")
+            conn.execute(f"CREATE TEMP TABLE {table}_next AS {select}")
+    finally:
+        conn.commit()
+    return versions
+
+def _swap(conn, versions=None):
+    """Ganti isi profil dengan hasil _compute; batal (False) bila klaim/alert berubah sejak snapshot."""
+    if versions is not None and [tuple(row) for row in _source_versions(conn)] != versions:
+        return False
+    for table, columns, _ in _AGGREGATES:
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"INSERT INTO {table} ({columns}) SELECT * FROM temp.{table}_next")
+    conn.execute("UPDATE provider_risk_meta SET last_refresh = ? WHERE id = 1", (time.time(),))
+    return True
+
+def refresh_all(conn):
+    """
+    Hitung ulang seluruh profil dari klaim/fraud_alert. Scan klaim berjalan
+    di luar write lock; write lock hanya dipegang untuk menyalin hasilnya.
+    Bila klaim/alert berubah di antara keduanya (perubahan itu sudah
+    diterapkan trigger ke profil lama dan akan hilang tertimpa), hitung
+    ulang; setelah SWAP_ATTEMPTS kali, hitung di dalam write lock.
+    """
+    try:
+        for _ in range(SWAP_ATTEMPTS):
+            versions = _compute(conn)
+            begin_immediate(conn)
+            if _swap(conn, versions):
+                conn.commit()
+                return
+            conn.rollback()
+        begin_immediate(conn)
+        for table, columns, select in _AGGREGATES:
+            conn.execute(f"DELETE FROM temp.{table}_next")
+            conn.execute(f"INSERT INTO temp.{table}_next {select}")
+        _swap(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        for table, _, _ in _AGGREGATES:
+            conn.execute(f"DROP TABLE IF EXISTS temp.{table}_next")
+
+def refresh_due(conn, interval=REFRESH_INTERVAL_SECONDS):
+    row = conn.execute("SELECT last_refresh FROM provider_risk_meta WHERE id = 1").fetchone()
+    return row is None or row[0] is None or time.time() - row[0] >= interval
+
+def refresh_version():
+    """Komponen ETag: refresh penuh menulis ulang profil tanpa menaikkan data_version."""
+    results = scatter("SELECT last_refresh FROM provider_risk_meta WHERE id = 1")
+    return ','.join(str(rows[0][0]) if rows and rows[0][0] is not None else '' for _, rows in results)
+
+def refresh_shards(interval=None):
+    """refresh_all di setiap file shard (tanpa sharding: database utama); interval: hanya yang jatuh tempo."""
+    refreshed = []
+    for shard in shard_map.shards:
+        conn = get_shard_connection(shard)
+        try:
+            # Dicek ulang per shard: beberapa proses server cukup satu yang refresh
+            if interval is None or refresh_due(conn, interval):
+                refresh_all(conn)
+                refreshed.append(shard.name)
+        finally:
+            conn.close()
+    return refreshed
+
+def _scheduler_loop(interval, stop_event):
+    while not stop_event.is_set():
+        try:
+            refresh_shards(interval)
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ Refresh profil risiko provider gagal: {e}")
+        except Exception as e:
+            # Error lain juga tidak boleh mematikan thread scheduler
+            print(f"⚠️ Refresh profil risiko provider error: {type(e).__name__}: {e}")
+        stop_event.wait(min(interval, 60))
+
+def start_refresh_scheduler(interval=REFRESH_INTERVAL_SECONDS):
+    """Jalankan refresh penuh berkala di daemon thread. interval <= 0 menonaktifkan."""
+    stop_event = threading.Event()
+    if interval > 0:
+        thread = threading.Thread(target=_scheduler_loop, args=(interval, stop_event),
+                                  name='provider-risk-refresh', daemon=True)
+        thread.start()
+    return stop_event
+
+# ============================================
+# QUERY (dipanggil dari request handler)
+# ============================================
+
+def provider_risk_page(conn, sort='risk_score', order='desc', page=1, per_page=20):
+    """Satu halaman profil risiko. ValueError bila kolom sort tidak dikenal."""
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"sort harus salah satu dari: {', '.join(SORT_COLUMNS)}")
+    direction = 'ASC' if order == 'asc' else 'DESC'
+
+    total = conn.execute("SELECT COUNT(*) FROM provider_risk WHERE claim_count > 0").fetchone()[0]
+    rows = conn.execute(f'''
+        SELECT faskes_id, claim_count, total_spend, anomaly_count, alert_count, high_alert_count,
+               {ANOMALY_RATE_SQL} AS anomaly_rate, {RISK_SCORE_SQL} AS risk_score
+        FROM provider_risk
+        WHERE claim_count > 0
+        ORDER BY {SORT_COLUMNS[sort]} {direction}, faskes_id
+        LIMIT ? OFFSET ?
+    ''', (per_page, (page - 1) * per_page)).fetchall()
+
+    items = []
+    if rows:
+        ids = [row['faskes_id'] for row in rows]
+        marks = ', '.join('?' for _ in ids)
+        reasons = {}
+        for r in conn.execute(f'''
+            SELECT faskes_id, reason_code, alert_count FROM provider_risk_reason
+            WHERE faskes_id IN ({marks}) AND alert_count > 0
+            ORDER BY alert_count DESC
+        ''', ids):
+            reasons.setdefault(r['faskes_id'], []).append({'reason_code': r['reason_code'], 'count': r['alert_count']})
+
+        this_month = time.strftime('%Y-%m')
+        prev = time.localtime()
+        prev_month = f"{prev.tm_year - 1}-12" if prev.tm_mon == 1 else f"{prev.tm_year}-{prev.tm_mon - 1:02d}"
+        trend = {}
+        for r in conn.execute(f'''
+            SELECT faskes_id, month, claim_count, anomaly_count FROM provider_risk_month
+            WHERE faskes_id IN ({marks}) AND month IN (?, ?)
+        ''', ids + [this_month, prev_month]):
+            key = 'current' if r['month'] == this_month else 'previous'
+            trend.setdefault(r['faskes_id'], {})[key] = {'claims': r['claim_count'], 'anomalies': r['anomaly_count']}
+
+        for row in rows:
+            month_trend = trend.get(row['faskes_id'], {})
+            items.append({
+                'faskes_id': row['faskes_id'],
+                'provider': faskes_cache.name_for(row['faskes_id']),
+                'claim_count': row['claim_count'],
+                'total_spend': row['total_spend'],
+                'anomaly_count': row['anomaly_count'],
+                'anomaly_rate': round(row['anomaly_rate'], 4),
+                'alert_count': row['alert_count'],
+                'high_alert_count': row['high_alert_count'],
+                'risk_score': round(row['risk_score'], 4),
+                'reason_mix': reasons.get(row['faskes_id'], []),
+                'trend': {
+                    'current': month_trend.get('current', {'claims': 0, 'anomalies': 0}),
+                    'previous': month_trend.get('previous', {'claims': 0, 'anomalies': 0}),
+                },
+            })
+    return {'items': items, 'page': page, 'per_page': per_page, 'total': total}
+
+def provider_risk_page_sharded(sort='risk_score', order='desc', page=1, per_page=20):
+    """
+    provider_risk_page gabungan semua shard: page * per_page teratas tiap
+    shard diurutkan ulang lalu dipotong. Faskes tidak pernah terbagi antar
+    shard (klaim di-route per wilayah faskes), jadi total cukup dijumlahkan.
+    """
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"sort harus salah satu dari: {', '.join(SORT_COLUMNS)}")
+    items, total = [], 0
+    for shard in shard_map.shards:
+        conn = get_shard_connection(shard, readonly=True)
+        try:
+            result = provider_risk_page(conn, sort, order, 1, page * per_page)
+        finally:
+            conn.close()
+        items.extend(result['items'])
+        total += result['total']
+    # Urutan sama dengan ORDER BY di provider_risk_page: kolom sort, lalu faskes_id naik
+    sign = 1 if order == 'asc' else -1
+    items.sort(key=lambda item: (sign * item[sort], item['faskes_id']))
+    start = (page - 1) * per_page
+    return {'items': items[start:start + per_page], 'page': page, 'per_page': per_page, 'total': total}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profil risiko provider SATRIA JKN")
+    parser.add_argument('--refresh', action='store_true', help='Hitung ulang seluruh profil sekarang')
+    args = parser.parse_args()
+    if args.refresh:
+        started = time.perf_counter()
+        shards = refresh_shards()
+        print(f"✅ Profil risiko provider diperbarui di {', '.join(shards)} ({time.perf_counter() - started:.2f} detik)")
+    print(provider_risk_page_sharded(per_page=10))
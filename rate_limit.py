@@ -0,0 +1,198 @@
+"""
+Rate Limiting & Admission Control untuk endpoint tulis
+Semua tulis berakhir di satu writer SQLite, jadi satu klien yang membanjiri
+POST /api/klaim atau /api/reports/generate memperlambat semua orang.
+
+- Token bucket per (klien, kelas endpoint); ukuran bucket per role diatur di
+  auth.ROLE_RATE_LIMITS.
+- Admission controller berbasis concurrency: jumlah request tulis yang boleh
+  berjalan bersamaan turun otomatis (AIMD) saat latency tulis melewati target,
+  kelebihannya mengantri sebentar lalu ditolak.
+
+Keduanya menjawab 429 dengan header Retry-After.
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import jsonify, request
+
+from auth import decode_token, role_limits, DEV_TOKEN_ROLE
+
+RATE_LIMIT_ENABLED = os.environ.get('SATRIA_RATE_LIMIT', '1') != '0'
+MAX_BUCKETS = 50000                 # Bucket klien paling lama tidak aktif dibuang
+
+WRITE_CONCURRENCY = int(os.environ.get('SATRIA_WRITE_CONCURRENCY', 8))
+WRITE_LATENCY_TARGET = float(os.environ.get('SATRIA_WRITE_LATENCY_TARGET_MS', 250)) / 1000
+ADMISSION_QUEUE = int(os.environ.get('SATRIA_ADMISSION_QUEUE', 32))
+ADMISSION_WAIT_SECONDS = float(os.environ.get('SATRIA_ADMISSION_WAIT_SECONDS', 2))
+
+# ============================================
+# TOKEN BUCKET
+# ============================================
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def take(self, now):
+        """Ambil satu token. 0 bila diizinkan, selain itu detik sampai token berikutnya."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class RateLimiter:
+    """Bucket per (klien, kelas endpoint) dalam LRU berukuran tetap."""
+
+    def __init__(self, max_buckets=MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, client, endpoint_class, rate, burst):
+        now = time.monotonic()
+        key = (client, endpoint_class)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None or bucket.rate != rate or bucket.capacity != burst:
+                bucket = self._buckets[key] = TokenBucket(rate, burst, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+            return bucket.take(now)
+
+    def __len__(self):
+        return len(self._buckets)
+
+# ============================================
+# ADMISSION CONTROLLER (AIMD)
+# ============================================
+
+class AdmissionController:
+    """
+    Batas concurrency adaptif untuk request tulis. Latency tiap request
+    dirata-rata (EWMA); di atas target batas dikali 0.75, di bawahnya naik
+    perlahan (+1/batas per request) hingga WRITE_CONCURRENCY.
+    """
+
+    def __init__(self, max_limit=WRITE_CONCURRENCY, target=WRITE_LATENCY_TARGET,
+                 max_queue=ADMISSION_QUEUE, max_wait=ADMISSION_WAIT_SECONDS):
+        self.max_limit = max_limit
+        self.target = target
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.limit = float(max_limit)
+        self.inflight = 0
+        self.waiting = 0
+        self.latency = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """True bila request boleh jalan; False bila ditolak (antrian penuh/timeout)."""
+        with self._cond:
+            if self.inflight < int(self.limit):
+                self.inflight += 1
+                return True
+            if self.waiting >= self.max_queue:
+                return False
+            self.waiting += 1
+            try:
+                admitted = self._cond.wait_for(lambda: self.inflight < int(self.limit), self.max_wait)
+                if admitted:
+                    self.inflight += 1
+                return admitted
+            finally:
+                self.waiting -= 1
+
+    def release(self, latency):
+        with self._cond:
+            self.inflight -= 1
+            self.latency = latency if self.latency == 0 else 0.8 * self.latency + 0.2 * latency
+            now = time.monotonic()
+            if self.latency > self.target:
+                # Turunkan paling banyak sekali per periode latency, bukan per request
+                if now - self._last_decrease >= self.latency:
+                    self.limit = max(1.0, self.limit * 0.75)
+                    self._last_decrease = now
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._cond.notify()
+
+    def retry_after(self):
+        """Perkiraan detik sampai antrian saat ini terkuras."""
+        backlog = self.inflight + self.waiting + 1
+        return max(1, math.ceil(backlog * max(self.latency, self.target) / max(int(self.limit), 1)))
+
+    def stats(self):
+        return {'limit': int(self.limit), 'inflight': self.inflight, 'waiting': self.waiting,
+                'latency_ms': round(self.latency * 1000, 1)}
+
+rate_limiter = RateLimiter()
+write_admission = AdmissionController()
+
+# ============================================
+# DECORATOR
+# ============================================
+
+def client_identity():
+    """(id klien, role) dari token Authorization; fallback ke alamat IP."""
+    header = request.headers.get('Authorization', '')
+    token = header.split(' ', 1)[1] if ' ' in header else header
+    if not token:
+        return f"ip:{request.remote_addr}", None
+    if 'dev-token' in token:
+        return f"token:{token}", DEV_TOKEN_ROLE
+    payload = decode_token(token)
+    if payload:
+        return f"user:{payload['user_id']}", payload.get('role')
+    return f"token:{hashlib.sha256(token.encode('utf-8')).hexdigest()[:16]}", None
+
+def _too_many(message, retry_after):
+    response = jsonify({'message': message, 'retry_after': retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def rate_limited(endpoint_class, methods=('POST',), admission=True):
+    """
+    Decorator: token bucket per klien untuk `endpoint_class`, lalu (bila
+    `admission`) slot dari admission controller tulis. Pasang di bawah
+    @token_required agar request tanpa token tidak menghabiskan kuota.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if not RATE_LIMIT_ENABLED or request.method not in methods:
+                return f(*args, **kwargs)
+
+            client, role = client_identity()
+            rate, burst = role_limits(role)[endpoint_class]
+            wait = rate_limiter.check(client, endpoint_class, rate, burst)
+            if wait:
+                return _too_many('Terlalu banyak request, coba lagi nanti', max(1, math.ceil(wait)))
+
+            if not admission:
+                return f(*args, **kwargs)
+            if not write_admission.acquire():
+                return _too_many('Server sedang sibuk menulis data, coba lagi nanti', write_admission.retry_after())
+            started = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                write_admission.release(time.perf_counter() - started)
+        return decorated
+    return decorator
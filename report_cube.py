@@ -0,0 +1,325 @@
+"""
+Laporan Lintas Periode dari Cube Pra-Agregasi
+Tabel report_cube (hari x faskes x diagnosis x alert_level x status klaim)
+dijaga trigger SQLite secara incremental (lihat
+database._create_report_cube_store), jadi laporan untuk rentang tanggal mana
+pun cukup menjumlahkan baris cube di rentang itu, tanpa memindai klaim.
+Rebuild penuh dipartisi per rentang klaim_id, diagregasi paralel di
+ProcessPoolExecutor, lalu ditukar dalam satu transaksi.
+Rebuild with: python report_cube.py --rebuild [--workers 4]
+"""
+
+import os
+import time
+import argparse
+from datetime import date, timedelta
+from concurrent.futures import ProcessPoolExecutor
+
+from database import (get_primary_connection, get_readonly_connection, faskes_cache, diagnosis_cache,
+                      CUBE_COLUMNS, CUBE_KLAIM_FACTS_SQL, CUBE_ALERT_FACTS_SQL, CUBE_UPSERT_SQL,
+                      shard_map, scatter, gather_sum, begin_immediate)
+
+DEFAULT_PARTITION_SIZE = 50000
+DEFAULT_TOP_N = 10
+MAX_TOP_N = 100
+
+# Dimensi yang boleh dipakai group_by -> ekspresi kolom cube
+DIMENSIONS = {
+    'provider': 'faskes_id',
+    'diagnosis': 'diagnosis_id',
+    'alert_level': 'alert_level',
+    'status': 'status',
+    'month': 'day / 100',
+    'day': 'day',
+}
+MEASURES = ('claim_count', 'total_spend', 'anomaly_count', 'alert_count', 'alert_spend')
+RANK_METRICS = MEASURES + ('anomaly_rate',)
+
+# ============================================
+# QUERY CUBE
+# ============================================
+
+def parse_day(value, field):
+    """'YYYY-MM-DD' -> date; None bila kosong. ValueError dengan nama field bila tidak valid."""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} harus berformat YYYY-MM-DD")
+
+def _day_key(day):
+    return day.year * 10000 + day.month * 100 + day.day
+
+def _label(dimension, value):
+    if dimension == 'provider':
+        return faskes_cache.name_for(value) if value else None
+    if dimension == 'diagnosis':
+        return diagnosis_cache.name_for(value) if value else None
+    if dimension == 'month':
+        return f"{value // 100:04d}-{value % 100:02d}" if value else None
+    if dimension == 'day':
+        return f"{value // 10000:04d}-{value // 100 % 100:02d}-{value % 100:02d}" if value else None
+    return value or None
+
+def cube_query(conn, start=None, end=None, group_by=()):
+    """
+    Jumlahkan measure cube untuk start <= tgl_pengajuan <= end (date, boleh
+    None) per kombinasi dimensi group_by. Mengembalikan {tuple label: measures}.
+    """
+    unknown = [g for g in group_by if g not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"group_by tidak dikenal: {', '.join(unknown)} (pilihan: {', '.join(DIMENSIONS)})")
+    columns = [DIMENSIONS[g] for g in group_by]
+    where, params = [], []
+    if start:
+        where.append("day >= ?")
+        params.append(_day_key(start))
+    if end:
+        where.append("day <= ?")
+        params.append(_day_key(end))
+
+    query = f'''
+        SELECT {''.join(c + ', ' for c in columns)}
+               SUM(claim_count), SUM(total_spend),
+               SUM(CASE WHEN status = 'Anomalous' THEN claim_count ELSE 0 END),
+               SUM(alert_count), SUM(alert_spend)
+        FROM report_cube
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        {'GROUP BY ' + ', '.join(columns) if columns else ''}
+        HAVING SUM(claim_count) != 0 OR SUM(alert_count) != 0
+    '''
+    if shard_map.enabled:
+        # Cube tiap shard hanya berisi klaim shard itu; jumlahkan per kombinasi dimensi
+        rows = gather_sum(scatter(query, params), key_columns=len(columns))
+    else:
+        rows = conn.execute(query, params)
+    result = {}
+    for row in rows:
+        key = tuple(_label(g, row[i]) for i, g in enumerate(group_by))
+        values = row[len(columns):]
+        result[key] = {
+            'claim_count': values[0],
+            'total_spend': round(values[1], 2),
+            'anomaly_count': values[2],
+            'alert_count': values[3],
+            'alert_spend': round(values[4], 2),
+        }
+    return result
+
+def _empty_measures():
+    return dict.fromkeys(MEASURES, 0)
+
+def _with_rate(measures):
+    rate = measures['anomaly_count'] / measures['claim_count'] if measures['claim_count'] else 0
+    return dict(measures, anomaly_rate=round(rate, 4))
+
+def _change(current, previous):
+    change = {}
+    for measure in MEASURES:
+        delta = current[measure] - previous[measure]
+        change[measure] = {
+            'delta': round(delta, 2),
+            'pct': round(delta * 100 / previous[measure], 1) if previous[measure] else None,
+        }
+    return change
+
+def _period(start, end):
+    return {'start': start.isoformat() if start else None, 'end': end.isoformat() if end else None}
+
+def _compare_period(start, end, compare):
+    """Periode pembanding: tepat sebelum (sama panjang) atau setahun sebelumnya."""
+    if compare == 'previous':
+        length = end - start
+        prev_end = start - timedelta(days=1)
+        return prev_end - length, prev_end
+    if compare == 'year':
+        def year_ago(day):
+            try:
+                return day.replace(year=day.year - 1)
+            except ValueError:
+                return day.replace(year=day.year - 1, day=28)   # 29 Februari
+        return year_ago(start), year_ago(end)
+    raise ValueError("compare harus 'previous' atau 'year'")
+
+def _group_by_param(params):
+    group_by = params.get('group_by') or []
+    if isinstance(group_by, str):
+        group_by = [g.strip() for g in group_by.split(',') if g.strip()]
+    return group_by
+
+# ============================================
+# JENIS LAPORAN
+# ============================================
+
+def fraud_summary(conn, params):
+    """Ringkasan klaim & alert per level untuk rentang opsional start/end."""
+    start, end = parse_day(params.get('start'), 'start'), parse_day(params.get('end'), 'end')
+    totals = cube_query(conn, start, end).get((), _empty_measures())
+    by_level = cube_query(conn, start, end, ('alert_level',))
+    return {
+        "period": _period(start, end),
+        "total_claims": totals['claim_count'],
+        "total_spend": totals['total_spend'],
+        "anomalous_claims": totals['anomaly_count'],
+        "fraud_by_level": {key[0]: m['alert_count'] for key, m in by_level.items() if key[0] and m['alert_count']},
+    }
+
+def period_comparison(conn, params):
+    """Periode start..end dibanding periode sebelumnya (compare=previous) atau tahun lalu (compare=year)."""
+    start, end = parse_day(params.get('start'), 'start'), parse_day(params.get('end'), 'end')
+    if not start or not end:
+        raise ValueError("Period Comparison membutuhkan start dan end")
+    if end < start:
+        raise ValueError("end harus sama atau setelah start")
+    prev_start, prev_end = _compare_period(start, end, params.get('compare', 'previous'))
+    group_by = _group_by_param(params)
+
+    current = cube_query(conn, start, end, group_by)
+    previous = cube_query(conn, prev_start, prev_end, group_by)
+    total_current = cube_query(conn, start, end).get((), _empty_measures())
+    total_previous = cube_query(conn, prev_start, prev_end).get((), _empty_measures())
+
+    groups = []
+    for key in sorted(current.keys() | previous.keys(), key=lambda k: tuple('' if v is None else str(v) for v in k)):
+        cur, prev = current.get(key, _empty_measures()), previous.get(key, _empty_measures())
+        groups.append(dict(zip(group_by, key), current=cur, previous=prev, change=_change(cur, prev)))
+    groups.sort(key=lambda g: g['current']['total_spend'], reverse=True)
+
+    return {
+        "period": _period(start, end),
+        "compare_period": _period(prev_start, prev_end),
+        "group_by": group_by,
+        "totals": {'current': total_current, 'previous': total_previous,
+                   'change': _change(total_current, total_previous)},
+        "groups": groups,
+    }
+
+def top_providers(conn, params):
+    """N faskes teratas menurut metric; bila start & end diisi, disertai peringkat periode sebelumnya."""
+    start, end = parse_day(params.get('start'), 'start'), parse_day(params.get('end'), 'end')
+    metric = params.get('metric', 'total_spend')
+    if metric not in RANK_METRICS:
+        raise ValueError(f"metric harus salah satu dari: {', '.join(RANK_METRICS)}")
+    try:
+        top_n = min(max(int(params.get('top_n', DEFAULT_TOP_N)), 1), MAX_TOP_N)
+    except (TypeError, ValueError):
+        raise ValueError("top_n harus bilangan bulat")
+
+    def ranked(period_start, period_end):
+        rows = [(key[0], _with_rate(m)) for key, m in cube_query(conn, period_start, period_end, ('provider',)).items()
+                if key[0] is not None]
+        rows.sort(key=lambda r: r[1][metric], reverse=True)
+        return rows
+
+    current = ranked(start, end)
+    previous_rank = {}
+    if start and end:
+        prev_start, prev_end = _compare_period(start, end, 'previous')
+        previous_rank = {name: rank for rank, (name, _) in enumerate(ranked(prev_start, prev_end), start=1)}
+
+    return {
+        "period": _period(start, end),
+        "metric": metric,
+        "providers": [dict(m, rank=rank, provider=name, previous_rank=previous_rank.get(name))
+                      for rank, (name, m) in enumerate(current[:top_n], start=1)],
+    }
+
+REPORT_TYPES = {
+    'Fraud Summary': fraud_summary,
+    'Period Comparison': period_comparison,
+    'Top Providers': top_providers,
+}
+
+def build_report(conn, report_type, params):
+    """Payload laporan dari cube. ValueError bila jenis atau parameter tidak valid."""
+    builder = REPORT_TYPES.get(report_type)
+    if builder is None:
+        raise ValueError(f"Jenis laporan harus salah satu dari: {', '.join(REPORT_TYPES)}")
+    return builder(conn, params)
+
+# ============================================
+# REBUILD PARALEL
+# ============================================
+
+# Koneksi read-only per proses worker (dibuka di initializer pool)
+_worker_conn = None
+
+def _init_worker():
+    global _worker_conn
+    _worker_conn = get_readonly_connection()
+
+def aggregate_partition(lo, hi, alert_watermark):
+    """Fakta cube untuk klaim lo <= klaim_id < hi dan alert dengan alert_id <= watermark."""
+    rows = _worker_conn.execute(
+        CUBE_KLAIM_FACTS_SQL.format(where='k.klaim_id >= ? AND k.klaim_id < ?'), (lo, hi)).fetchall()
+    rows += _worker_conn.execute(
+        CUBE_ALERT_FACTS_SQL.format(where='k.klaim_id >= ? AND k.klaim_id < ? AND f.alert_id <= ?'),
+        (lo, hi, alert_watermark)).fetchall()
+    return [tuple(row) for row in rows]
+
+def rebuild(workers=None, partition_size=DEFAULT_PARTITION_SIZE):
+    """
+    Hitung ulang seluruh cube. Partisi dibaca sampai watermark klaim_id /
+    alert_id saat rebuild dimulai; baris yang masuk setelahnya ditambahkan di
+    transaksi penukaran. Perubahan atas baris lama selama rebuild berjalan
+    terkoreksi oleh rebuild berikutnya.
+    """
+    started = time.time()
+    conn = get_primary_connection()
+    conn.execute("PRAGMA busy_timeout = 10000")
+    lo, klaim_watermark, alert_watermark = conn.execute('''
+        SELECT (SELECT COALESCE(MIN(klaim_id), 0) FROM klaim), (SELECT COALESCE(MAX(klaim_id), 0) FROM klaim),
+               (SELECT COALESCE(MAX(alert_id), 0) FROM fraud_alert)
+    ''').fetchone()
+    partitions = [(start, min(start + partition_size, klaim_watermark + 1))
+                  for start in range(lo, klaim_watermark + 1, partition_size)]
+
+    merged = {}
+    def merge(rows):
+        for row in rows:
+            key, values = row[:5], row[5:]
+            current = merged.get(key)
+            merged[key] = values if current is None else tuple(a + b for a, b in zip(current, values))
+
+    if workers == 1 or len(partitions) <= 1:
+        _init_worker()
+        for p in partitions:
+            merge(aggregate_partition(p[0], p[1], alert_watermark))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for rows in pool.map(aggregate_partition, *zip(*partitions), [alert_watermark] * len(partitions)):
+                merge(rows)
+
+    begin_immediate(conn)
+    try:
+        conn.execute("DELETE FROM report_cube")
+        conn.executemany(
+            f"INSERT INTO report_cube ({', '.join(CUBE_COLUMNS)}) VALUES ({', '.join('?' for _ in CUBE_COLUMNS)})",
+            (key + values for key, values in merged.items()))
+        # Klaim/alert yang masuk setelah watermark
+        conn.execute(CUBE_UPSERT_SQL.format(select=CUBE_KLAIM_FACTS_SQL.format(where='k.klaim_id > ?')),
+                     (klaim_watermark,))
+        conn.execute(CUBE_UPSERT_SQL.format(select=CUBE_ALERT_FACTS_SQL.format(
+            where='(k.klaim_id > ? OR f.alert_id > ?)')), (klaim_watermark, alert_watermark))
+        cube_rows = conn.execute("SELECT COUNT(*) FROM report_cube").fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return {'partitions': len(partitions), 'cube_rows': cube_rows, 'seconds': round(time.time() - started, 3)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cube laporan SATRIA JKN")
+    parser.add_argument('--rebuild', action='store_true', help='Hitung ulang seluruh cube dari klaim/fraud_alert')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--partition-size', type=int, default=DEFAULT_PARTITION_SIZE)
+    args = parser.parse_args()
+    if args.rebuild:
+        result = rebuild(args.workers, args.partition_size)
+        print(f"✅ Cube dibangun ulang: {result['cube_rows']} baris dari {result['partitions']} partisi "
+              f"dalam {result['seconds']} detik")
+    else:
+        parser.print_help()
@@ -0,0 +1,234 @@
+"""
+Re-scoring Historis Klaim
+Menjalankan ulang FraudDetectionEngine atas seluruh riwayat klaim setelah
+ambang/aturan berubah. klaim dipartisi per rentang klaim_id (rowid), tiap
+partisi diskor paralel di ProcessPoolExecutor dengan koneksi read-only
+milik worker, lalu selisihnya terhadap fraud_alert diterapkan oleh proses
+induk satu transaksi per partisi.
+Belum mendukung SATRIA_SHARD_MAP: rentang klaim_id dan alert baru hanya
+dihitung di satu file, sehingga rescore menolak berjalan bila peta shard aktif.
+
+Usage:
+    python rescore.py [--workers 4] [--partition-size 5000] [--dry-run]
+    python rescore.py --resume      # lanjutkan run yang terputus
+"""
+
+import os
+import sys
+import time
+import uuid
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from database import get_db_connection, get_readonly_connection, begin_immediate, shard_map
+from fraud_engine import FraudDetectionEngine, pack_trace
+from feature_store import lookup as lookup_features
+from collusion import COLLUSION_REASON
+
+DEFAULT_PARTITION_SIZE = 5000
+
+# Koneksi read-only per proses worker (dibuka di initializer pool)
+_worker_conn = None
+
+def _init_worker():
+    global _worker_conn
+    _worker_conn = get_readonly_connection()
+
+# ============================================
+# WORKER: skor partisi & hitung diff
+# ============================================
+
+def _alert_changed(alert, analysis):
+    return (alert['alert_level'] != analysis['risk_level']
+            or alert['reason_code'] != analysis['fraud_type']
+            or round(alert['ai_confidence'] or 0, 4) != round(analysis['confidence'], 4))
+
+def score_partition(lo, hi):
+    """
+    Skor klaim dengan lo <= klaim_id < hi dan kembalikan daftar operasi:
+      ('insert', klaim_id, analysis)   alert baru
+      ('update', alert_id, analysis)   alert Open dengan hasil berbeda
+      ('clear', alert_id, None)        alert Open yang tidak lagi terpicu
+      ('status', klaim_id, status)     status klaim Pending <-> Anomalous
+    Alert yang sudah ditangani analis (bukan 'Open') tidak disentuh, begitu
+    pula alert 'Collusion' yang berasal dari collusion.py, bukan rule engine.
+    """
+    cursor = _worker_conn.cursor()
+    cursor.execute('''
+        SELECT alert_id, klaim_id, alert_level, reason_code, ai_confidence, status
+        FROM fraud_alert WHERE klaim_id >= ? AND klaim_id < ? AND COALESCE(reason_code, '') != ?
+        ORDER BY alert_id
+    ''', (lo, hi, COLLUSION_REASON))
+    alerts = {}
+    for row in cursor.fetchall():
+        alerts.setdefault(row['klaim_id'], []).append(row)
+
+    cursor.execute('''
+        SELECT k.klaim_id, k.nomor_klaim, k.total_biaya, k.status, k.tgl_pengajuan,
+               f.nama AS provider, d.code AS diagnosis_code, p.no_kartu
+        FROM klaim k
+        LEFT JOIN faskes f ON f.faskes_id = k.faskes_id
+        LEFT JOIN diagnosis d ON d.diagnosis_id = k.diagnosis_id
+        LEFT JOIN peserta p ON p.peserta_id = k.peserta_id
+        WHERE k.klaim_id >= ? AND k.klaim_id < ?
+    ''', (lo, hi))
+
+    claims = cursor.fetchall()
+    # Satu partisi = satu batch engine (inference model tervektorisasi)
+    items = [{
+        'total_biaya': claim['total_biaya'] or 0,
+        'provider': claim['provider'],
+        'diagnosis_code': claim['diagnosis_code'],
+        'no_kartu': claim['no_kartu']
+    } for claim in claims]
+    # Riwayat per klaim dihitung per tanggal pengajuannya, tanpa klaim itu sendiri
+    features = lookup_features(cursor, items, as_of=[claim['tgl_pengajuan'] for claim in claims], stored=True)
+    analyses = FraudDetectionEngine.analyze_batch(items, features)
+
+    ops = []
+    scanned = 0
+    for claim, analysis in zip(claims, analyses):
+        scanned += 1
+        existing = alerts.get(claim['klaim_id'], [])
+        open_alerts = [a for a in existing if a['status'] == 'Open']
+
+        if analysis['is_fraud']:
+            if open_alerts:
+                if _alert_changed(open_alerts[0], analysis):
+                    ops.append(('update', open_alerts[0]['alert_id'], analysis))
+            elif not existing:
+                ops.append(('insert', claim['klaim_id'], analysis))
+            if claim['status'] == 'Pending':
+                ops.append(('status', claim['klaim_id'], 'Anomalous'))
+        else:
+            ops.extend(('clear', a['alert_id'], None) for a in open_alerts)
+            if claim['status'] == 'Anomalous':
+                ops.append(('status', claim['klaim_id'], 'Pending'))
+    return lo, scanned, ops
+
+# ============================================
+# INDUK: terapkan diff & catat progres
+# ============================================
+
+def apply_partition(conn, run_id, lo, ops):
+    """Terapkan diff satu partisi dan tandai partisi selesai dalam satu transaksi."""
+    tgl = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    counts = {'insert': 0, 'update': 0, 'clear': 0, 'status': 0}
+    cursor = conn.cursor()
+    begin_immediate(cursor)
+    for op, target, value in ops:
+        counts[op] += 1
+        if op == 'insert':
+            cursor.execute('''
+                INSERT INTO fraud_alert (klaim_id, alert_level, reason_code, ai_confidence, trace, created_at, status, action)
+                VALUES (?, ?, ?, ?, ?, ?, 'Open', 'Rescored')
+            ''', (target, value['risk_level'], value['fraud_type'], value['confidence'], pack_trace(value['trace']), tgl))
+        elif op == 'update':
+            cursor.execute('''
+                UPDATE fraud_alert SET alert_level = ?, reason_code = ?, ai_confidence = ?, description = NULL, trace = ?,
+                       action = 'Rescored'
+                WHERE alert_id = ? AND status = 'Open'
+            ''', (value['risk_level'], value['fraud_type'], value['confidence'], pack_trace(value['trace']), target))
+        elif op == 'clear':
+            cursor.execute('''
+                UPDATE fraud_alert SET status = 'Resolved', is_resolved = 1, action = 'Cleared by rescore'
+                WHERE alert_id = ? AND status = 'Open'
+            ''', (target,))
+        elif op == 'status':
+            cursor.execute("UPDATE klaim SET status = ? WHERE klaim_id = ?", (value, target))
+    cursor.execute('''
+        UPDATE rescore_partition SET status = 'Done', inserted = ?, updated = ?, cleared = ?
+        WHERE run_id = ? AND lo = ?
+    ''', (counts['insert'], counts['update'], counts['clear'], run_id, lo))
+    conn.commit()
+    return counts
+
+def _create_run(conn, partition_size):
+    cursor = conn.cursor()
+    lo, hi = cursor.execute("SELECT MIN(klaim_id), MAX(klaim_id) FROM klaim").fetchone()
+    cursor.execute('''
+        INSERT INTO rescore_run (started_at, partition_size, status) VALUES (?, ?, 'Running')
+    ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), partition_size))
+    run_id = cursor.lastrowid
+    if lo is not None:
+        cursor.executemany('''
+            INSERT INTO rescore_partition (run_id, lo, hi, status) VALUES (?, ?, ?, 'Pending')
+        ''', [(run_id, start, start + partition_size) for start in range(lo, hi + 1, partition_size)])
+    conn.commit()
+    return run_id
+
+def _latest_unfinished_run(conn):
+    row = conn.execute(
+        "SELECT run_id FROM rescore_run WHERE status = 'Running' ORDER BY run_id DESC LIMIT 1").fetchone()
+    return row['run_id'] if row else None
+
+def rescore(workers=None, partition_size=DEFAULT_PARTITION_SIZE, resume=False, dry_run=False):
+    if shard_map.enabled:
+        raise RuntimeError("rescore belum mendukung SATRIA_SHARD_MAP; jalankan tanpa peta shard")
+    conn = get_db_connection()
+    conn.execute("PRAGMA busy_timeout = 10000")
+
+    run_id = _latest_unfinished_run(conn) if resume else None
+    if resume and run_id is None:
+        print("ℹ️  Tidak ada run yang terputus. Memulai run baru.")
+    if run_id is None:
+        run_id = _create_run(conn, partition_size)
+    else:
+        print(f"⏯️  Melanjutkan rescore run #{run_id}")
+
+    partitions = conn.execute('''
+        SELECT lo, hi FROM rescore_partition WHERE run_id = ? AND status = 'Pending' ORDER BY lo
+    ''', (run_id,)).fetchall()
+    total_partitions = conn.execute(
+        "SELECT COUNT(*) FROM rescore_partition WHERE run_id = ?", (run_id,)).fetchone()[0]
+    done_before = total_partitions - len(partitions)
+
+    totals = {'scanned': 0, 'insert': 0, 'update': 0, 'clear': 0, 'status': 0}
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(score_partition, p['lo'], p['hi']) for p in partitions]
+        for i, future in enumerate(as_completed(futures), start=done_before + 1):
+            lo, scanned, ops = future.result()
+            if dry_run:
+                counts = {op: sum(1 for o in ops if o[0] == op) for op in ('insert', 'update', 'clear', 'status')}
+            else:
+                counts = apply_partition(conn, run_id, lo, ops)
+            totals['scanned'] += scanned
+            for key, value in counts.items():
+                totals[key] += value
+            rate = totals['scanned'] / max(time.time() - started, 1e-6)
+            print(f"   [{i}/{total_partitions}] klaim_id >= {lo}: {scanned} klaim, "
+                  f"+{counts['insert']} alert, ~{counts['update']} diperbarui, -{counts['clear']} dibersihkan "
+                  f"({rate:,.0f} klaim/detik)")
+
+    if dry_run:
+        # Run dry-run tidak meninggalkan jejak progres
+        conn.execute("DELETE FROM rescore_partition WHERE run_id = ?", (run_id,))
+        conn.execute("DELETE FROM rescore_run WHERE run_id = ?", (run_id,))
+    else:
+        tgl = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        conn.execute("UPDATE rescore_run SET status = 'Completed', finished_at = ? WHERE run_id = ?", (tgl, run_id))
+        conn.execute('''
+            INSERT INTO audit_trail (audit_id, entity, entity_id, action, user, details, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (str(uuid.uuid4()), 'Rescore', str(run_id), 'RESCORED', 'System',
+              f"{totals['scanned']} klaim diskor ulang: +{totals['insert']} alert, "
+              f"{totals['update']} diperbarui, {totals['clear']} dibersihkan", tgl))
+    conn.commit()
+    conn.close()
+
+    print(f"✅ Rescore run #{run_id} selesai{' (dry-run)' if dry_run else ''}: {totals}")
+    return totals
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score seluruh riwayat klaim SATRIA JKN")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--partition-size', type=int, default=DEFAULT_PARTITION_SIZE)
+    parser.add_argument('--resume', action='store_true', help='Lanjutkan run terakhir yang belum selesai')
+    parser.add_argument('--dry-run', action='store_true', help='Hitung diff tanpa menulis ke database')
+    args = parser.parse_args()
+    if shard_map.enabled:
+        print("❌ Rescore belum mendukung SATRIA_SHARD_MAP; jalankan tanpa peta shard")
+        sys.exit(1)
+    rescore(args.workers, args.partition_size, args.resume, args.dry_run)
@@ -0,0 +1,338 @@
+"""
+Retensi & Arsip Data
+Baris dingin dipindah dari database utama ke database arsip terkompresi
+({base}_archive/<tabel>.db, satu baris archive_batch = satu batch baris
+sebagai JSON ter-zlib) lalu dihapus dari database utama dalam batch kecil.
+Ukuran batch menyesuaikan diri agar tiap transaksi hapus memegang write lock
+paling lama SATRIA_RETENTION_LOCK_MS. Setelah itu ruang kosong dikembalikan
+dengan PRAGMA incremental_vacuum bertahap dan statistik planner diperbarui.
+
+Kebijakan (umur dalam hari, 0 = nonaktif, override lewat env):
+- klaim        SATRIA_RETENTION_KLAIM_DAYS (730); fraud_alert ikut klaimnya,
+               klaim yang masih punya alert Open tidak diarsip
+- audit_trail  SATRIA_RETENTION_AUDIT_TRAIL_DAYS (1825)
+- reports      SATRIA_RETENTION_REPORTS_DAYS (180)
+
+Retensi bekerja per file database. Bila SATRIA_SHARD_MAP aktif scheduler
+tidak dijalankan; jalankan CLI per file shard dengan SATRIA_DATABASE=<file>
+tanpa SATRIA_SHARD_MAP.
+
+Run with: python retention.py --run [--dry-run]
+"""
+
+import json
+import os
+import sys
+import sqlite3
+import threading
+import time
+import zlib
+import argparse
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import database
+from database import get_primary_connection, begin_immediate, shard_map
+from cdc import compact_log
+
+RETENTION_INTERVAL_SECONDS = int(os.environ.get('SATRIA_RETENTION_INTERVAL_SECONDS', 86400))
+LOCK_BUDGET_SECONDS = float(os.environ.get('SATRIA_RETENTION_LOCK_MS', 5)) / 1000
+MIN_BATCH_ROWS = 16
+MAX_BATCH_ROWS = 2000       # Di bawah batas parameter SQLite untuk DELETE ... IN (...)
+PAUSE_SECONDS = 0.01        # Jeda antar batch agar writer lain mendapat giliran
+VACUUM_STEP_PAGES = 256     # Halaman per langkah incremental_vacuum
+ANALYSIS_LIMIT = 400        # ANALYZE sampling: cepat walau tabel besar
+
+# children: (tabel anak, kolom FK) yang diarsip bersama baris induknya
+RetentionPolicy = namedtuple('RetentionPolicy', ['table', 'age_column', 'days', 'keep_if', 'children'])
+
+def _days(name, default):
+    return int(os.environ.get(f'SATRIA_RETENTION_{name}_DAYS', default))
+
+POLICIES = [
+    RetentionPolicy('klaim', 'tgl_pengajuan', _days('KLAIM', 730),
+                    "EXISTS (SELECT 1 FROM fraud_alert f WHERE f.klaim_id = klaim.klaim_id AND f.status = 'Open')",
+                    [('fraud_alert', 'klaim_id')]),
+    RetentionPolicy('audit_trail', 'timestamp', _days('AUDIT_TRAIL', 1825), None, []),
+    RetentionPolicy('reports', 'created_at', _days('REPORTS', 180), None, []),
+]
+
+# ============================================
+# DATABASE ARSIP
+# ============================================
+
+def archive_dir():
+    base, _ = os.path.splitext(database.DATABASE_NAME)
+    return f"{base}_archive"
+
+def archive_path(table):
+    return os.path.join(archive_dir(), f"{table}.db")
+
+def _open_archive(table):
+    os.makedirs(archive_dir(), exist_ok=True)
+    conn = sqlite3.connect(archive_path(table))
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive_batch (
+            batch_id INTEGER PRIMARY KEY,
+            table_name TEXT,
+            first_rowid INTEGER,
+            last_rowid INTEGER,
+            row_count INTEGER,
+            columns TEXT, -- JSON list nama kolom
+            payload BLOB, -- zlib(JSON list baris)
+            archived_at REAL,
+            UNIQUE (table_name, first_rowid)
+        )
+    ''')
+    return conn
+
+def _pack_rows(rows):
+    return zlib.compress(json.dumps(rows, separators=(',', ':'), default=_encode_value).encode('utf-8'), 6)
+
+def _encode_value(value):
+    # Kolom BLOB (mis. fraud_alert.trace) disimpan sebagai hex
+    if isinstance(value, (bytes, memoryview)):
+        return {'$hex': bytes(value).hex()}
+    raise TypeError(f"Tipe {type(value).__name__} tidak bisa diarsip")
+
+def iter_archived_rows(table, table_name=None):
+    """Baca kembali baris arsip (dict per baris) untuk audit atau restore."""
+    if not os.path.exists(archive_path(table)):
+        return
+    conn = sqlite3.connect(archive_path(table))
+    try:
+        query = "SELECT table_name, columns, payload FROM archive_batch"
+        params = ()
+        if table_name:
+            query += " WHERE table_name = ?"
+            params = (table_name,)
+        for name, columns, payload in conn.execute(query + " ORDER BY batch_id", params):
+            columns = json.loads(columns)
+            for row in json.loads(zlib.decompress(payload)):
+                yield name, {col: (bytes.fromhex(v['$hex']) if isinstance(v, dict) else v)
+                             for col, v in zip(columns, row)}
+    finally:
+        conn.close()
+
+# ============================================
+# ARSIP + HAPUS PER BATCH
+# ============================================
+
+def _cutoff(days):
+    return (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+def _candidates(conn, policy, cutoff, after, limit):
+    """Batch berikutnya (rowid, umur) dengan keyset (umur, rowid) lewat index kolom umur."""
+    query = f"SELECT rowid, {policy.age_column} FROM {policy.table} WHERE {policy.age_column} < ?"
+    params = [cutoff]
+    if after is not None:
+        query += f" AND ({policy.age_column}, rowid) > (?, ?)"
+        params += list(after)
+    if policy.keep_if:
+        query += f" AND NOT {policy.keep_if}"
+    query += f" ORDER BY {policy.age_column}, rowid LIMIT ?"
+    params.append(limit)
+    return conn.execute(query, params).fetchall()
+
+def _select_rows(conn, table, column, keys):
+    cursor = conn.execute(
+        f"SELECT rowid AS _rowid, * FROM {table} WHERE {column} IN ({', '.join('?' for _ in keys)}) ORDER BY rowid", keys)
+    columns = [d[0] for d in cursor.description]
+    return columns, [list(row) for row in cursor.fetchall()]
+
+def _archive_batch(archive, policy, conn, rowids):
+    """
+    Tulis baris induk + anak ke arsip (commit di arsip sebelum dihapus dari
+    utama). Mengembalikan (batch_id arsip, rowid terbesar yang diarsip per tabel).
+    """
+    now = time.time()
+    archived_max = {}
+    batch_ids = []
+    parts = [(policy.table, 'rowid')] + list(policy.children)
+    for table, column in parts:
+        columns, rows = _select_rows(conn, table, column, rowids)
+        archived_max[table] = max((row[0] for row in rows), default=0)
+        if not rows:
+            continue
+        cursor = archive.execute('''
+            INSERT OR REPLACE INTO archive_batch (table_name, first_rowid, last_rowid, row_count, columns, payload, archived_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (table, rows[0][0], rows[-1][0], len(rows), json.dumps(columns[1:]),
+              _pack_rows([row[1:] for row in rows]), now))
+        batch_ids.append(cursor.lastrowid)
+    archive.commit()
+    return batch_ids, archived_max
+
+def _delete_batch(conn, policy, rowids, archived_max):
+    """
+    Hapus satu batch dalam satu transaksi singkat; kembalikan lama write lock
+    (detik), atau None bila batch berubah sejak diarsip (anak baru atau kini
+    memenuhi keep_if) sehingga dilewati sampai run berikutnya.
+    """
+    marks = ', '.join('?' for _ in rowids)
+    begin_immediate(conn)
+    locked = time.perf_counter()
+    try:
+        changed = any(conn.execute(
+            f"SELECT 1 FROM {table} WHERE {column} IN ({marks}) AND rowid > ? LIMIT 1",
+            rowids + [archived_max.get(table, 0)]).fetchone() for table, column in policy.children)
+        if not changed and policy.keep_if:
+            changed = conn.execute(
+                f"SELECT 1 FROM {policy.table} WHERE rowid IN ({marks}) AND {policy.keep_if} LIMIT 1", rowids).fetchone()
+        if changed:
+            conn.rollback()
+            return None
+        # Trigger CDC mencatat hapus di transaksi ini sebagai 'archive', bukan 'delete'
+        conn.execute("INSERT INTO cdc_archive_mark (active) VALUES (1)")
+        for table, column in policy.children:
+            conn.execute(f"DELETE FROM {table} WHERE {column} IN ({marks})", rowids)
+        conn.execute(f"DELETE FROM {policy.table} WHERE rowid IN ({marks})", rowids)
+        conn.execute("DELETE FROM cdc_archive_mark")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return time.perf_counter() - locked
+
+def apply_policy(conn, policy, dry_run=False, batch_rows=256):
+    stats = {'table': policy.table, 'days': policy.days, 'archived': 0, 'batches': 0, 'max_lock_ms': 0.0}
+    if policy.days <= 0:
+        stats['skipped'] = True
+        return stats
+    cutoff = _cutoff(policy.days)
+    if dry_run:
+        query = f"SELECT COUNT(*) FROM {policy.table} WHERE {policy.age_column} < ?"
+        if policy.keep_if:
+            query += f" AND NOT {policy.keep_if}"
+        stats['archived'] = conn.execute(query, (cutoff,)).fetchone()[0]
+        return stats
+
+    archive = _open_archive(policy.table)
+    after = None
+    try:
+        while True:
+            batch = _candidates(conn, policy, cutoff, after, batch_rows)
+            if not batch:
+                break
+            after = (batch[-1][1], batch[-1][0])
+            rowids = [row[0] for row in batch]
+            batch_ids, archived_max = _archive_batch(archive, policy, conn, rowids)
+            held = _delete_batch(conn, policy, rowids, archived_max)
+            if held is None:
+                # Baris tetap di database utama; salinan arsipnya dibuang
+                archive.execute(f"DELETE FROM archive_batch WHERE batch_id IN ({', '.join('?' for _ in batch_ids)})", batch_ids)
+                archive.commit()
+                stats['skipped_batches'] = stats.get('skipped_batches', 0) + 1
+                continue
+
+            stats['archived'] += len(rowids)
+            stats['batches'] += 1
+            stats['max_lock_ms'] = max(stats['max_lock_ms'], round(held * 1000, 2))
+            # AIMD sederhana: batch mengecil bila lock melewati budget
+            if held > LOCK_BUDGET_SECONDS:
+                batch_rows = max(MIN_BATCH_ROWS, batch_rows // 2)
+            elif held < LOCK_BUDGET_SECONDS / 2:
+                batch_rows = min(MAX_BATCH_ROWS, batch_rows * 2)
+            time.sleep(PAUSE_SECONDS)
+    finally:
+        archive.close()
+    return stats
+
+# ============================================
+# KOMPAKSI
+# ============================================
+
+def _file_bytes(path):
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+def compact(conn):
+    """
+    Kembalikan halaman kosong ke OS lewat incremental_vacuum bertahap (tiap
+    langkah transaksi tulis singkat), checkpoint WAL, lalu ANALYZE bersampel.
+    Database lama tanpa auto_vacuum=INCREMENTAL hanya melaporkan freelist;
+    aktifkan sekali di jendela maintenance dengan --enable-incremental-vacuum.
+    """
+    result = {'auto_vacuum': 'incremental', 'vacuumed_pages': 0}
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        while conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            conn.execute(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})").fetchall()
+            conn.commit()
+            freed = before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if freed <= 0:
+                break
+            result['vacuumed_pages'] += freed
+            time.sleep(PAUSE_SECONDS)
+        # PASSIVE: tidak menunggu pembaca, jadi tidak menahan writer lain
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+    else:
+        result['auto_vacuum'] = 'none'
+    result['freelist_pages'] = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    conn.execute("ANALYZE")
+    conn.commit()
+    return result
+
+def enable_incremental_vacuum(conn):
+    """Sekali saja, di luar jam sibuk: VACUUM penuh memblokir writer selama berjalan."""
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+
+def run_retention(conn, dry_run=False):
+    started = time.perf_counter()
+    size_before = _file_bytes(database.DATABASE_NAME)
+    tables = [apply_policy(conn, policy, dry_run) for policy in POLICIES]
+    report = {'dry_run': dry_run, 'tables': tables}
+    if not dry_run:
+        # Delete hasil arsip ikut masuk change_log; kompaksi dulu agar vacuum mengembalikan ruangnya
+        report['cdc'] = compact_log(conn)
+        report['compaction'] = compact(conn)
+        size_after = _file_bytes(database.DATABASE_NAME)
+        report['database_bytes'] = {'before': size_before, 'after': size_after,
+                                    'reclaimed': size_before - size_after}
+        report['archive_bytes'] = {p.table: _file_bytes(archive_path(p.table))
+                                   for p in POLICIES if os.path.exists(archive_path(p.table))}
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+def _retention_loop(interval, stop_event):
+    while not stop_event.wait(interval):
+        conn = get_primary_connection()
+        try:
+            report = run_retention(conn)
+            print(f"🗄️  Retensi: {sum(t['archived'] for t in report['tables'])} baris diarsip, "
+                  f"{report['database_bytes']['reclaimed']} byte dikembalikan")
+        except Exception as e:
+            # Apa pun yang gagal, thread tetap hidup dan mencoba lagi di interval berikutnya
+            print(f"⚠️ Job retensi gagal: {e}")
+        finally:
+            conn.close()
+
+def start_retention_scheduler(interval=RETENTION_INTERVAL_SECONDS):
+    """Jalankan retensi berkala di daemon thread. interval <= 0 menonaktifkan."""
+    stop_event = threading.Event()
+    if interval > 0 and shard_map.enabled:
+        print("⚠️ Retensi berkala tidak dijalankan: jalankan retention.py per file shard")
+    elif interval > 0:
+        thread = threading.Thread(target=_retention_loop, args=(interval, stop_event),
+                                  name='retention', daemon=True)
+        thread.start()
+    return stop_event
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retensi & arsip data SATRIA JKN")
+    parser.add_argument('--run', action='store_true', help='Arsipkan baris lama lalu kompaksi database')
+    parser.add_argument('--dry-run', action='store_true', help='Hanya hitung baris yang akan diarsip')
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='Ubah database lama ke auto_vacuum=INCREMENTAL (VACUUM penuh, sekali saja)')
+    args = parser.parse_args()
+    if shard_map.enabled:
+        print("❌ Retensi bekerja per file: jalankan dengan SATRIA_DATABASE=<file shard> tanpa SATRIA_SHARD_MAP")
+        sys.exit(1)
+    conn = get_primary_connection()
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum(conn)
+        print("✅ auto_vacuum=INCREMENTAL aktif")
+    if args.run or args.dry_run:
+        print(json.dumps(run_retention(conn, dry_run=args.dry_run), indent=2))
+    conn.close()
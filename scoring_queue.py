@@ -0,0 +1,240 @@
+"""
+Antrian Scoring Klaim (SQLite-backed)
+POST /api/klaim dalam mode async hanya melakukan enqueue; worker process
+mengambil batch dari tabel klaim_queue, menjalankan FraudDetectionEngine,
+dan menulis klaim/alert. Run worker pool with: python scoring_queue.py
+"""
+
+import json
+import os
+import signal
+import sqlite3
+import time
+import argparse
+import multiprocessing
+
+from database import get_db_connection, begin_immediate
+from fraud_engine import FraudDetectionEngine
+from feature_store import lookup as lookup_features
+from claims import save_scored_claim, ShardWriter
+
+MAX_ATTEMPTS = 5            # Setelah ini job dipindah ke dead-letter
+LEASE_SECONDS = 60          # Job 'Processing' yang melewati lease diambil ulang
+RETRY_BACKOFF_SECONDS = 2   # Backoff eksponensial: 2, 4, 8, ... detik
+METRICS_WINDOW_SECONDS = 60
+
+# ============================================
+# PRODUCER (dipanggil dari request handler)
+# ============================================
+
+def enqueue_claim(cursor, data):
+    """Masukkan klaim ke antrian. Pemanggil melakukan commit."""
+    now = time.time()
+    cursor.execute('''
+        INSERT INTO klaim_queue (nomor_klaim, payload, status, attempts, enqueued_at, available_at)
+        VALUES (?, ?, 'Queued', 0, ?, ?)
+    ''', (data.get('nomor_klaim'), json.dumps(data), now, now))
+    return cursor.lastrowid
+
+def get_job_status(cursor, queue_id):
+    cursor.execute('''
+        SELECT queue_id, nomor_klaim, status, attempts, enqueued_at, finished_at, klaim_id, result, last_error
+        FROM klaim_queue WHERE queue_id = ?
+    ''', (queue_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    job = dict(row)
+    result = job.pop('result')
+    job['analysis'] = json.loads(result) if result else None
+    return job
+
+def queue_metrics(cursor):
+    """Kedalaman antrian, lag, dan throughput untuk monitoring."""
+    now = time.time()
+    counts = {row[0]: row[1] for row in cursor.execute(
+        "SELECT status, COUNT(*) FROM klaim_queue GROUP BY status").fetchall()}
+    oldest = cursor.execute(
+        "SELECT MIN(enqueued_at) FROM klaim_queue WHERE status IN ('Queued', 'Processing')").fetchone()[0]
+    recent = cursor.execute('''
+        SELECT COUNT(*), AVG(finished_at - enqueued_at)
+        FROM klaim_queue WHERE status = 'Done' AND finished_at >= ?
+    ''', (now - METRICS_WINDOW_SECONDS,)).fetchone()
+    return {
+        "depth": counts.get('Queued', 0) + counts.get('Processing', 0),
+        "by_status": counts,
+        "oldest_pending_age_seconds": round(now - oldest, 3) if oldest else 0,
+        "processed_last_minute": recent[0],
+        "throughput_per_second": round(recent[0] / METRICS_WINDOW_SECONDS, 3),
+        "avg_lag_seconds": round(recent[1], 3) if recent[1] is not None else None,
+        "dead_letter": counts.get('Dead', 0)
+    }
+
+# ============================================
+# CONSUMER (worker process)
+# ============================================
+
+def claim_batch(conn, worker_id, batch_size):
+    """
+    Ambil hingga batch_size job secara atomik (BEGIN IMMEDIATE) dan
+    pasang lease. Job dengan lease kedaluwarsa (worker mati) ikut diambil,
+    kecuali yang sudah MAX_ATTEMPTS kali: job yang terus membuat worker
+    crash atau kehilangan lease dipindah ke dead-letter, bukan diulang terus.
+    """
+    now = time.time()
+    cursor = conn.cursor()
+    begin_immediate(cursor)
+    cursor.execute('''
+        UPDATE klaim_queue
+        SET status = 'Dead', finished_at = ?, last_error = 'lease kedaluwarsa ' || attempts || ' kali'
+        WHERE status = 'Processing' AND leased_until < ? AND attempts >= ?
+    ''', (now, now, MAX_ATTEMPTS))
+    cursor.execute('''
+        SELECT queue_id, payload, attempts FROM klaim_queue
+        WHERE (status = 'Queued' AND available_at <= ?)
+           OR (status = 'Processing' AND leased_until < ?)
+        ORDER BY queue_id
+        LIMIT ?
+    ''', (now, now, batch_size))
+    jobs = cursor.fetchall()
+    if jobs:
+        cursor.executemany('''
+            UPDATE klaim_queue
+            SET status = 'Processing', attempts = attempts + 1, leased_until = ?, worker = ?
+            WHERE queue_id = ?
+        ''', [(now + LEASE_SECONDS, worker_id, job['queue_id']) for job in jobs])
+    conn.commit()
+    return [(job['queue_id'], json.loads(job['payload']), job['attempts'] + 1) for job in jobs]
+
+def process_batch(conn, jobs):
+    """
+    Skor dan simpan batch per shard tujuan, masing-masing dalam satu
+    transaksi. Tiap job dibungkus SAVEPOINT agar satu klaim gagal tidak
+    membatalkan klaim lain.
+    """
+    writer = ShardWriter(conn)
+    done = 0
+    try:
+        for shard, indices in writer.route([data for _, data, _ in jobs]):
+            done += _process_shard(conn, writer, shard, [jobs[i] for i in indices])
+    finally:
+        writer.close()
+    return done
+
+def _process_shard(conn, writer, shard, jobs):
+    shard_conn = writer.open(shard, [data for _, data, _ in jobs])
+    cursor = shard_conn.cursor()
+    begin_immediate(cursor)
+    # Riwayat seluruh batch dibaca sekali, sebelum klaim batch ini ditulis
+    features = lookup_features(cursor, [data for _, data, _ in jobs])
+    finished, failed = [], []
+    for (queue_id, data, attempts), history in zip(jobs, features):
+        cursor.execute("SAVEPOINT job")
+        try:
+            analysis = FraudDetectionEngine.analyze_claim(data, history)
+            klaim_id = save_scored_claim(cursor, data, analysis, id_base=shard.id_base)
+            cursor.execute("RELEASE SAVEPOINT job")
+            finished.append((time.time(), klaim_id, json.dumps(analysis), queue_id))
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT job")
+            cursor.execute("RELEASE SAVEPOINT job")
+            failed.append((queue_id, attempts, e))
+
+    if shard_conn is not conn:
+        # Klaim di file shard di-commit lebih dulu, status job menyusul di
+        # katalog: at-least-once. Crash di antaranya membuat job diambil ulang
+        # setelah lease habis dan gagal permanen sebagai nomor_klaim duplikat.
+        shard_conn.commit()
+        cursor = conn.cursor()
+        begin_immediate(cursor)
+    cursor.executemany('''
+        UPDATE klaim_queue
+        SET status = 'Done', finished_at = ?, klaim_id = ?, result = ?, last_error = NULL
+        WHERE queue_id = ?
+    ''', finished)
+    for queue_id, attempts, error in failed:
+        _fail_job(cursor, queue_id, attempts, error)
+    conn.commit()
+    return len(finished)
+
+def _fail_job(cursor, queue_id, attempts, error):
+    # Pelanggaran constraint (mis. nomor_klaim duplikat) tidak akan sembuh dengan retry
+    permanent = isinstance(error, (sqlite3.IntegrityError, ValueError, TypeError))
+    if permanent or attempts >= MAX_ATTEMPTS:
+        cursor.execute('''
+            UPDATE klaim_queue SET status = 'Dead', finished_at = ?, last_error = ? WHERE queue_id = ?
+        ''', (time.time(), str(error), queue_id))
+    else:
+        cursor.execute('''
+            UPDATE klaim_queue SET status = 'Queued', available_at = ?, last_error = ? WHERE queue_id = ?
+        ''', (time.time() + RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1), str(error), queue_id))
+
+def requeue_dead(cursor, queue_ids=None):
+    """Kembalikan job dead-letter ke antrian (setelah data diperbaiki)."""
+    query = "UPDATE klaim_queue SET status = 'Queued', attempts = 0, available_at = ? WHERE status = 'Dead'"
+    params = [time.time()]
+    if queue_ids:
+        query += f" AND queue_id IN ({', '.join('?' for _ in queue_ids)})"
+        params.extend(queue_ids)
+    cursor.execute(query, params)
+    return cursor.rowcount
+
+def worker_loop(worker_id, batch_size=50, poll_interval=0.5, stop_event=None):
+    # Ctrl+C ditangani proses induk lewat stop_event agar batch selesai dengan rapi
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    conn = get_db_connection()
+    conn.execute("PRAGMA busy_timeout = 10000")
+    print(f"👷 Worker {worker_id} siap (pid {os.getpid()})")
+    while not (stop_event and stop_event.is_set()):
+        try:
+            jobs = claim_batch(conn, worker_id, batch_size)
+        except sqlite3.OperationalError:
+            # Database sedang terkunci oleh writer lain; coba lagi nanti
+            conn.rollback()
+            time.sleep(poll_interval)
+            continue
+        if not jobs:
+            time.sleep(poll_interval)
+            continue
+        try:
+            process_batch(conn, jobs)
+        except sqlite3.OperationalError:
+            # Batch batal seluruhnya; lease habis lalu job diambil ulang
+            conn.rollback()
+            time.sleep(poll_interval)
+    conn.close()
+
+def run_workers(num_workers, batch_size, poll_interval):
+    stop_event = multiprocessing.Event()
+    workers = [
+        multiprocessing.Process(target=worker_loop, args=(f"worker-{i}", batch_size, poll_interval, stop_event))
+        for i in range(num_workers)
+    ]
+    for w in workers:
+        w.start()
+
+    def shutdown(signum, frame):
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for w in workers:
+        w.join()
+    print("🛑 Semua worker scoring berhenti.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SATRIA JKN scoring worker pool")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument('--batch', type=int, default=50)
+    parser.add_argument('--poll', type=float, default=0.5)
+    parser.add_argument('--requeue-dead', action='store_true', help='Kembalikan semua job dead-letter ke antrian lalu keluar')
+    args = parser.parse_args()
+
+    if args.requeue_dead:
+        conn = get_db_connection()
+        count = requeue_dead(conn.cursor())
+        conn.commit()
+        conn.close()
+        print(f"♻️  {count} job dead-letter dikembalikan ke antrian.")
+    else:
+        run_workers(args.workers, args.batch, args.poll)
@@ -0,0 +1,141 @@
+"""
+Serialisasi JSON Cepat untuk Response API
+- FastJSONProvider: JSON provider Flask dengan jalur cepat orjson dan
+  fallback ke encoder stdlib bila orjson tidak terpasang.
+- RowSet: hasil query berupa tuple mentah sqlite3 + nama kolom, tanpa
+  sqlite3.Row/dict per baris sampai tahap encoding.
+- json_array_response: untuk listing besar, SQLite sendiri yang merangkai
+  array JSON (json_group_array) sehingga Python hanya meneruskan bytes.
+"""
+
+import sqlite3
+import threading
+
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+# Cek ketersediaan orjson (Opsional, fallback ke json stdlib)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+class RowSet:
+    """Baris query sebagai tuple + daftar kolom; di-encode sebagai array of object."""
+
+    __slots__ = ('columns', 'rows')
+
+    def __init__(self, columns, rows):
+        self.columns = columns
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def as_dicts(self):
+        return [dict(zip(self.columns, row)) for row in self.rows]
+
+def fetch_rowset(conn, sql, params=()):
+    """Jalankan query dengan row_factory tuple bawaan sqlite3 (dibuat di C)."""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(sql, params)
+    return RowSet([d[0] for d in cursor.description], cursor.fetchall())
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider Flask: orjson bila tersedia, stdlib bila tidak."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, RowSet):
+            return o.as_dicts()
+        return DefaultJSONProvider.default(o)
+
+    def dumps_bytes(self, obj):
+        if not ORJSON_AVAILABLE:
+            return self.dumps(obj).encode('utf-8')
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        # Argumen tambahan (indent, cls, ...) hanya dipahami encoder stdlib
+        if ORJSON_AVAILABLE and not kwargs:
+            return self.dumps_bytes(obj).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if ORJSON_AVAILABLE and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if not ORJSON_AVAILABLE:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
+
+# ============================================
+# SQLITE-SIDE JSON (json_group_array)
+# ============================================
+
+_json1_supported = None
+_column_cache = {}
+_column_lock = threading.Lock()
+
+def sqlite_json_supported(conn):
+    global _json1_supported
+    if _json1_supported is None:
+        try:
+            conn.execute("SELECT json_group_array(json_object('a', 1))").fetchone()
+            _json1_supported = True
+        except sqlite3.OperationalError:
+            _json1_supported = False
+    return _json1_supported
+
+# ORDER BY di dalam fungsi agregat (json_group_array(... ORDER BY ...)) baru ada sejak SQLite 3.44
+SQLITE_AGGREGATE_ORDER_BY = sqlite3.sqlite_version_info >= (3, 44, 0)
+
+def _columns_for(conn, sql, params=()):
+    columns = _column_cache.get(sql)
+    if columns is None:
+        cursor = conn.cursor()
+        # Parameter tetap di-bind: query dengan filter (?) gagal tanpa parameternya
+        cursor.execute(f"SELECT * FROM ({sql}) LIMIT 0", params)
+        columns = [d[0] for d in cursor.description]
+        with _column_lock:
+            _column_cache[sql] = columns
+    return columns
+
+def query_json_array(conn, sql, params=(), order_by=None):
+    """
+    Kembalikan hasil query sebagai bytes array JSON yang dirangkai SQLite.
+    ORDER BY pada subquery tidak dijamin bertahan melewati agregat, jadi
+    urutan diberikan lewat order_by (nama kolom hasil query, mis.
+    "date DESC"). Di SQLite >= 3.44 urutan dipasang di dalam
+    json_group_array; di versi lebih lama tiap baris dirangkai SQLite
+    dengan ORDER BY di query luar lalu digabung di Python. Fallback ke
+    RowSet + encoder Python bila SQLite tidak memiliki fungsi JSON1.
+    """
+    if not sqlite_json_supported(conn):
+        return current_app.json.dumps_bytes(fetch_rowset(conn, sql, params))
+    columns = _columns_for(conn, sql, params)
+    pairs = ', '.join(f"'{col}', \"{col}\"" for col in columns)
+    row_json = f"json_object({pairs})"
+    if order_by is None or SQLITE_AGGREGATE_ORDER_BY:
+        ordering = f" ORDER BY {order_by}" if order_by else ""
+        row = conn.execute(f"SELECT json_group_array({row_json}{ordering}) FROM ({sql})", params).fetchone()
+        return row[0].encode('utf-8')
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(f"SELECT {row_json} FROM ({sql}) ORDER BY {order_by}", params)
+    return b"[" + ",".join(item for (item,) in cursor.fetchall()).encode('utf-8') + b"]"
+
+def json_bytes_response(payload, status=200):
+    """Response dari bytes JSON yang sudah jadi (tanpa encode ulang)."""
+    return current_app.response_class(payload, status=status, mimetype='application/json')
+
+def json_array_response(conn, sql, params=(), order_by=None):
+    return json_bytes_response(query_json_array(conn, sql, params, order_by))
@@ -101,7 +101,12 @@ def test_api():
     high_alerts = _safe_json(response)
     print_response("HIGH RISK ALERTS", response)
     print(f"   Found {len(high_alerts) if isinstance(high_alerts, list) else 'N/A'} high risk alerts\n")
-    
+    # Regresi: filter ber-parameter pernah membuat listing JSON SQLite gagal (500)
+    assert response.status_code == 200, f"filter risk_level gagal: {response.status_code}"
+    assert all(a["risk_level"] == "High" for a in high_alerts), "alert non-High ikut terfilter"
+    dates = [a["date"] or "" for a in high_alerts]
+    assert dates == sorted(dates, reverse=True), "alert High tidak urut terbaru dulu"
+
     # Test 8: Get Alerts Summary
     print("8️⃣ Testing alerts summary...")
     response = session.get(f"{BASE_URL}/api/alerts/summary")
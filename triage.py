@@ -0,0 +1,223 @@
+"""
+Antrian Triage Alert
+Alert 'Open' diurutkan berdasarkan prioritas (level, ai_confidence, nominal
+klaim, umur) lewat index idx_fraud_alert_triage(status, triage_key). Analis
+mengambil (claim) batch alert teratas dengan lease agar dua analis tidak
+mengerjakan alert yang sama, lalu menyelesaikannya sekaligus lewat bulk
+action: satu transaksi untuk ribuan alert beserta audit trail-nya.
+
+Dengan sharding regional, *_sharded menggabungkan antrian semua file shard
+(urut prioritas) dan mengarahkan bulk action ke shard pemilik tiap alert_id.
+"""
+
+import heapq
+import time
+import uuid
+from itertools import islice
+
+from database import TRIAGE_AGE_WEIGHT, begin_immediate, shard_map, get_shard_connection
+
+LEASE_SECONDS = 15 * 60
+MAX_CLAIM = 200
+MAX_BULK = 10000
+
+BULK_ACTIONS = {
+    # action -> (status baru, is_resolved, aksi audit)
+    'resolve': ('Resolved', 1, 'RESOLVED'),
+    'flag': ('Flagged', 0, 'FLAGGED'),
+    'release': (None, None, None),
+}
+
+_PRIORITY_SQL = f"f.triage_key + {TRIAGE_AGE_WEIGHT} * julianday('now', 'localtime')"
+_QUEUE_COLUMNS = f'''
+    f.alert_id, f.klaim_id, k.nomor_klaim, f.alert_level, f.reason_code, f.ai_confidence,
+    k.total_biaya, f.created_at, ROUND(julianday('now', 'localtime') - julianday(f.created_at), 2) AS age_days,
+    ROUND({_PRIORITY_SQL}, 4) AS priority, f.assigned_to, f.lease_until
+'''
+
+def _rows(cursor):
+    columns = [d[0] for d in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def peek_queue(conn, limit=50, offset=0):
+    """Urutan triage saat ini tanpa mengambil lease."""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(f'''
+        SELECT {_QUEUE_COLUMNS}
+        FROM fraud_alert f LEFT JOIN klaim k ON k.klaim_id = f.klaim_id
+        WHERE f.status = 'Open'
+        ORDER BY f.triage_key DESC
+        LIMIT ? OFFSET ?
+    ''', (limit, offset))
+    items = _rows(cursor)
+    total = conn.execute("SELECT COUNT(*) FROM fraud_alert WHERE status = 'Open'").fetchone()[0]
+    return {'items': items, 'total': total}
+
+_CLAIMABLE = "status = 'Open' AND (lease_until IS NULL OR lease_until < ? OR assigned_to = ?)"
+
+def claim_alerts(conn, analyst, limit=20, lease_seconds=LEASE_SECONDS, alert_ids=None):
+    """
+    Ambil `limit` alert Open berprioritas tertinggi yang tidak sedang di-lease
+    analis lain (opsional hanya di antara alert_ids). BEGIN IMMEDIATE
+    memastikan dua analis tidak mendapat alert sama.
+    """
+    now = time.time()
+    only = f" AND alert_id IN ({', '.join('?' for _ in alert_ids)})" if alert_ids else ""
+    begin_immediate(conn)
+    try:
+        claimed = [row[0] for row in conn.execute(f'''
+            UPDATE fraud_alert SET assigned_to = ?, lease_until = ?
+            WHERE alert_id IN (
+                SELECT alert_id FROM fraud_alert
+                WHERE {_CLAIMABLE}{only}
+                ORDER BY triage_key DESC
+                LIMIT ?
+            )
+            RETURNING alert_id
+        ''', [analyst, now + lease_seconds, now, analyst, *(alert_ids or ()), limit]).fetchall()]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if not claimed:
+        return []
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(f'''
+        SELECT {_QUEUE_COLUMNS}
+        FROM fraud_alert f LEFT JOIN klaim k ON k.klaim_id = f.klaim_id
+        WHERE f.alert_id IN ({', '.join('?' for _ in claimed)})
+        ORDER BY f.triage_key DESC
+    ''', claimed)
+    return _rows(cursor)
+
+def bulk_update(conn, alert_ids, action, analyst, note=None):
+    """
+    Terapkan resolve/flag/release ke banyak alert dalam satu transaksi.
+    Alert yang sedang di-lease analis lain dilewati dan dilaporkan sebagai konflik.
+    """
+    if action not in BULK_ACTIONS:
+        raise ValueError(f"action harus salah satu dari: {', '.join(BULK_ACTIONS)}")
+    ids = sorted({int(alert_id) for alert_id in alert_ids})
+    if len(ids) > MAX_BULK:
+        raise ValueError(f"Maksimal {MAX_BULK} alert per request")
+    new_status, is_resolved, audit_action = BULK_ACTIONS[action]
+    now = time.time()
+
+    cursor = conn.cursor()
+    begin_immediate(cursor)
+    try:
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_alert_ids (alert_id INTEGER PRIMARY KEY)")
+        cursor.execute("DELETE FROM bulk_alert_ids")
+        cursor.executemany("INSERT INTO bulk_alert_ids (alert_id) VALUES (?)", [(i,) for i in ids])
+
+        lease_free = "(lease_until IS NULL OR lease_until < ? OR assigned_to = ?)"
+        if new_status is None:
+            cursor.execute(f'''
+                UPDATE fraud_alert SET assigned_to = NULL, lease_until = NULL
+                WHERE alert_id IN (SELECT alert_id FROM bulk_alert_ids) AND {lease_free}
+                RETURNING alert_id
+            ''', (now, analyst))
+        else:
+            cursor.execute(f'''
+                UPDATE fraud_alert SET status = ?, is_resolved = ?, assigned_to = NULL, lease_until = NULL
+                WHERE alert_id IN (SELECT alert_id FROM bulk_alert_ids) AND {lease_free}
+                RETURNING alert_id
+            ''', (new_status, is_resolved, now, analyst))
+        updated = sorted(row[0] for row in cursor.fetchall())
+
+        if audit_action and updated:
+            cursor.executemany('''
+                INSERT INTO audit_trail (audit_id, entity, entity_id, action, user, details)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(str(uuid.uuid4()), 'Alert', str(alert_id), audit_action, analyst, note or f"Bulk {action}")
+                  for alert_id in updated])
+
+        # Id yang ada tapi tidak ter-update = sedang di-lease analis lain
+        existing = {row[0] for row in cursor.execute(
+            "SELECT alert_id FROM fraud_alert WHERE alert_id IN (SELECT alert_id FROM bulk_alert_ids)")}
+        cursor.execute("DELETE FROM bulk_alert_ids")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    missing = set(ids) - set(updated)
+    return {
+        'action': action,
+        'updated': len(updated),
+        'conflicts': sorted(missing & existing),
+        'not_found': sorted(missing - existing),
+    }
+
+# ============================================
+# SHARDING (antrian gabungan lintas file shard)
+# ============================================
+
+def _on_shard(shard, fn, *args):
+    conn = get_shard_connection(shard)
+    try:
+        return fn(conn, *args)
+    finally:
+        conn.close()
+
+def _each_shard(fn, *args):
+    return [(shard, _on_shard(shard, fn, *args)) for shard in shard_map.shards]
+
+def _by_priority(lists):
+    # Tiap list sudah urut prioritas menurun
+    return heapq.merge(*lists, key=lambda item: -item['priority'])
+
+def peek_sharded(limit=50, offset=0):
+    """peek_queue gabungan: offset + limit teratas tiap shard, digabung urut prioritas."""
+    results = _each_shard(peek_queue, offset + limit, 0)
+    return {'items': list(islice(_by_priority(r['items'] for _, r in results), offset, offset + limit)),
+            'total': sum(r['total'] for _, r in results)}
+
+def claim_sharded(analyst, limit=20, lease_seconds=LEASE_SECONDS):
+    """
+    claim_alerts gabungan: kandidat teratas tiap shard dipilih `limit` terbaik
+    secara global, lalu di-lease di shard masing-masing. Alert yang keburu
+    diambil analis lain di antaranya terlewat, jadi hasil bisa < limit.
+    """
+    def candidates(conn):
+        now = time.time()
+        return [{'alert_id': row[0], 'priority': row[1]} for row in conn.execute(f'''
+            SELECT alert_id, triage_key + {TRIAGE_AGE_WEIGHT} * julianday('now', 'localtime') FROM fraud_alert
+            WHERE {_CLAIMABLE}
+            ORDER BY triage_key DESC
+            LIMIT ?
+        ''', (now, analyst, limit))]
+
+    per_shard = dict(_each_shard(candidates))
+    chosen = {item['alert_id'] for item in islice(_by_priority(per_shard.values()), limit)}
+    claimed = []
+    for shard, rows in per_shard.items():
+        ids = [row['alert_id'] for row in rows if row['alert_id'] in chosen]
+        if ids:
+            claimed.extend(_on_shard(shard, claim_alerts, analyst, len(ids), lease_seconds, ids))
+    return sorted(claimed, key=lambda item: -item['priority'])
+
+def bulk_update_sharded(alert_ids, action, analyst, note=None):
+    """
+    bulk_update per shard pemilik alert_id (dari rentang id_base). Tiap shard
+    satu transaksi; bila satu shard gagal, shard yang sudah selesai tetap tersimpan.
+    """
+    if action not in BULK_ACTIONS:
+        raise ValueError(f"action harus salah satu dari: {', '.join(BULK_ACTIONS)}")
+    ids = sorted({int(alert_id) for alert_id in alert_ids})
+    if len(ids) > MAX_BULK:
+        raise ValueError(f"Maksimal {MAX_BULK} alert per request")
+    groups = {}
+    for alert_id in ids:
+        groups.setdefault(shard_map.for_id(alert_id), []).append(alert_id)
+    result = {'action': action, 'updated': 0, 'conflicts': [], 'not_found': []}
+    for shard, shard_ids in groups.items():
+        part = _on_shard(shard, bulk_update, shard_ids, action, analyst, note)
+        result['updated'] += part['updated']
+        result['conflicts'].extend(part['conflicts'])
+        result['not_found'].extend(part['not_found'])
+    result['conflicts'].sort()
+    result['not_found'].sort()
+    return result